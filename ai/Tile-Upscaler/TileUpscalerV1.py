@@ -12,6 +12,7 @@ import cv2
 import numpy as np
 
 from RealESRGAN import RealESRGAN
+from prompt_cache import PromptEmbeddingCache
 
 import gradio as gr
 from gradio_imageslider import ImageSlider
@@ -31,9 +32,10 @@ def timer_func(func):
         return result
     return wrapper
 
-class LazyLoadPipeline:
+class LazyLoadPipeline(PromptEmbeddingCache):
     def __init__(self):
         self.pipe = None
+        super().__init__()
 
     @timer_func
     def load(self):
@@ -143,9 +145,13 @@ def gradio_process_image(input_image, resolution, num_inference_steps, strength,
     prompt = "masterpiece, best quality, highres"
     negative_prompt = "low quality, normal quality, ugly, blurry, blur, lowres, bad anatomy, bad hands, cropped, worst quality, verybadimagenegative_v1.3, JuggernautNegative-neg"
     
+    prompt_embeds, negative_prompt_embeds = lazy_pipe.encode_prompt(
+        prompt, negative_prompt, do_classifier_free_guidance=guidance_scale > 1.0
+    )
+    
     options = {
-        "prompt": prompt,
-        "negative_prompt": negative_prompt,
+        "prompt_embeds": prompt_embeds,
+        "negative_prompt_embeds": negative_prompt_embeds,
         "image": condition_image,
         "control_image": condition_image,
         "width": condition_image.size[0],
@@ -11,6 +11,8 @@ import cv2
 import numpy as np
 
 from RealESRGAN import RealESRGAN
+from prompt_cache import PromptEmbeddingCache
+from tile_blender import StreamingTileBlender
 
 import random
 import math
@@ -20,6 +22,7 @@ from gradio_imageslider import ImageSlider
 
 USE_TORCH_COMPILE = False
 ENABLE_CPU_OFFLOAD = os.getenv("ENABLE_CPU_OFFLOAD", "0") == "1"
+TILE_BATCH_SIZE = int(os.getenv("TILE_BATCH_SIZE", "4"))
 
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
@@ -42,9 +45,10 @@ def get_scheduler(scheduler_name, config):
     else:
         raise ValueError(f"Unknown scheduler: {scheduler_name}")
 
-class LazyLoadPipeline:
+class LazyLoadPipeline(PromptEmbeddingCache):
     def __init__(self):
         self.pipe = None
+        super().__init__()
 
     @timer_func
     def load(self):
@@ -176,13 +180,6 @@ def prepare_image(input_image, resolution, hdr):
     upscaled_image = progressive_upscale(input_image, resolution)
     return create_hdr_effect(upscaled_image, hdr)
 
-def create_gaussian_weight(tile_size, sigma=0.3):
-    x = np.linspace(-1, 1, tile_size)
-    y = np.linspace(-1, 1, tile_size)
-    xx, yy = np.meshgrid(x, y)
-    gaussian_weight = np.exp(-(xx**2 + yy**2) / (2 * sigma**2))
-    return gaussian_weight
-
 def adaptive_tile_size(image_size, base_tile_size=512, max_tile_size=1024):
     w, h = image_size
     aspect_ratio = w / h
@@ -194,27 +191,64 @@ def adaptive_tile_size(image_size, base_tile_size=512, max_tile_size=1024):
         tile_w = min(int(tile_h * aspect_ratio), max_tile_size)
     return max(tile_w, base_tile_size), max(tile_h, base_tile_size)
 
-def process_tile(tile, num_inference_steps, strength, guidance_scale, controlnet_strength):
-    prompt = "masterpiece, best quality, highres"
-    negative_prompt = "low quality, normal quality, ugly, blurry, blur, lowres, bad anatomy, bad hands, cropped, worst quality, verybadimagenegative_v1.3, JuggernautNegative-neg"
-    
+PROMPT = "masterpiece, best quality, highres"
+NEGATIVE_PROMPT = "low quality, normal quality, ugly, blurry, blur, lowres, bad anatomy, bad hands, cropped, worst quality, verybadimagenegative_v1.3, JuggernautNegative-neg"
+
+def encode_prompts(guidance_scale):
+    """Encode the fixed prompts once (shared by every tile batch)"""
+    return lazy_pipe.encode_prompt(PROMPT, NEGATIVE_PROMPT, do_classifier_free_guidance=guidance_scale > 1.0)
+
+def process_tile_batch(tiles, seeds, num_inference_steps, strength, guidance_scale, controlnet_strength,
+                       prompt_embeds, negative_prompt_embeds):
+    """Run same-sized tiles through one pipeline call, each with its own seed"""
+    batch_size = len(tiles)
     options = {
-        "prompt": prompt,
-        "negative_prompt": negative_prompt,
-        "image": tile,
-        "control_image": tile,
+        "prompt_embeds": prompt_embeds.repeat(batch_size, 1, 1),
+        "negative_prompt_embeds": None if negative_prompt_embeds is None else negative_prompt_embeds.repeat(batch_size, 1, 1),
+        "image": tiles,
+        "control_image": tiles,
         "num_inference_steps": num_inference_steps,
         "strength": strength,
         "guidance_scale": guidance_scale,
         "controlnet_conditioning_scale": float(controlnet_strength),
-        "generator": torch.Generator(device=device).manual_seed(random.randint(0, 2147483647)),
+        "generator": [torch.Generator(device=device).manual_seed(seed) for seed in seeds],
     }
     
-    return np.array(lazy_pipe(**options).images[0])
+    return [np.array(image) for image in lazy_pipe(**options).images]
+
+def process_tile(tile, num_inference_steps, strength, guidance_scale, controlnet_strength, seed=None):
+    if seed is None:
+        seed = random.randint(0, 2147483647)
+    prompt_embeds, negative_prompt_embeds = encode_prompts(guidance_scale)
+    return process_tile_batch([tile], [seed], num_inference_steps, strength, guidance_scale, controlnet_strength,
+                              prompt_embeds, negative_prompt_embeds)[0]
+
+def iter_tile_batches(boxes, seeds, batch_size, run_batch):
+    """
+    Process tiles batch_size at a time, yielding (start index, result tiles).
+    run_batch crops its own tiles, so only one batch of inputs is in memory.
+    Halves the batch size and retries when CUDA runs out of memory.
+    """
+    start = 0
+    batch_size = max(1, batch_size)
+    while start < len(boxes):
+        end = min(start + batch_size, len(boxes))
+        try:
+            results = run_batch(boxes[start:end], seeds[start:end])
+        except torch.cuda.OutOfMemoryError:
+            if batch_size == 1:
+                raise
+            torch.cuda.empty_cache()
+            batch_size //= 2
+            print(f"Out of memory, retrying with tile batch size {batch_size}")
+            continue
+        yield start, results
+        start = end
 
 
 @timer_func
-def gradio_process_image(input_image, resolution, num_inference_steps, strength, hdr, guidance_scale, controlnet_strength, scheduler_name):
+def gradio_process_image(input_image, resolution, num_inference_steps, strength, hdr, guidance_scale, controlnet_strength, scheduler_name,
+                         tile_batch_size=TILE_BATCH_SIZE, seed=None):
     print("Starting image processing...")
     torch.cuda.empty_cache()
     lazy_pipe.set_scheduler(scheduler_name)
@@ -234,43 +268,42 @@ def gradio_process_image(input_image, resolution, num_inference_steps, strength,
     num_tiles_x = math.ceil((W - overlap) / (tile_width - overlap))
     num_tiles_y = math.ceil((H - overlap) / (tile_height - overlap))
     
-    # Create a blank canvas for the result
-    result = np.zeros((H, W, 3), dtype=np.float32)
-    weight_sum = np.zeros((H, W, 1), dtype=np.float32)
-    
-    # Create gaussian weight
-    gaussian_weight = create_gaussian_weight(max(tile_width, tile_height))
+    # Row-band blender: only one tile-height band is kept in float32
+    blender = StreamingTileBlender(W, H, band_height=tile_height)
     
+    # Calculate tile coordinates (every tile is resized to the same size, so they batch)
+    boxes = []
     for i in range(num_tiles_y):
         for j in range(num_tiles_x):
-            # Calculate tile coordinates
             left = j * (tile_width - overlap)
             top = i * (tile_height - overlap)
             right = min(left + tile_width, W)
             bottom = min(top + tile_height, H)
+            boxes.append((left, top, right, bottom))
+    
+    # Deterministic per-tile seeds
+    base_seed = random.randint(0, 2147483647) if seed is None else seed
+    seeds = [base_seed + index for index in range(len(boxes))]
+    
+    # Prompt embeddings are computed once per image
+    prompt_embeds, negative_prompt_embeds = encode_prompts(guidance_scale)
+    
+    def run_batch(batch_boxes, batch_seeds):
+        batch_tiles = [condition_image.crop(box).resize((tile_width, tile_height)) for box in batch_boxes]
+        return process_tile_batch(batch_tiles, batch_seeds, num_inference_steps, strength, guidance_scale,
+                                  controlnet_strength, prompt_embeds, negative_prompt_embeds)
+    
+    for start, result_tiles in iter_tile_batches(boxes, seeds, tile_batch_size, run_batch):
+        for (left, top, right, bottom), result_tile in zip(boxes[start:], result_tiles):
+            # Resize edge tiles back to the area they cover
+            if (right - left, bottom - top) != (tile_width, tile_height):
+                result_tile = cv2.resize(result_tile, (right - left, bottom - top))
             
-            # Adjust tile size if it's at the edge
-            current_tile_size = (bottom - top, right - left)
-            
-            tile = condition_image.crop((left, top, right, bottom))
-            tile = tile.resize((tile_width, tile_height))
-            
-            # Process the tile
-            result_tile = process_tile(tile, num_inference_steps, strength, guidance_scale, controlnet_strength)
-            
-            # Apply gaussian weighting
-            if current_tile_size != (tile_width, tile_height):
-                result_tile = cv2.resize(result_tile, current_tile_size[::-1])
-                tile_weight = cv2.resize(gaussian_weight, current_tile_size[::-1])
-            else:
-                tile_weight = gaussian_weight[:current_tile_size[0], :current_tile_size[1]]
-            
-            # Add the tile to the result with gaussian weighting
-            result[top:bottom, left:right] += result_tile * tile_weight[:, :, np.newaxis]
-            weight_sum[top:bottom, left:right] += tile_weight[:, :, np.newaxis]
+            # Accumulate with gaussian weighting; rows above the tile are finalized
+            blender.add(left, top, result_tile)
     
-    # Normalize the result
-    final_result = (result / weight_sum).astype(np.uint8)
+    # Normalize the remaining rows
+    final_result = blender.finish()
     
     print("Image processing completed successfully")
     
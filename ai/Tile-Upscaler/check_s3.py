@@ -1,13 +1,8 @@
-import boto3
 from config import S3_CONFIG
+from s3_io import get_s3_client
 
-# S3 클라이언트 생성
-s3_client = boto3.client(
-    's3',
-    region_name=S3_CONFIG['region_name'],
-    aws_access_key_id=S3_CONFIG['access_key_id'],
-    aws_secret_access_key=S3_CONFIG['secret_access_key']
-)
+# S3 클라이언트 생성 (endpoint_url이 있으면 MinIO 등 로컬 S3로 접속)
+s3_client = get_s3_client(S3_CONFIG)
 
 bucket_name = S3_CONFIG['bucket_name']
 
@@ -5,7 +5,32 @@ S3_CONFIG = {
     'region_name': 'your-aws-region',        # e.g., 'ap-southeast-2'
     'bucket_name': 'your-s3-bucket-name',   # e.g., 'topoom-s3-bucket'
     'access_key_id': 'YOUR_ACCESS_KEY_ID',  # Your AWS Access Key ID
-    'secret_access_key': 'YOUR_SECRET_KEY'  # Your AWS Secret Access Key
+    'secret_access_key': 'YOUR_SECRET_KEY',  # Your AWS Secret Access Key
+    # Optional (see s3_io.py)
+    # 'endpoint_url': 'http://localhost:9000',  # Local S3 stand-in (MinIO / moto server) for testing
+    # 'max_concurrency': 8,                     # Parallel transfers per worker
+    # 'small_object_bytes': 8 * 1024 * 1024,    # Objects up to this size are read in a single GET
+}
+
+# RabbitMQ Configuration for queue_worker.py (same broker as the backend)
+AMQP_CONFIG = {
+    'host': 'localhost',
+    'port': 5672,
+    'username': 'guest',
+    'password': 'guest',
+    'virtual_host': '/',
+    'queue': 'image-enhancement-queue',  # Case-ready messages: {"caseId": "missing-person-..."}
+    'dead_letter_exchange': 'dlx',       # Failed cases are dead-lettered like the backend queues
+    'prefetch_count': 1,                 # Unacked messages held per worker
+    'concurrency': 1,                    # Cases processed in parallel (GPU memory permitting)
+}
+
+# Content-addressed result cache for upscaling / GPT-4o / diffusion stages (optional, see result_cache.py)
+RESULT_CACHE_CONFIG = {
+    'enabled': True,
+    'dir': './cache/results',
+    'max_bytes': 20 * 1024 ** 3,  # LRU eviction beyond this size
+    's3_prefix': None,            # e.g. 'cache/results/' to share entries between workers
 }
 
 # GMS API Configuration (SSAFY AI API)
@@ -1,8 +1,6 @@
 import os
 import time
 import json
-import boto3
-from botocore.exceptions import ClientError
 import tempfile
 
 import torch
@@ -21,96 +19,23 @@ except ImportError:
     print("Please create config.py with S3_CONFIG")
     sys.exit(1)
 
+from s3_io import S3Handler
+from result_cache import get_result_cache
+from stage_scheduler import StageJob, run_case, run_cases
+
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 dtype = torch.bfloat16 if torch.cuda.is_available() else torch.float32
 
 print(f"Using device: {device}")
 print(f"Using dtype: {dtype}")
 
-
-class S3Handler:
-    def __init__(self):
-        self.s3_client = boto3.client(
-            's3',
-            region_name=S3_CONFIG['region_name'],
-            aws_access_key_id=S3_CONFIG['access_key_id'],
-            aws_secret_access_key=S3_CONFIG['secret_access_key']
-        )
-        self.bucket_name = S3_CONFIG['bucket_name']
-
-    def list_missing_person_cases(self):
-        try:
-            response = self.s3_client.list_objects_v2(
-                Bucket=self.bucket_name,
-                Prefix='input/',
-                Delimiter='/'
-            )
-
-            cases = []
-            if 'CommonPrefixes' in response:
-                for prefix in response['CommonPrefixes']:
-                    folder_name = prefix['Prefix'].replace('input/', '').replace('/', '')
-                    if folder_name.startswith('missing-person-'):
-                        cases.append(folder_name)
-
-            return cases
-        except ClientError as e:
-            print(f"Error listing cases: {e}")
-            return []
-
-    def download_case_images(self, case_id, local_temp_dir):
-        try:
-            case_dir = os.path.join(local_temp_dir, case_id)
-            os.makedirs(case_dir, exist_ok=True)
-
-            response = self.s3_client.list_objects_v2(
-                Bucket=self.bucket_name,
-                Prefix=f'input/{case_id}/'
-            )
-
-            downloaded_files = []
-            if 'Contents' in response:
-                for obj in response['Contents']:
-                    key = obj['Key']
-                    if key.endswith('/'):
-                        continue
-
-                    filename = os.path.basename(key)
-                    local_path = os.path.join(case_dir, filename)
-
-                    self.s3_client.download_file(self.bucket_name, key, local_path)
-                    downloaded_files.append(local_path)
-                    print(f"Downloaded: {key}")
-
-            downloaded_files.sort()
-            return downloaded_files
-        except ClientError as e:
-            print(f"Error downloading: {e}")
-            return []
-
-    def upload_processed_results(self, case_id, enhanced_image_path, analysis_json):
-        try:
-            enhanced_key = f'output/{case_id}/enhanced_image.jpg'
-            self.s3_client.upload_file(enhanced_image_path, self.bucket_name, enhanced_key)
-            print(f"Uploaded: {enhanced_key}")
-
-            json_key = f'output/{case_id}/analysis_result.json'
-            json_content = json.dumps(analysis_json, indent=2, ensure_ascii=False)
-            self.s3_client.put_object(
-                Bucket=self.bucket_name,
-                Key=json_key,
-                Body=json_content.encode('utf-8'),
-                ContentType='application/json'
-            )
-            print(f"Uploaded: {json_key}")
-
-            return True
-        except ClientError as e:
-            print(f"Error uploading: {e}")
-            return False
+result_cache = get_result_cache()
 
 
 class LazyFluxFillPipeline:
+    MODEL_ID = "black-forest-labs/FLUX.1-Fill-dev"
+    MODEL_REVISION = None  # hub commit; pin it so cached results follow the weights
+
     def __init__(self):
         self.pipe = None
 
@@ -118,26 +43,25 @@ class LazyFluxFillPipeline:
         if self.pipe is None:
             print("Loading FLUX.1-Fill pipeline...")
             self.pipe = FluxFillPipeline.from_pretrained(
-                "black-forest-labs/FLUX.1-Fill-dev",
+                self.MODEL_ID,
+                revision=self.MODEL_REVISION,
                 torch_dtype=dtype
             ).to(device)
             print("FLUX.1-Fill loaded!")
 
-    def outpaint_body(self, face_image_path, output_path):
-        """Outpaint body below face image"""
-        print(f"Outpainting body from face: {os.path.basename(face_image_path)}")
-
-        self.load()
+    @staticmethod
+    def canvas_size(face_w, face_h):
+        """Outpainting canvas (width, height): face at top, body about 2.5x face height below"""
+        return max(face_w, 512), face_h + int(face_h * 2.5)  # At least 512 wide
 
+    def _outpaint_canvas(self, face_image_path, output_path):
+        """Canvas and mask (0 = keep, 255 = generate) for one face image"""
         # Load face image
         face_img = Image.open(face_image_path).convert('RGB')
         face_w, face_h = face_img.size
 
         # Create canvas: face at top, empty space below for body
-        # Body should be about 2.5x face height
-        body_h = int(face_h * 2.5)
-        canvas_h = face_h + body_h
-        canvas_w = max(face_w, 512)  # At least 512 wide
+        canvas_w, canvas_h = self.canvas_size(face_w, face_h)
 
         # Create canvas and mask
         canvas = Image.new('RGB', (canvas_w, canvas_h), (255, 255, 255))
@@ -152,63 +76,165 @@ class LazyFluxFillPipeline:
         mask_draw.rectangle([0, face_h, canvas_w, canvas_h], fill=255)
 
         print(f"  Canvas: {canvas.size}, Face area: {face_w}x{face_h}")
-        print(f"  Outpainting body area below face...")
+        return canvas, mask
+
+    def outpaint_body_batch(self, jobs):
+        """
+        Outpaint several faces, one FLUX call per canvas size
+
+        Args:
+            jobs: List of (face_image_path, output_path)
+        Returns:
+            List of result images, in job order
+        """
+        prompt = "standing person, full body, neutral background"
+        guidance_scale = 30
+        num_inference_steps = 50
+
+        results = [None] * len(jobs)
+        pending = {}  # canvas size -> [(index, cache_key, canvas, mask)]
+        for index, (face_image_path, output_path) in enumerate(jobs):
+            print(f"Outpainting body from face: {os.path.basename(face_image_path)}")
+
+            # The canvas and mask carry the face and its layout, so they key the result
+            canvas, mask = self._outpaint_canvas(face_image_path, output_path)
+            cache_key = result_cache.key(
+                'outpaint-body', canvas, mask, model=self.MODEL_ID, revision=self.MODEL_REVISION,
+                dtype=str(dtype), prompt=prompt, guidance=guidance_scale, steps=num_inference_steps
+            )
+            if result_cache.fetch_file(cache_key, output_path):
+                print("  → Cached result")
+                results[index] = Image.open(output_path)
+                continue
 
-        # Outpaint body
-        result = self.pipe(
-            prompt="standing person, full body, neutral background",
-            image=canvas,
-            mask_image=mask,
-            height=canvas_h,
-            width=canvas_w,
-            guidance_scale=30,
-            num_inference_steps=50
-        ).images[0]
+            pending.setdefault(canvas.size, []).append((index, cache_key, canvas, mask))
 
-        result.save(output_path)
-        print(f"  → Outpainted full body: {result.size}")
+        if not pending:
+            return results
 
-        return result
+        self.load()
+
+        for (canvas_w, canvas_h), items in pending.items():
+            print(f"  Outpainting {len(items)} canvas(es) of {canvas_w}x{canvas_h}...")
+            images = self.pipe(
+                prompt=[prompt] * len(items),
+                image=[canvas for _, _, canvas, _ in items],
+                mask_image=[mask for _, _, _, mask in items],
+                height=canvas_h,
+                width=canvas_w,
+                guidance_scale=guidance_scale,
+                num_inference_steps=num_inference_steps
+            ).images
+
+            for (index, cache_key, _, _), result in zip(items, images):
+                output_path = jobs[index][1]
+                result.save(output_path)
+                result_cache.store_file(cache_key, output_path)
+                print(f"  → Outpainted full body: {result.size}")
+                results[index] = result
+
+        return results
+
+    def outpaint_body(self, face_image_path, output_path):
+        """Outpaint body below face image"""
+        return self.outpaint_body_batch([(face_image_path, output_path)])[0]
 
 
 class LazyQwenTryOnPipeline:
+    MODEL_ID = "Qwen/Qwen-Image-Edit-2509"
+    MODEL_REVISION = None  # hub commit; pin it so cached results follow the weights
+    LORA_WEIGHT = 1.0
+
+    # Both LoRAs stay resident on the pipeline; stages switch with set_adapters
+    LORA_ADAPTERS = {
+        "removebody": (
+            "JamesDigitalOcean/Qwen_Image_Edit_Extract_Clothing",
+            "qwen_image_edit_remove_body.safetensors"
+        ),
+        "tryonclothes": (
+            "JamesDigitalOcean/Qwen_Image_Edit_Try_On_Clothes",
+            "qwen_image_edit_tryon.safetensors"
+        ),
+    }
+
     def __init__(self):
         self.pipe = None
+        self.active_adapter = None
+        self.adapter_switch_times = []
 
     def load(self):
         if self.pipe is None:
             print("Loading Qwen-Image-Edit-2509 pipeline...")
             self.pipe = QwenImageEditPlusPipeline.from_pretrained(
-                "Qwen/Qwen-Image-Edit-2509",
+                self.MODEL_ID,
+                revision=self.MODEL_REVISION,
                 torch_dtype=dtype,
                 device_map="balanced"
             )
             print("Qwen-Image-Edit-2509 loaded!")
 
+            start = time.time()
+            for adapter_name, (repo_id, weight_name) in self.LORA_ADAPTERS.items():
+                self.pipe.load_lora_weights(repo_id, weight_name=weight_name, adapter_name=adapter_name)
+            print(f"LoRA adapters {list(self.LORA_ADAPTERS)} loaded in {time.time() - start:.1f}s")
+
+    def use_adapter(self, adapter_name):
+        """Activate one of the resident LoRAs (no weight I/O, only adapter scales change)"""
+        if self.active_adapter == adapter_name:
+            return
+
+        start = time.time()
+        self.pipe.set_adapters([adapter_name], adapter_weights=[self.LORA_WEIGHT])
+        elapsed = time.time() - start
+        self.adapter_switch_times.append(elapsed)
+        self.active_adapter = adapter_name
+        print(f"  Switched LoRA to {adapter_name} in {elapsed * 1000:.1f}ms")
+
+    def cache_key(self, stage, adapter_name, *inputs, **params):
+        """Result cache key: stage inputs plus the model, LoRA and sampling values that shape the output"""
+        return result_cache.key(
+            stage, *inputs, model=self.MODEL_ID, revision=self.MODEL_REVISION, dtype=str(dtype),
+            adapter=adapter_name, lora=self.LORA_ADAPTERS[adapter_name], lora_weight=self.LORA_WEIGHT,
+            **params
+        )
+
+    def adapter_switch_summary(self):
+        if not self.adapter_switch_times:
+            return "no LoRA switches"
+        total = sum(self.adapter_switch_times)
+        return (f"{len(self.adapter_switch_times)} LoRA switches, "
+                f"avg {total / len(self.adapter_switch_times) * 1000:.1f}ms, total {total:.2f}s")
+
     def extract_clothes(self, clothing_image_path, output_path):
         """Extract clothing from image"""
         print(f"Extracting clothes from: {os.path.basename(clothing_image_path)}")
 
+        prompt = "removebody remove the person from this image, but leave the outfit on a white background"
+        num_inference_steps = 50
+        cache_key = self.cache_key(
+            'extract-clothes', "removebody", clothing_image_path,
+            prompt=prompt, steps=num_inference_steps
+        )
+        if result_cache.fetch_file(cache_key, output_path):
+            print("  → Cached result")
+            return Image.open(output_path)
+
         self.load()
 
-        self.pipe.load_lora_weights(
-            "JamesDigitalOcean/Qwen_Image_Edit_Extract_Clothing",
-            weight_name="qwen_image_edit_remove_body.safetensors",
-            adapter_name="removebody"
-        )
+        self.use_adapter("removebody")
 
         pil_image = Image.open(clothing_image_path).convert('RGB')
 
         result = self.pipe(
             image=[pil_image],
-            prompt="removebody remove the person from this image, but leave the outfit on a white background",
-            num_inference_steps=50
+            prompt=prompt,
+            num_inference_steps=num_inference_steps
         ).images[0]
 
         result.save(output_path)
+        result_cache.store_file(cache_key, output_path)
         print(f"  → Extracted clothing: {result.size}")
 
-        self.pipe.unload_lora_weights()
         return result
 
     def tryon_clothes(self, person_image_path, extracted_clothes_path, output_path):
@@ -217,27 +243,33 @@ class LazyQwenTryOnPipeline:
         print(f"  Person: {os.path.basename(person_image_path)}")
         print(f"  Clothes: {os.path.basename(extracted_clothes_path)}")
 
+        prompt = "tryon_clothes dress the clothing onto the asian person"
+        num_inference_steps = 20
+        cache_key = self.cache_key(
+            'tryon-clothes', "tryonclothes", person_image_path, extracted_clothes_path,
+            prompt=prompt, steps=num_inference_steps
+        )
+        if result_cache.fetch_file(cache_key, output_path):
+            print("  → Cached result")
+            return Image.open(output_path)
+
         self.load()
 
-        self.pipe.load_lora_weights(
-            "JamesDigitalOcean/Qwen_Image_Edit_Try_On_Clothes",
-            weight_name="qwen_image_edit_tryon.safetensors",
-            adapter_name="tryonclothes"
-        )
+        self.use_adapter("tryonclothes")
 
         person_img = Image.open(person_image_path).convert('RGB')
         clothes_img = Image.open(extracted_clothes_path).convert('RGB')
 
         result = self.pipe(
             image=[person_img, clothes_img],
-            prompt="tryon_clothes dress the clothing onto the asian person",
-            num_inference_steps=20
+            prompt=prompt,
+            num_inference_steps=num_inference_steps
         ).images[0]
 
         result.save(output_path)
+        result_cache.store_file(cache_key, output_path)
         print(f"  → Try-on result: {result.size}")
 
-        self.pipe.unload_lora_weights()
         return result
 
 
@@ -327,14 +359,12 @@ def crop_face_region(face_image_path, output_path):
         return img_pil, False
 
 
-def process_missing_person_case_outpaint_tryon(case_id):
-    """Process with FLUX Outpainting + Qwen Try-On"""
+def outpaint_tryon_case_steps(case_id, s3_handler):
+    """Stage-scheduler steps: Process with FLUX Outpainting + Qwen Try-On"""
     print(f"\n{'='*60}")
     print(f"Processing: {case_id} (OUTPAINT + TRY-ON)")
     print(f"{'='*60}\n")
 
-    s3_handler = S3Handler()
-
     with tempfile.TemporaryDirectory() as temp_dir:
         # Download
         downloaded_files = s3_handler.download_case_images(case_id, temp_dir)
@@ -367,21 +397,29 @@ def process_missing_person_case_outpaint_tryon(case_id):
 
         # Step 2: FLUX outpainting - generate body below face
         outpainted_person_path = os.path.join(temp_dir, "outpainted_person.jpg")
-        outpainted_person = lazy_flux_fill.outpaint_body(cropped_face_path, outpainted_person_path)
+        with Image.open(cropped_face_path) as face_img:
+            canvas_w, canvas_h = lazy_flux_fill.canvas_size(*face_img.size)
+        outpainted_person = yield StageJob(
+            lazy_flux_fill.outpaint_body,
+            (cropped_face_path, outpainted_person_path),
+            batch_fn=lazy_flux_fill.outpaint_body_batch,
+            group=(canvas_w, canvas_h),
+            pixels=canvas_w * canvas_h
+        )
         shutil.copy(outpainted_person_path, os.path.join(debug_dir, "4_outpainted_fullbody.jpg"))
 
         # Step 3: Extract clothing
         extracted_clothes_path = os.path.join(temp_dir, "extracted_clothes.png")
-        lazy_qwen_tryon.extract_clothes(clothing_ref_image, extracted_clothes_path)
+        yield StageJob(lazy_qwen_tryon.extract_clothes, (clothing_ref_image, extracted_clothes_path))
         shutil.copy(extracted_clothes_path, os.path.join(debug_dir, "5_extracted_clothes.png"))
 
         # Step 4: Try on clothing
         final_output = os.path.join(temp_dir, "final_result.jpg")
-        result_image = lazy_qwen_tryon.tryon_clothes(
+        result_image = yield StageJob(lazy_qwen_tryon.tryon_clothes, (
             outpainted_person_path,
             extracted_clothes_path,
             final_output
-        )
+        ))
         shutil.copy(final_output, os.path.join(debug_dir, "6_final_result.jpg"))
 
         # Analysis
@@ -410,6 +448,11 @@ def process_missing_person_case_outpaint_tryon(case_id):
         return success
 
 
+def process_missing_person_case_outpaint_tryon(case_id, s3_handler=None):
+    """Process with FLUX Outpainting + Qwen Try-On"""
+    return run_case(outpaint_tryon_case_steps(case_id, s3_handler or S3Handler()))
+
+
 def process_all_cases_outpaint_tryon():
     """Process all cases"""
     s3_handler = S3Handler()
@@ -421,16 +464,21 @@ def process_all_cases_outpaint_tryon():
 
     print(f"Found {len(cases)} cases")
 
+    pending = []
     for case_id in cases:
-        try:
-            process_missing_person_case_outpaint_tryon(case_id)
-        except Exception as e:
-            print(f"Error: {case_id}: {e}")
-            import traceback
-            traceback.print_exc()
+        if s3_handler.case_output_exists(case_id):
+            print(f"Skipping {case_id}: output already exists")
             continue
+        pending.append(case_id)
+
+    # Pending cases run stage by stage, so each LoRA is activated once per stage
+    results = run_cases({case_id: outpaint_tryon_case_steps(case_id, s3_handler) for case_id in pending})
+    failed = [case_id for case_id in pending if not results.get(case_id)]
 
-    print(f"\nCompleted all {len(cases)} cases")
+    print(f"\nCompleted {len(pending) - len(failed)}/{len(pending)} pending cases ({len(cases)} total)")
+    if failed:
+        print(f"Failed cases: {', '.join(failed)}")
+    print(f"Adapter switching: {lazy_qwen_tryon.adapter_switch_summary()}")
 
 
 if __name__ == "__main__":
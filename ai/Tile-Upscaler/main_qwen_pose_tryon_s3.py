@@ -1,8 +1,5 @@
 import os
 import time
-import json
-import boto3
-from botocore.exceptions import ClientError
 import tempfile
 
 import torch
@@ -12,14 +9,9 @@ from PIL import Image, ImageDraw
 
 from diffusers import QwenImageEditPlusPipeline
 
-# Import configurations
-try:
-    from config import S3_CONFIG
-except ImportError:
-    import sys
-    print("Error: config.py file not found!")
-    print("Please create config.py with S3_CONFIG")
-    sys.exit(1)
+from s3_io import S3Handler
+from result_cache import get_result_cache
+from stage_scheduler import StageJob, run_case, run_cases
 
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 dtype = torch.bfloat16 if torch.cuda.is_available() else torch.float32
@@ -27,92 +19,30 @@ dtype = torch.bfloat16 if torch.cuda.is_available() else torch.float32
 print(f"Using device: {device}")
 print(f"Using dtype: {dtype}")
 
+result_cache = get_result_cache()
 
-class S3Handler:
-    def __init__(self):
-        self.s3_client = boto3.client(
-            's3',
-            region_name=S3_CONFIG['region_name'],
-            aws_access_key_id=S3_CONFIG['access_key_id'],
-            aws_secret_access_key=S3_CONFIG['secret_access_key']
-        )
-        self.bucket_name = S3_CONFIG['bucket_name']
-
-    def list_missing_person_cases(self):
-        try:
-            response = self.s3_client.list_objects_v2(
-                Bucket=self.bucket_name,
-                Prefix='input/',
-                Delimiter='/'
-            )
-
-            cases = []
-            if 'CommonPrefixes' in response:
-                for prefix in response['CommonPrefixes']:
-                    folder_name = prefix['Prefix'].replace('input/', '').replace('/', '')
-                    if folder_name.startswith('missing-person-'):
-                        cases.append(folder_name)
-
-            return cases
-        except ClientError as e:
-            print(f"Error listing cases: {e}")
-            return []
-
-    def download_case_images(self, case_id, local_temp_dir):
-        try:
-            case_dir = os.path.join(local_temp_dir, case_id)
-            os.makedirs(case_dir, exist_ok=True)
-
-            response = self.s3_client.list_objects_v2(
-                Bucket=self.bucket_name,
-                Prefix=f'input/{case_id}/'
-            )
-
-            downloaded_files = []
-            if 'Contents' in response:
-                for obj in response['Contents']:
-                    key = obj['Key']
-                    if key.endswith('/'):
-                        continue
-
-                    filename = os.path.basename(key)
-                    local_path = os.path.join(case_dir, filename)
-
-                    self.s3_client.download_file(self.bucket_name, key, local_path)
-                    downloaded_files.append(local_path)
-                    print(f"Downloaded: {key}")
-
-            downloaded_files.sort()
-            return downloaded_files
-        except ClientError as e:
-            print(f"Error downloading: {e}")
-            return []
-
-    def upload_processed_results(self, case_id, enhanced_image_path, analysis_json):
-        try:
-            enhanced_key = f'output/{case_id}/enhanced_image.jpg'
-            self.s3_client.upload_file(enhanced_image_path, self.bucket_name, enhanced_key)
-            print(f"Uploaded: {enhanced_key}")
-
-            json_key = f'output/{case_id}/analysis_result.json'
-            json_content = json.dumps(analysis_json, indent=2, ensure_ascii=False)
-            self.s3_client.put_object(
-                Bucket=self.bucket_name,
-                Key=json_key,
-                Body=json_content.encode('utf-8'),
-                ContentType='application/json'
-            )
-            print(f"Uploaded: {json_key}")
 
-            return True
-        except ClientError as e:
-            print(f"Error uploading: {e}")
-            return False
+class LazyQwenPoseTryOnPipeline:
+    MODEL_ID = "Qwen/Qwen-Image-Edit-2509"
+    MODEL_REVISION = None  # hub commit; pin it so cached results follow the weights
+    LORA_WEIGHT = 1.0
 
+    # Both LoRAs stay resident on the pipeline; stages switch with set_adapters
+    LORA_ADAPTERS = {
+        "removebody": (
+            "JamesDigitalOcean/Qwen_Image_Edit_Extract_Clothing",
+            "qwen_image_edit_remove_body.safetensors"
+        ),
+        "tryonclothes": (
+            "JamesDigitalOcean/Qwen_Image_Edit_Try_On_Clothes",
+            "qwen_image_edit_tryon.safetensors"
+        ),
+    }
 
-class LazyQwenPoseTryOnPipeline:
     def __init__(self):
         self.pipe = None
+        self.active_adapter = None
+        self.adapter_switch_times = []
 
     def load(self):
         if self.pipe is None:
@@ -120,36 +50,75 @@ class LazyQwenPoseTryOnPipeline:
             print("Using multi-GPU distribution to handle large model...")
 
             self.pipe = QwenImageEditPlusPipeline.from_pretrained(
-                "Qwen/Qwen-Image-Edit-2509",
+                self.MODEL_ID,
+                revision=self.MODEL_REVISION,
                 torch_dtype=dtype,
                 device_map="balanced"
             )
             print("Qwen-Image-Edit-2509 loaded and distributed across GPUs!")
 
+            start = time.time()
+            for adapter_name, (repo_id, weight_name) in self.LORA_ADAPTERS.items():
+                self.pipe.load_lora_weights(repo_id, weight_name=weight_name, adapter_name=adapter_name)
+            print(f"LoRA adapters {list(self.LORA_ADAPTERS)} loaded in {time.time() - start:.1f}s")
+
+    def use_adapter(self, adapter_name):
+        """Activate one of the resident LoRAs (no weight I/O, only adapter scales change)"""
+        if self.active_adapter == adapter_name:
+            return
+
+        start = time.time()
+        self.pipe.set_adapters([adapter_name], adapter_weights=[self.LORA_WEIGHT])
+        elapsed = time.time() - start
+        self.adapter_switch_times.append(elapsed)
+        self.active_adapter = adapter_name
+        print(f"  Switched LoRA to {adapter_name} in {elapsed * 1000:.1f}ms")
+
+    def cache_key(self, stage, adapter_name, *inputs, **params):
+        """Result cache key: stage inputs plus the model, LoRA and sampling values that shape the output"""
+        return result_cache.key(
+            stage, *inputs, model=self.MODEL_ID, revision=self.MODEL_REVISION, dtype=str(dtype),
+            adapter=adapter_name, lora=self.LORA_ADAPTERS[adapter_name], lora_weight=self.LORA_WEIGHT,
+            **params
+        )
+
+    def adapter_switch_summary(self):
+        if not self.adapter_switch_times:
+            return "no LoRA switches"
+        total = sum(self.adapter_switch_times)
+        return (f"{len(self.adapter_switch_times)} LoRA switches, "
+                f"avg {total / len(self.adapter_switch_times) * 1000:.1f}ms, total {total:.2f}s")
+
     def extract_clothes(self, clothing_image_path, output_path):
         """Stage 1: Extract clothing from image"""
         print(f"Extracting clothes from: {os.path.basename(clothing_image_path)}")
 
+        prompt = "removebody remove the person from this image, but leave the outfit on a white background"
+        num_inference_steps = 50
+        cache_key = self.cache_key(
+            'extract-clothes', "removebody", clothing_image_path,
+            prompt=prompt, steps=num_inference_steps
+        )
+        if result_cache.fetch_file(cache_key, output_path):
+            print("  → Cached result")
+            return Image.open(output_path)
+
         self.load()
 
-        self.pipe.load_lora_weights(
-            "JamesDigitalOcean/Qwen_Image_Edit_Extract_Clothing",
-            weight_name="qwen_image_edit_remove_body.safetensors",
-            adapter_name="removebody"
-        )
+        self.use_adapter("removebody")
 
         pil_image = Image.open(clothing_image_path).convert('RGB')
 
         result = self.pipe(
             image=[pil_image],
-            prompt="removebody remove the person from this image, but leave the outfit on a white background",
-            num_inference_steps=50
+            prompt=prompt,
+            num_inference_steps=num_inference_steps
         ).images[0]
 
         result.save(output_path)
+        result_cache.store_file(cache_key, output_path)
         print(f"  → Extracted clothing: {result.size}")
 
-        self.pipe.unload_lora_weights()
         return result
 
     def tryon_with_person_and_clothes(self, person_with_face_path, clothes_image_path, output_path):
@@ -164,14 +133,20 @@ class LazyQwenPoseTryOnPipeline:
         print(f"  Person: {os.path.basename(person_with_face_path)}")
         print(f"  Clothes: {os.path.basename(clothes_image_path)}")
 
+        prompt = "tryon_clothes"
+        num_inference_steps = 50
+        cache_key = self.cache_key(
+            'tryon-with-person-and-clothes', "tryonclothes", person_with_face_path, clothes_image_path,
+            prompt=prompt, steps=num_inference_steps
+        )
+        if result_cache.fetch_file(cache_key, output_path):
+            print("  → Cached result")
+            return Image.open(output_path)
+
         self.load()
 
-        # Load Try-On LoRA
-        self.pipe.load_lora_weights(
-            "JamesDigitalOcean/Qwen_Image_Edit_Try_On_Clothes",
-            weight_name="qwen_image_edit_tryon.safetensors",
-            adapter_name="tryonclothes"
-        )
+        # Activate Try-On LoRA
+        self.use_adapter("tryonclothes")
 
         # Load 2 images (standard try-on)
         person_img = Image.open(person_with_face_path).convert('RGB')
@@ -183,14 +158,14 @@ class LazyQwenPoseTryOnPipeline:
         # Generate with standard 2-image input
         result = self.pipe(
             image=[person_img, clothes_img],
-            prompt="tryon_clothes",
-            num_inference_steps=50
+            prompt=prompt,
+            num_inference_steps=num_inference_steps
         ).images[0]
 
         result.save(output_path)
+        result_cache.store_file(cache_key, output_path)
         print(f"  → Result: {result.size}")
 
-        self.pipe.unload_lora_weights()
         return result
 
 
@@ -401,14 +376,12 @@ def create_standing_pose_template(output_path, size=(512, 768)):
     return Image.open(output_path)
 
 
-def process_missing_person_case_pose_tryon(case_id):
-    """Process with Face + Pose + Clothes approach"""
+def pose_tryon_case_steps(case_id, s3_handler):
+    """Stage-scheduler steps: Process with Face + Pose + Clothes approach"""
     print(f"\n{'='*60}")
     print(f"Processing: {case_id} (POSE-BASED TRY-ON)")
     print(f"{'='*60}\n")
 
-    s3_handler = S3Handler()
-
     with tempfile.TemporaryDirectory() as temp_dir:
         # Download
         downloaded_files = s3_handler.download_case_images(case_id, temp_dir)
@@ -449,7 +422,7 @@ def process_missing_person_case_pose_tryon(case_id):
 
         # Step 3: Extract clothing from reference image
         extracted_clothes_path = os.path.join(temp_dir, "extracted_clothes.png")
-        lazy_qwen_pose_tryon.extract_clothes(clothing_ref_image, extracted_clothes_path)
+        yield StageJob(lazy_qwen_pose_tryon.extract_clothes, (clothing_ref_image, extracted_clothes_path))
 
         # Save extracted clothes to debug
         shutil.copy(clothing_ref_image, os.path.join(debug_dir, "4_clothing_reference.jpg"))
@@ -457,11 +430,11 @@ def process_missing_person_case_pose_tryon(case_id):
 
         # Step 4: Standard 2-image try-on (Person + Clothes)
         final_output = os.path.join(temp_dir, "final_result.jpg")
-        result_image = lazy_qwen_pose_tryon.tryon_with_person_and_clothes(
+        result_image = yield StageJob(lazy_qwen_pose_tryon.tryon_with_person_and_clothes, (
             person_with_face_path,
             extracted_clothes_path,
             final_output
-        )
+        ))
 
         # Save final result to debug
         shutil.copy(final_output, os.path.join(debug_dir, "6_final_result.jpg"))
@@ -493,6 +466,11 @@ def process_missing_person_case_pose_tryon(case_id):
         return success
 
 
+def process_missing_person_case_pose_tryon(case_id, s3_handler=None):
+    """Process with Face + Pose + Clothes approach"""
+    return run_case(pose_tryon_case_steps(case_id, s3_handler or S3Handler()))
+
+
 def process_all_cases_pose_tryon():
     """Process all cases"""
     s3_handler = S3Handler()
@@ -504,16 +482,21 @@ def process_all_cases_pose_tryon():
 
     print(f"Found {len(cases)} cases")
 
+    pending = []
     for case_id in cases:
-        try:
-            process_missing_person_case_pose_tryon(case_id)
-        except Exception as e:
-            print(f"Error: {case_id}: {e}")
-            import traceback
-            traceback.print_exc()
+        if s3_handler.case_output_exists(case_id):
+            print(f"Skipping {case_id}: output already exists")
             continue
+        pending.append(case_id)
+
+    # Pending cases run stage by stage, so each LoRA is activated once per stage
+    results = run_cases({case_id: pose_tryon_case_steps(case_id, s3_handler) for case_id in pending})
+    failed = [case_id for case_id in pending if not results.get(case_id)]
 
-    print(f"\nCompleted all {len(cases)} cases")
+    print(f"\nCompleted {len(pending) - len(failed)}/{len(pending)} pending cases ({len(cases)} total)")
+    if failed:
+        print(f"Failed cases: {', '.join(failed)}")
+    print(f"Adapter switching: {lazy_qwen_pose_tryon.adapter_switch_summary()}")
 
 
 if __name__ == "__main__":
@@ -1,8 +1,5 @@
 import os
 import time
-import json
-import boto3
-from botocore.exceptions import ClientError
 import tempfile
 import shutil
 
@@ -17,16 +14,10 @@ import cv2
 import numpy as np
 
 from RealESRGAN import RealESRGAN
+from prompt_cache import PromptEmbeddingCache
 
-# Import S3 configuration from separate file
-try:
-    from config import S3_CONFIG
-except ImportError:
-    import sys
-    print("Error: config.py file not found!")
-    print("Please create config.py file with S3_CONFIG dictionary")
-    print("You can copy config.example.py and fill in your credentials")
-    sys.exit(1)
+from s3_io import S3Handler
+from result_cache import get_result_cache
 
 USE_TORCH_COMPILE = False
 ENABLE_CPU_OFFLOAD = os.getenv("ENABLE_CPU_OFFLOAD", "0") == "1"
@@ -37,94 +28,7 @@ dtype = torch.float16 if torch.cuda.is_available() else torch.float32
 print(f"Using device: {device}")
 print(f"Using dtype: {dtype}")
 
-class S3Handler:
-    def __init__(self):
-        self.s3_client = boto3.client(
-            's3',
-            region_name=S3_CONFIG['region_name'],
-            aws_access_key_id=S3_CONFIG['access_key_id'],
-            aws_secret_access_key=S3_CONFIG['secret_access_key']
-        )
-        self.bucket_name = S3_CONFIG['bucket_name']
-    
-    def list_missing_person_cases(self):
-        """List all missing person case folders in input directory"""
-        try:
-            response = self.s3_client.list_objects_v2(
-                Bucket=self.bucket_name,
-                Prefix='input/',
-                Delimiter='/'
-            )
-
-            cases = []
-            if 'CommonPrefixes' in response:
-                for prefix in response['CommonPrefixes']:
-                    folder_name = prefix['Prefix'].replace('input/', '').replace('/', '')
-                    if folder_name.startswith('missing-person-'):
-                        cases.append(folder_name)
-
-            return cases
-        except ClientError as e:
-            print(f"Error listing cases: {e}")
-            return []
-    
-    def download_case_images(self, case_id, local_temp_dir):
-        """Download all images for a specific missing person case"""
-        try:
-            # Create local directories
-            case_dir = os.path.join(local_temp_dir, case_id)
-            os.makedirs(case_dir, exist_ok=True)
-            
-            # List all objects in the case folder
-            response = self.s3_client.list_objects_v2(
-                Bucket=self.bucket_name,
-                Prefix=f'input/{case_id}/'
-            )
-            
-            downloaded_files = []
-            if 'Contents' in response:
-                for obj in response['Contents']:
-                    key = obj['Key']
-                    if key.endswith('/'):  # Skip directory markers
-                        continue
-                    
-                    # Extract filename
-                    filename = os.path.basename(key)
-                    local_path = os.path.join(case_dir, filename)
-                    
-                    # Download file
-                    self.s3_client.download_file(self.bucket_name, key, local_path)
-                    downloaded_files.append(local_path)
-                    print(f"Downloaded: {key} -> {local_path}")
-            
-            return downloaded_files
-        except ClientError as e:
-            print(f"Error downloading case {case_id}: {e}")
-            return []
-    
-    def upload_processed_results(self, case_id, enhanced_image_path, analysis_json):
-        """Upload processed results to output folder"""
-        try:
-            # Upload enhanced image
-            enhanced_key = f'output/{case_id}/enhanced_image.jpg'
-            self.s3_client.upload_file(enhanced_image_path, self.bucket_name, enhanced_key)
-            print(f"Uploaded enhanced image: {enhanced_key}")
-            
-            # Upload analysis JSON
-            json_key = f'output/{case_id}/analysis_result.json'
-            json_content = json.dumps(analysis_json, indent=2, ensure_ascii=False)
-            self.s3_client.put_object(
-                Bucket=self.bucket_name,
-                Key=json_key,
-                Body=json_content.encode('utf-8'),
-                ContentType='application/json'
-            )
-            print(f"Uploaded analysis JSON: {json_key}")
-            
-            return True
-        except ClientError as e:
-            print(f"Error uploading results for case {case_id}: {e}")
-            return False
+result_cache = get_result_cache()
 
 def timer_func(func):
     def wrapper(*args, **kwargs):
@@ -135,9 +39,23 @@ def timer_func(func):
         return result
     return wrapper
 
-class LazyLoadPipeline:
+class LazyLoadPipeline(PromptEmbeddingCache):
+    CONTROLNET_PATH = "models/ControlNet/control_v11f1e_sd15_tile.pth"
+    MODEL_PATH = "models/models/Stable-diffusion/juggernaut_reborn.safetensors"
+    VAE_PATH = "models/VAE/vae-ft-mse-840000-ema-pruned.safetensors"
+    EMBEDDING_PATHS = [
+        "models/embeddings/verybadimagenegative_v1.3.pt",
+        "models/embeddings/JuggernautNegative-neg.pt",
+    ]
+    LORAS = [  # (path, fuse scale)
+        ("models/Lora/SDXLrender_v2.0.safetensors", 0.5),
+        ("models/Lora/more_details.safetensors", 1.),
+    ]
+    FREEU = dict(s1=0.9, s2=0.2, b1=1.3, b2=1.4)
+
     def __init__(self):
         self.pipe = None
+        super().__init__()
 
     @timer_func
     def load(self):
@@ -155,7 +73,7 @@ class LazyLoadPipeline:
         print("Setting up the pipeline...")
         
         # Check if ControlNet file exists
-        controlnet_path = "models/ControlNet/control_v11f1e_sd15_tile.pth"
+        controlnet_path = self.CONTROLNET_PATH
         if not os.path.exists(controlnet_path):
             print(f"Warning: ControlNet file {controlnet_path} not found!")
             print("Please download the ControlNet model or use a different path.")
@@ -169,7 +87,7 @@ class LazyLoadPipeline:
         # safety_checker = StableDiffusionSafetyChecker.from_pretrained("CompVis/stable-diffusion-safety-checker")
         
         # Check if main model exists
-        model_path = "models/models/Stable-diffusion/juggernaut_reborn.safetensors"
+        model_path = self.MODEL_PATH
         if not os.path.exists(model_path):
             print(f"Warning: Main model file {model_path} not found!")
             print("Please download the main model or use a different path.")
@@ -185,7 +103,7 @@ class LazyLoadPipeline:
         )
         
         # Check if VAE file exists
-        vae_path = "models/VAE/vae-ft-mse-840000-ema-pruned.safetensors"
+        vae_path = self.VAE_PATH
         if os.path.exists(vae_path):
             vae = AutoencoderKL.from_single_file(
                 vae_path,
@@ -197,40 +115,44 @@ class LazyLoadPipeline:
             print(f"Warning: VAE file {vae_path} not found, using default VAE")
         
         # Load textual inversions if they exist
-        if os.path.exists("models/embeddings/verybadimagenegative_v1.3.pt"):
-            pipe.load_textual_inversion("models/embeddings/verybadimagenegative_v1.3.pt")
-            print("Loaded verybadimagenegative textual inversion")
-        else:
-            print("Warning: verybadimagenegative_v1.3.pt not found, skipping...")
-            
-        if os.path.exists("models/embeddings/JuggernautNegative-neg.pt"):
-            pipe.load_textual_inversion("models/embeddings/JuggernautNegative-neg.pt")
-            print("Loaded JuggernautNegative textual inversion")
-        else:
-            print("Warning: JuggernautNegative-neg.pt not found, skipping...")
+        for embedding_path in self.EMBEDDING_PATHS:
+            if os.path.exists(embedding_path):
+                pipe.load_textual_inversion(embedding_path)
+                print(f"Loaded {os.path.basename(embedding_path)} textual inversion")
+            else:
+                print(f"Warning: {os.path.basename(embedding_path)} not found, skipping...")
         
         # Load LoRAs if they exist
-        if os.path.exists("models/Lora/SDXLrender_v2.0.safetensors"):
-            pipe.load_lora_weights("models/Lora/SDXLrender_v2.0.safetensors")
-            pipe.fuse_lora(lora_scale=0.5)
-            print("Loaded SDXLrender LoRA")
-        else:
-            print("Warning: SDXLrender_v2.0.safetensors not found, skipping...")
-            
-        if os.path.exists("models/Lora/more_details.safetensors"):
-            pipe.load_lora_weights("models/Lora/more_details.safetensors")
-            pipe.fuse_lora(lora_scale=1.)
-            print("Loaded more_details LoRA")
-        else:
-            print("Warning: more_details.safetensors not found, skipping...")
+        for lora_path, lora_scale in self.LORAS:
+            if os.path.exists(lora_path):
+                pipe.load_lora_weights(lora_path)
+                pipe.fuse_lora(lora_scale=lora_scale)
+                print(f"Loaded {os.path.basename(lora_path)} LoRA")
+            else:
+                print(f"Warning: {os.path.basename(lora_path)} not found, skipping...")
         
         pipe.scheduler = DDIMScheduler.from_config(pipe.scheduler.config)
-        pipe.enable_freeu(s1=0.9, s2=0.2, b1=1.3, b2=1.4)
+        pipe.enable_freeu(**self.FREEU)
         return pipe
 
     def __call__(self, *args, **kwargs):
         return self.pipe(*args, **kwargs)
 
+    def model_stamp(self):
+        """Model files (path, size, mtime) and LoRA scales that shape the output, for cache keys"""
+        def stamp(path):
+            if not os.path.exists(path):
+                return None
+            stat = os.stat(path)
+            return path, stat.st_size, stat.st_mtime_ns
+
+        return {
+            'files': [stamp(path) for path in [self.CONTROLNET_PATH, self.MODEL_PATH, self.VAE_PATH] + self.EMBEDDING_PATHS],
+            'loras': [(stamp(path), scale) for path, scale in self.LORAS],
+            'scheduler': 'DDIMScheduler',
+            'freeu': self.FREEU,
+        }
+
 class LazyRealESRGAN:
     def __init__(self, device, scale):
         self.device = device
@@ -297,25 +219,13 @@ def prepare_image(input_image, resolution, hdr):
 def process_image(input_path, output_path):
     print("Starting image processing...")
     
-    # Load input image
-    input_image = Image.open(input_path).convert("RGB")
-    print(f"Loaded image: {input_image.size}")
-    
-    torch.cuda.empty_cache()
-    
     # Fixed parameters
     resolution = 512
     num_inference_steps = 20
     strength = 0.4  # Increased from 0.4 for more effect
     hdr = 0
     guidance_scale = 3  # Increased from 3 for better guidance
-    
-    condition_image = prepare_image(input_image, resolution, hdr)
-    
-    # Debug: Save condition image
-    debug_path = output_path.replace('.', '_condition.')
-    condition_image.save(debug_path)
-    print(f"Saved condition image to: {debug_path}")
+    seed = 0
     
     prompt = "masterpiece, best quality, highres"
     
@@ -329,9 +239,35 @@ def process_image(input_path, output_path):
         
     negative_prompt = ", ".join(negative_prompt_parts)
     
+    cache_key = result_cache.key(
+        'controlnet-tile-upscale', input_path, dtype=str(dtype), models=lazy_pipe.model_stamp(),
+        resolution=resolution, hdr=hdr, prompt=prompt, negative_prompt=negative_prompt,
+        steps=num_inference_steps, strength=strength, guidance=guidance_scale, seed=seed
+    )
+    if result_cache.fetch_file(cache_key, output_path):
+        print(f"Using cached result: {output_path}")
+        return Image.open(output_path)
+    
+    # Load input image
+    input_image = Image.open(input_path).convert("RGB")
+    print(f"Loaded image: {input_image.size}")
+    
+    torch.cuda.empty_cache()
+    
+    condition_image = prepare_image(input_image, resolution, hdr)
+    
+    # Debug: Save condition image
+    debug_path = output_path.replace('.', '_condition.')
+    condition_image.save(debug_path)
+    print(f"Saved condition image to: {debug_path}")
+    
+    prompt_embeds, negative_prompt_embeds = lazy_pipe.encode_prompt(
+        prompt, negative_prompt, do_classifier_free_guidance=guidance_scale > 1.0
+    )
+    
     options = {
-        "prompt": prompt,
-        "negative_prompt": negative_prompt,
+        "prompt_embeds": prompt_embeds,
+        "negative_prompt_embeds": negative_prompt_embeds,
         "image": condition_image,
         "control_image": condition_image,
         "width": condition_image.size[0],
@@ -339,7 +275,7 @@ def process_image(input_path, output_path):
         "strength": strength,
         "num_inference_steps": num_inference_steps,
         "guidance_scale": guidance_scale,
-        "generator": torch.Generator(device=device).manual_seed(0),
+        "generator": torch.Generator(device=device).manual_seed(seed),
     }
     
     print(f"Running inference on {device} with {dtype}...")
@@ -358,6 +294,7 @@ def process_image(input_path, output_path):
     
     # Save result
     result.save(output_path)
+    result_cache.store_file(cache_key, output_path)
     print(f"Image processing completed successfully! Saved to: {output_path}")
     
     return result
@@ -432,11 +369,11 @@ def analyze_images(image_files):
     
     return analysis_result
 
-def process_missing_person_case(case_id):
+def process_missing_person_case(case_id, s3_handler=None):
     """Process a single missing person case"""
     print(f"\n=== Processing case: {case_id} ===")
     
-    s3_handler = S3Handler()
+    s3_handler = s3_handler or S3Handler()
     
     # Create temporary directory for this case
     with tempfile.TemporaryDirectory() as temp_dir:
@@ -501,8 +438,12 @@ def process_all_cases():
     
     # Process each case
     for case_id in cases:
+        if s3_handler.case_output_exists(case_id):
+            print(f"Skipping {case_id}: output already exists")
+            continue
+
         try:
-            process_missing_person_case(case_id)
+            process_missing_person_case(case_id, s3_handler)
         except Exception as e:
             print(f"Error processing case {case_id}: {e}")
             continue
@@ -1,8 +1,6 @@
 import os
 import time
 import json
-import boto3
-from botocore.exceptions import ClientError
 import tempfile
 import base64
 import requests
@@ -17,19 +15,25 @@ from diffusers import FluxFillPipeline
 
 # Import configurations
 try:
-    from config import S3_CONFIG, GMS_CONFIG
+    from config import GMS_CONFIG
 except ImportError:
     import sys
     print("Error: config.py file not found!")
-    print("Please create config.py with S3_CONFIG and GMS_CONFIG")
+    print("Please create config.py with GMS_CONFIG")
     sys.exit(1)
 
+from s3_io import S3Handler
+from result_cache import get_result_cache
+from stage_scheduler import StageJob, run_case, run_cases
+
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 dtype = torch.bfloat16 if torch.cuda.is_available() else torch.float32
 
 print(f"Using device: {device}")
 print(f"Using dtype: {dtype}")
 
+result_cache = get_result_cache()
+
 
 class GMSAPIClient:
     """GMS API Client for GPT-4o Vision OCR"""
@@ -99,6 +103,12 @@ class GMSAPIClient:
             "max_tokens": 600
         }
 
+        cache_key = result_cache.key('gms-appearance', payload)
+        cached = result_cache.fetch_json(cache_key)
+        if cached is not None:
+            print("  → Appearance (cached)")
+            return cached
+
         try:
             response = requests.post(
                 f"{self.base_url}/chat/completions",
@@ -117,6 +127,7 @@ class GMSAPIClient:
 
             appearance_data = json.loads(text_content)
             print(f"  → Clothing: {appearance_data.get('clothing_upper', 'N/A')} / {appearance_data.get('clothing_lower', 'N/A')}")
+            result_cache.store_json(cache_key, appearance_data)
             return appearance_data
         except Exception as e:
             print(f"Error analyzing appearance: {e}")
@@ -162,6 +173,12 @@ class GMSAPIClient:
             "max_tokens": 500
         }
 
+        cache_key = result_cache.key('gms-portrait-description', payload)
+        cached = result_cache.fetch_json(cache_key)
+        if cached is not None:
+            print("  → Info (cached)")
+            return cached
+
         try:
             response = requests.post(
                 f"{self.base_url}/chat/completions",
@@ -180,95 +197,17 @@ class GMSAPIClient:
 
             basic_data = json.loads(text_content)
             print(f"  → Info: {basic_data.get('gender', '')} {basic_data.get('age', '')} {basic_data.get('height', '')}")
+            result_cache.store_json(cache_key, basic_data)
             return basic_data
         except Exception as e:
             print(f"Error extracting: {e}")
             return {}
 
 
-class S3Handler:
-    def __init__(self):
-        self.s3_client = boto3.client(
-            's3',
-            region_name=S3_CONFIG['region_name'],
-            aws_access_key_id=S3_CONFIG['access_key_id'],
-            aws_secret_access_key=S3_CONFIG['secret_access_key']
-        )
-        self.bucket_name = S3_CONFIG['bucket_name']
-
-    def list_missing_person_cases(self):
-        try:
-            response = self.s3_client.list_objects_v2(
-                Bucket=self.bucket_name,
-                Prefix='input/',
-                Delimiter='/'
-            )
-
-            cases = []
-            if 'CommonPrefixes' in response:
-                for prefix in response['CommonPrefixes']:
-                    folder_name = prefix['Prefix'].replace('input/', '').replace('/', '')
-                    if folder_name.startswith('missing-person-'):
-                        cases.append(folder_name)
-
-            return cases
-        except ClientError as e:
-            print(f"Error listing cases: {e}")
-            return []
-
-    def download_case_images(self, case_id, local_temp_dir):
-        try:
-            case_dir = os.path.join(local_temp_dir, case_id)
-            os.makedirs(case_dir, exist_ok=True)
-
-            response = self.s3_client.list_objects_v2(
-                Bucket=self.bucket_name,
-                Prefix=f'input/{case_id}/'
-            )
-
-            downloaded_files = []
-            if 'Contents' in response:
-                for obj in response['Contents']:
-                    key = obj['Key']
-                    if key.endswith('/'):
-                        continue
-
-                    filename = os.path.basename(key)
-                    local_path = os.path.join(case_dir, filename)
-
-                    self.s3_client.download_file(self.bucket_name, key, local_path)
-                    downloaded_files.append(local_path)
-                    print(f"Downloaded: {key}")
-
-            downloaded_files.sort()
-            return downloaded_files
-        except ClientError as e:
-            print(f"Error downloading: {e}")
-            return []
-
-    def upload_processed_results(self, case_id, enhanced_image_path, analysis_json):
-        try:
-            enhanced_key = f'output/{case_id}/enhanced_image.jpg'
-            self.s3_client.upload_file(enhanced_image_path, self.bucket_name, enhanced_key)
-            print(f"Uploaded: {enhanced_key}")
-
-            json_key = f'output/{case_id}/analysis_result.json'
-            json_content = json.dumps(analysis_json, indent=2, ensure_ascii=False)
-            self.s3_client.put_object(
-                Bucket=self.bucket_name,
-                Key=json_key,
-                Body=json_content.encode('utf-8'),
-                ContentType='application/json'
-            )
-            print(f"Uploaded: {json_key}")
-
-            return True
-        except ClientError as e:
-            print(f"Error uploading: {e}")
-            return False
-
-
 class LazyFluxFillPipeline:
+    MODEL_ID = "black-forest-labs/FLUX.1-Fill-dev"
+    MODEL_REVISION = None  # hub commit; pin it so cached results follow the weights
+
     def __init__(self):
         self.pipe = None
 
@@ -277,7 +216,8 @@ class LazyFluxFillPipeline:
             print("Loading FLUX.1-Fill-dev pipeline...")
             # Token already configured via 'huggingface-cli login'
             self.pipe = FluxFillPipeline.from_pretrained(
-                "black-forest-labs/FLUX.1-Fill-dev",
+                self.MODEL_ID,
+                revision=self.MODEL_REVISION,
                 torch_dtype=dtype
             )
             self.pipe.to(device)
@@ -479,42 +419,82 @@ def create_outpainting_canvas_and_mask(face_image, target_size=(1024, 1536)):
     return canvas, mask
 
 
-def generate_fullbody_with_flux_fill(face_image, prompt_data, output_path):
-    """Generate full body portrait using FLUX.1-Fill outpainting"""
-    print("Generating full-body portrait with FLUX.1-Fill...")
+OUTPAINT_SIZE = (1024, 1536)
+
+
+def generate_fullbody_with_flux_fill_batch(jobs):
+    """
+    Generate full body portraits for several cases in one FLUX.1-Fill call
+
+    Args:
+        jobs: List of (face_image, prompt_data, output_path)
+    Returns:
+        List of result images, in job order
+    """
+    print(f"Generating {len(jobs)} full-body portrait(s) with FLUX.1-Fill...")
+
+    num_inference_steps = 30
+    guidance_scale = 30
+    max_sequence_length = 512
+    seed = 42
+
+    results = [None] * len(jobs)
+    pending = []  # (index, cache_key, canvas, mask, prompt)
+    for index, (face_image, prompt_data, output_path) in enumerate(jobs):
+        # The canvas and mask carry the face and its layout, so they key the result
+        canvas, mask = create_outpainting_canvas_and_mask(face_image, target_size=OUTPAINT_SIZE)
+        prompt = prompt_data['prompt']
+        cache_key = result_cache.key(
+            'flux-fill-outpaint', canvas, mask,
+            model=lazy_flux_fill_pipe.MODEL_ID, revision=lazy_flux_fill_pipe.MODEL_REVISION, dtype=str(dtype),
+            prompt=prompt, steps=num_inference_steps, guidance=guidance_scale,
+            max_sequence_length=max_sequence_length, seed=seed
+        )
+        if result_cache.fetch_file(cache_key, output_path):
+            print("  → Generated (cached)")
+            results[index] = Image.open(output_path)
+        else:
+            print(f"  → Prompt: {prompt[:100]}...")
+            pending.append((index, cache_key, canvas, mask, prompt))
+
+    if not pending:
+        return results
 
     # Load pipeline
     lazy_flux_fill_pipe.load()
 
-    # Create canvas and mask for outpainting
-    canvas, mask = create_outpainting_canvas_and_mask(face_image, target_size=(1024, 1536))
+    # Generate with FLUX.1-Fill (every sample keeps its own seeded generator)
+    images = lazy_flux_fill_pipe.pipe(
+        prompt=[prompt for _, _, _, _, prompt in pending],
+        image=[canvas for _, _, canvas, _, _ in pending],
+        mask_image=[mask for _, _, _, mask, _ in pending],
+        num_inference_steps=num_inference_steps,
+        guidance_scale=guidance_scale,
+        max_sequence_length=max_sequence_length,
+        generator=[torch.Generator(device=device).manual_seed(seed) for _ in pending]
+    ).images
 
-    print(f"  → Prompt: {prompt_data['prompt'][:100]}...")
+    for (index, cache_key, _, _, _), result in zip(pending, images):
+        output_path = jobs[index][2]
+        result.save(output_path)
+        result_cache.store_file(cache_key, output_path)
+        print(f"  → Generated: {result.size}")
+        results[index] = result
 
-    # Generate with FLUX.1-Fill
-    result = lazy_flux_fill_pipe.pipe(
-        prompt=prompt_data['prompt'],
-        image=canvas,
-        mask_image=mask,
-        num_inference_steps=30,
-        guidance_scale=30,
-        max_sequence_length=512,
-        generator=torch.Generator(device=device).manual_seed(42)
-    ).images[0]
+    return results
 
-    result.save(output_path)
-    print(f"  → Generated: {result.size}")
 
-    return result
+def generate_fullbody_with_flux_fill(face_image, prompt_data, output_path):
+    """Generate full body portrait using FLUX.1-Fill outpainting"""
+    return generate_fullbody_with_flux_fill_batch([(face_image, prompt_data, output_path)])[0]
 
 
-def process_missing_person_case_flux_outpaint(case_id):
-    """Process case with FLUX.1-Fill outpainting"""
+def flux_outpaint_case_steps(case_id, s3_handler):
+    """Case steps for the stage scheduler; yields the FLUX.1-Fill stage"""
     print(f"\n{'='*60}")
     print(f"Processing: {case_id} (FLUX OUTPAINTING)")
     print(f"{'='*60}\n")
 
-    s3_handler = S3Handler()
     gms_client = GMSAPIClient()
 
     with tempfile.TemporaryDirectory() as temp_dir:
@@ -551,10 +531,12 @@ def process_missing_person_case_flux_outpaint(case_id):
 
         # Step 6: Generate full body with FLUX.1-Fill outpainting
         final_output = os.path.join(temp_dir, "final_result.jpg")
-        result_image = generate_fullbody_with_flux_fill(
-            cropped_face,
-            prompt_data,
-            final_output
+        result_image = yield StageJob(
+            generate_fullbody_with_flux_fill,
+            (cropped_face, prompt_data, final_output),
+            batch_fn=generate_fullbody_with_flux_fill_batch,
+            group=OUTPAINT_SIZE,
+            pixels=OUTPAINT_SIZE[0] * OUTPAINT_SIZE[1]
         )
 
         # Step 7: Analysis result
@@ -585,6 +567,11 @@ def process_missing_person_case_flux_outpaint(case_id):
         return success
 
 
+def process_missing_person_case_flux_outpaint(case_id, s3_handler=None):
+    """Process case with FLUX.1-Fill outpainting"""
+    return run_case(flux_outpaint_case_steps(case_id, s3_handler or S3Handler()))
+
+
 def process_all_cases_flux():
     """Process all cases with FLUX outpainting"""
     s3_handler = S3Handler()
@@ -596,16 +583,20 @@ def process_all_cases_flux():
 
     print(f"Found {len(cases)} cases")
 
+    pending = []
     for case_id in cases:
-        try:
-            process_missing_person_case_flux_outpaint(case_id)
-        except Exception as e:
-            print(f"Error: {case_id}: {e}")
-            import traceback
-            traceback.print_exc()
+        if s3_handler.case_output_exists(case_id):
+            print(f"Skipping {case_id}: output already exists")
             continue
+        pending.append(case_id)
+
+    # Pending cases run together so the FLUX.1-Fill stage is batched across cases
+    results = run_cases({case_id: flux_outpaint_case_steps(case_id, s3_handler) for case_id in pending})
+    failed = [case_id for case_id in pending if not results.get(case_id)]
 
-    print(f"\nCompleted all {len(cases)} cases")
+    print(f"\nCompleted {len(pending) - len(failed)}/{len(pending)} pending cases ({len(cases)} total)")
+    if failed:
+        print(f"Failed cases: {', '.join(failed)}")
 
 
 if __name__ == "__main__":
@@ -1,8 +1,6 @@
 import os
 import time
 import json
-import boto3
-from botocore.exceptions import ClientError
 import tempfile
 import base64
 import requests
@@ -18,19 +16,24 @@ from RealESRGAN import RealESRGAN
 
 # Import configurations
 try:
-    from config import S3_CONFIG, GMS_CONFIG
+    from config import GMS_CONFIG
 except ImportError:
     import sys
     print("Error: config.py file not found!")
     print("Please create config.py file with S3_CONFIG and GMS_CONFIG dictionaries")
     sys.exit(1)
 
+from s3_io import S3Handler
+from result_cache import get_result_cache
+
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 dtype = torch.float16 if torch.cuda.is_available() else torch.float32
 
 print(f"Using device: {device}")
 print(f"Using dtype: {dtype}")
 
+result_cache = get_result_cache()
+
 
 class GMSAPIClient:
     """GMS API Client for GPT-4o Vision OCR"""
@@ -103,6 +106,12 @@ class GMSAPIClient:
             "max_tokens": 800
         }
 
+        cache_key = result_cache.key('gms-portrait-description', payload)
+        cached = result_cache.fetch_json(cache_key)
+        if cached is not None:
+            print(f"  → Extracted prompt (cached): {cached.get('prompt', 'N/A')}")
+            return cached
+
         try:
             response = requests.post(
                 f"{self.base_url}/chat/completions",
@@ -122,6 +131,7 @@ class GMSAPIClient:
 
             extracted_data = json.loads(text_content)
             print(f"  → Extracted prompt: {extracted_data.get('prompt', 'N/A')}")
+            result_cache.store_json(cache_key, extracted_data)
             return extracted_data
         except Exception as e:
             print(f"Error extracting portrait description: {e}")
@@ -132,92 +142,6 @@ class GMSAPIClient:
             }
 
 
-class S3Handler:
-    def __init__(self):
-        self.s3_client = boto3.client(
-            's3',
-            region_name=S3_CONFIG['region_name'],
-            aws_access_key_id=S3_CONFIG['access_key_id'],
-            aws_secret_access_key=S3_CONFIG['secret_access_key']
-        )
-        self.bucket_name = S3_CONFIG['bucket_name']
-
-    def list_missing_person_cases(self):
-        """List all missing person case folders in input directory"""
-        try:
-            response = self.s3_client.list_objects_v2(
-                Bucket=self.bucket_name,
-                Prefix='input/',
-                Delimiter='/'
-            )
-
-            cases = []
-            if 'CommonPrefixes' in response:
-                for prefix in response['CommonPrefixes']:
-                    folder_name = prefix['Prefix'].replace('input/', '').replace('/', '')
-                    if folder_name.startswith('missing-person-'):
-                        cases.append(folder_name)
-
-            return cases
-        except ClientError as e:
-            print(f"Error listing cases: {e}")
-            return []
-
-    def download_case_images(self, case_id, local_temp_dir):
-        """Download all images for a specific missing person case"""
-        try:
-            case_dir = os.path.join(local_temp_dir, case_id)
-            os.makedirs(case_dir, exist_ok=True)
-
-            response = self.s3_client.list_objects_v2(
-                Bucket=self.bucket_name,
-                Prefix=f'input/{case_id}/'
-            )
-
-            downloaded_files = []
-            if 'Contents' in response:
-                for obj in response['Contents']:
-                    key = obj['Key']
-                    if key.endswith('/'):
-                        continue
-
-                    filename = os.path.basename(key)
-                    local_path = os.path.join(case_dir, filename)
-
-                    self.s3_client.download_file(self.bucket_name, key, local_path)
-                    downloaded_files.append(local_path)
-                    print(f"Downloaded: {key}")
-
-            # Sort files to ensure first = face, last = text
-            downloaded_files.sort()
-            return downloaded_files
-        except ClientError as e:
-            print(f"Error downloading case {case_id}: {e}")
-            return []
-
-    def upload_processed_results(self, case_id, enhanced_image_path, analysis_json):
-        """Upload processed results to output folder"""
-        try:
-            enhanced_key = f'output/{case_id}/enhanced_image.jpg'
-            self.s3_client.upload_file(enhanced_image_path, self.bucket_name, enhanced_key)
-            print(f"Uploaded: {enhanced_key}")
-
-            json_key = f'output/{case_id}/analysis_result.json'
-            json_content = json.dumps(analysis_json, indent=2, ensure_ascii=False)
-            self.s3_client.put_object(
-                Bucket=self.bucket_name,
-                Key=json_key,
-                Body=json_content.encode('utf-8'),
-                ContentType='application/json'
-            )
-            print(f"Uploaded: {json_key}")
-
-            return True
-        except ClientError as e:
-            print(f"Error uploading results: {e}")
-            return False
-
-
 class LazyRealESRGAN:
     def __init__(self, device, scale):
         self.device = device
@@ -242,6 +166,9 @@ class LazyRealESRGAN:
 
 
 class LazyInpaintingPipeline:
+    MODEL_ID = "diffusers/stable-diffusion-xl-1.0-inpainting-0.1"
+    MODEL_REVISION = None  # hub commit; pin it so cached results follow the weights
+
     def __init__(self):
         self.pipe = None
 
@@ -250,7 +177,8 @@ class LazyInpaintingPipeline:
             print("Loading SDXL Inpainting pipeline...")
             # Using best quality SDXL Inpainting model
             self.pipe = AutoPipelineForInpainting.from_pretrained(
-                "diffusers/stable-diffusion-xl-1.0-inpainting-0.1",
+                self.MODEL_ID,
+                revision=self.MODEL_REVISION,
                 torch_dtype=dtype,
                 variant="fp16" if dtype == torch.float16 else None
             )
@@ -269,9 +197,15 @@ lazy_inpainting_pipe = LazyInpaintingPipeline()
 def upscale_image(image_path, output_path):
     """Upscale image using RealESRGAN"""
     print(f"Upscaling: {os.path.basename(image_path)}")
+    cache_key = result_cache.key('realesrgan', image_path, model='RealESRGAN_x4')
+    if result_cache.fetch_file(cache_key, output_path):
+        print("  → Upscaled (cached)")
+        return Image.open(output_path)
+
     image = Image.open(image_path).convert("RGB")
     upscaled = lazy_realesrgan_x4.predict(image)
     upscaled.save(output_path)
+    result_cache.store_file(cache_key, output_path)
     print(f"  → Upscaled to: {upscaled.size}")
     return upscaled
 
@@ -331,14 +265,31 @@ def generate_portrait_with_inpainting(face_image_path, mask_image, prompt_data,
     """Generate full body portrait using SDXL Inpainting while preserving face"""
     print("Generating portrait with SDXL Inpainting...")
 
+    target_size = 1024  # SDXL works best with 1024x1024 or similar
+    num_inference_steps = 30
+    guidance_scale = 7.5
+    strength = 0.85  # High strength to generate body
+    seed = 42
+
+    cache_key = result_cache.key(
+        'sdxl-inpaint', face_image_path, mask_image,
+        model=lazy_inpainting_pipe.MODEL_ID, revision=lazy_inpainting_pipe.MODEL_REVISION,
+        scheduler='DPMSolverMultistepScheduler', dtype=str(dtype),
+        prompt=prompt_data['prompt'], negative_prompt=prompt_data['negative_prompt'],
+        target_size=target_size, steps=num_inference_steps, guidance=guidance_scale,
+        strength=strength, seed=seed
+    )
+    if result_cache.fetch_file(cache_key, output_path):
+        print("  → Portrait (cached)")
+        return Image.open(output_path)
+
     # Load pipeline
     lazy_inpainting_pipe.load()
 
     # Load face image
     face_image = Image.open(face_image_path).convert("RGB")
 
-    # Resize for SDXL (works best with 1024x1024 or similar)
-    target_size = 1024
+    # Resize for SDXL
     aspect_ratio = face_image.size[0] / face_image.size[1]
 
     if aspect_ratio > 1:
@@ -361,26 +312,27 @@ def generate_portrait_with_inpainting(face_image_path, mask_image, prompt_data,
         negative_prompt=prompt_data['negative_prompt'],
         image=face_image_resized,
         mask_image=mask_resized,
-        num_inference_steps=30,
-        guidance_scale=7.5,
-        strength=0.85,  # High strength to generate body
-        generator=torch.Generator(device=device).manual_seed(42)
+        num_inference_steps=num_inference_steps,
+        guidance_scale=guidance_scale,
+        strength=strength,
+        generator=torch.Generator(device=device).manual_seed(seed)
     ).images[0]
 
     # Save result
     result.save(output_path)
+    result_cache.store_file(cache_key, output_path)
     print(f"  → Portrait generated: {result.size}")
 
     return result
 
 
-def process_missing_person_case_inpainting(case_id):
+def process_missing_person_case_inpainting(case_id, s3_handler=None):
     """Process missing person case with inpainting approach"""
     print(f"\n{'='*60}")
     print(f"Processing case: {case_id} (INPAINTING PIPELINE)")
     print(f"{'='*60}\n")
 
-    s3_handler = S3Handler()
+    s3_handler = s3_handler or S3Handler()
     gms_client = GMSAPIClient()
 
     with tempfile.TemporaryDirectory() as temp_dir:
@@ -460,8 +412,12 @@ def process_all_cases_inpainting():
     print(f"Found {len(cases)} cases")
 
     for case_id in cases:
+        if s3_handler.case_output_exists(case_id):
+            print(f"Skipping {case_id}: output already exists")
+            continue
+
         try:
-            process_missing_person_case_inpainting(case_id)
+            process_missing_person_case_inpainting(case_id, s3_handler)
         except Exception as e:
             print(f"Error processing {case_id}: {e}")
             import traceback
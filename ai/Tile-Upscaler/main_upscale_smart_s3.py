@@ -1,8 +1,6 @@
 import os
 import time
 import json
-import boto3
-from botocore.exceptions import ClientError
 import tempfile
 import base64
 import requests
@@ -17,7 +15,7 @@ from RealESRGAN import RealESRGAN
 
 # Import configurations
 try:
-    from config import S3_CONFIG, GMS_CONFIG
+    from config import GMS_CONFIG
 except ImportError:
     import sys
     print("Error: config.py file not found!")
@@ -25,12 +23,17 @@ except ImportError:
     print("You can copy config.example.py and fill in your credentials")
     sys.exit(1)
 
+from s3_io import S3Handler
+from result_cache import get_result_cache
+
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 dtype = torch.float16 if torch.cuda.is_available() else torch.float32
 
 print(f"Using device: {device}")
 print(f"Using dtype: {dtype}")
 
+result_cache = get_result_cache()
+
 
 class GMSAPIClient:
     """GMS API Client for GPT-4o Vision and DALL-E-3"""
@@ -98,6 +101,13 @@ class GMSAPIClient:
             "max_tokens": 10
         }
 
+        # The payload carries the (resized) image, model and prompt, so it is the fingerprint
+        cache_key = result_cache.key('gms-classify', payload)
+        cached = result_cache.fetch_json(cache_key)
+        if cached is not None:
+            print(f"  → Classification (cached): {cached}")
+            return cached
+
         try:
             response = requests.post(
                 f"{self.base_url}/chat/completions",
@@ -109,6 +119,7 @@ class GMSAPIClient:
             result = response.json()
             classification = result['choices'][0]['message']['content'].strip().lower()
             print(f"  → Classification: {classification}")
+            result_cache.store_json(cache_key, classification)
             return classification
         except Exception as e:
             print(f"Error classifying image: {e}")
@@ -157,6 +168,12 @@ class GMSAPIClient:
             "max_tokens": 500
         }
 
+        cache_key = result_cache.key('gms-extract-text', payload)
+        cached = result_cache.fetch_json(cache_key)
+        if cached is not None:
+            print(f"  → Extracted data (cached): {cached}")
+            return cached
+
         try:
             response = requests.post(
                 f"{self.base_url}/chat/completions",
@@ -176,6 +193,7 @@ class GMSAPIClient:
 
             extracted_data = json.loads(text_content)
             print(f"  → Extracted data: {extracted_data}")
+            result_cache.store_json(cache_key, extracted_data)
             return extracted_data
         except Exception as e:
             print(f"Error extracting text: {e}")
@@ -212,6 +230,11 @@ class GMSAPIClient:
             "n": 1
         }
 
+        cache_key = result_cache.key('dalle-portrait', payload)
+        if result_cache.fetch_file(cache_key, output_path):
+            print(f"  → Portrait (cached) saved to: {output_path}")
+            return True
+
         try:
             response = requests.post(
                 f"{self.base_url}/images/generations",
@@ -230,6 +253,7 @@ class GMSAPIClient:
             # Save image
             image = Image.open(BytesIO(img_response.content))
             image.save(output_path)
+            result_cache.store_file(cache_key, output_path)
             print(f"  → Portrait generated and saved to: {output_path}")
             return True
         except Exception as e:
@@ -237,90 +261,6 @@ class GMSAPIClient:
             return False
 
 
-class S3Handler:
-    def __init__(self):
-        self.s3_client = boto3.client(
-            's3',
-            region_name=S3_CONFIG['region_name'],
-            aws_access_key_id=S3_CONFIG['access_key_id'],
-            aws_secret_access_key=S3_CONFIG['secret_access_key']
-        )
-        self.bucket_name = S3_CONFIG['bucket_name']
-
-    def list_missing_person_cases(self):
-        """List all missing person case folders in input directory"""
-        try:
-            response = self.s3_client.list_objects_v2(
-                Bucket=self.bucket_name,
-                Prefix='input/',
-                Delimiter='/'
-            )
-
-            cases = []
-            if 'CommonPrefixes' in response:
-                for prefix in response['CommonPrefixes']:
-                    folder_name = prefix['Prefix'].replace('input/', '').replace('/', '')
-                    if folder_name.startswith('missing-person-'):
-                        cases.append(folder_name)
-
-            return cases
-        except ClientError as e:
-            print(f"Error listing cases: {e}")
-            return []
-
-    def download_case_images(self, case_id, local_temp_dir):
-        """Download all images for a specific missing person case"""
-        try:
-            case_dir = os.path.join(local_temp_dir, case_id)
-            os.makedirs(case_dir, exist_ok=True)
-
-            response = self.s3_client.list_objects_v2(
-                Bucket=self.bucket_name,
-                Prefix=f'input/{case_id}/'
-            )
-
-            downloaded_files = []
-            if 'Contents' in response:
-                for obj in response['Contents']:
-                    key = obj['Key']
-                    if key.endswith('/'):
-                        continue
-
-                    filename = os.path.basename(key)
-                    local_path = os.path.join(case_dir, filename)
-
-                    self.s3_client.download_file(self.bucket_name, key, local_path)
-                    downloaded_files.append(local_path)
-                    print(f"Downloaded: {key} -> {local_path}")
-
-            return downloaded_files
-        except ClientError as e:
-            print(f"Error downloading case {case_id}: {e}")
-            return []
-
-    def upload_processed_results(self, case_id, enhanced_image_path, analysis_json):
-        """Upload processed results to output folder"""
-        try:
-            enhanced_key = f'output/{case_id}/enhanced_image.jpg'
-            self.s3_client.upload_file(enhanced_image_path, self.bucket_name, enhanced_key)
-            print(f"Uploaded enhanced image: {enhanced_key}")
-
-            json_key = f'output/{case_id}/analysis_result.json'
-            json_content = json.dumps(analysis_json, indent=2, ensure_ascii=False)
-            self.s3_client.put_object(
-                Bucket=self.bucket_name,
-                Key=json_key,
-                Body=json_content.encode('utf-8'),
-                ContentType='application/json'
-            )
-            print(f"Uploaded analysis JSON: {json_key}")
-
-            return True
-        except ClientError as e:
-            print(f"Error uploading results for case {case_id}: {e}")
-            return False
-
-
 class LazyRealESRGAN:
     def __init__(self, device, scale):
         self.device = device
@@ -357,12 +297,18 @@ def upscale_image(image_path, output_path, target_size=2048):
 
     scale = 2 if min(H, W) <= 1024 else 4
 
+    cache_key = result_cache.key('realesrgan', image_path, model=f'RealESRGAN_x{scale}')
+    if result_cache.fetch_file(cache_key, output_path):
+        print("  → Upscaled (cached)")
+        return output_path
+
     if scale == 2:
         upscaled = lazy_realesrgan_x2.predict(image)
     else:
         upscaled = lazy_realesrgan_x4.predict(image)
 
     upscaled.save(output_path)
+    result_cache.store_file(cache_key, output_path)
     print(f"  → Upscaled to: {upscaled.size}")
     return output_path
 
@@ -411,13 +357,13 @@ def composite_face_on_portrait(face_image_path, portrait_image_path, output_path
         return False
 
 
-def process_missing_person_case_smart(case_id):
+def process_missing_person_case_smart(case_id, s3_handler=None):
     """Smart processing pipeline for missing person case"""
     print(f"\n{'='*60}")
     print(f"Processing case: {case_id} (SMART PIPELINE)")
     print(f"{'='*60}\n")
 
-    s3_handler = S3Handler()
+    s3_handler = s3_handler or S3Handler()
     gms_client = GMSAPIClient()
 
     with tempfile.TemporaryDirectory() as temp_dir:
@@ -560,8 +506,12 @@ def process_all_cases_smart():
     print(f"Found {len(cases)} missing person cases: {cases}")
 
     for case_id in cases:
+        if s3_handler.case_output_exists(case_id):
+            print(f"Skipping {case_id}: output already exists")
+            continue
+
         try:
-            process_missing_person_case_smart(case_id)
+            process_missing_person_case_smart(case_id, s3_handler)
         except Exception as e:
             print(f"Error processing case {case_id}: {e}")
             import traceback
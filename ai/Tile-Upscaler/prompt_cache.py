@@ -0,0 +1,61 @@
+"""
+Prompt embedding cache shared by the LazyLoadPipeline classes
+
+The tile upscalers encode the same prompt / negative prompt for every tile
+and every image. PromptEmbeddingCache encodes them once per
+(prompt, negative prompt, loaded textual-inversion / LoRA set) and hands the
+cached prompt_embeds / negative_prompt_embeds to the pipeline.
+
+Usage:
+
+    class LazyLoadPipeline(PromptEmbeddingCache):
+        def __init__(self):
+            self.pipe = None
+            super().__init__()
+"""
+
+import torch
+
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+PROMPT_CACHE_SIZE = 16
+
+
+class PromptEmbeddingCache:
+    def __init__(self):
+        self._prompt_embeds = {}
+
+    def adapter_state(self):
+        """Textual-inversion tokens and LoRA adapters currently applied to the pipeline"""
+        tokens = tuple(sorted(getattr(self.pipe.tokenizer, "added_tokens_encoder", {})))
+        try:
+            loras = tuple(sorted((name, tuple(adapters)) for name, adapters in self.pipe.get_list_adapters().items()))
+        except (ValueError, AttributeError):
+            # PEFT backend not available / no adapters loaded
+            loras = ()
+        return tokens, loras, getattr(self.pipe, "num_fused_loras", None)
+
+    def invalidate_prompt_cache(self):
+        """Drop cached embeddings (e.g. after re-fusing a LoRA at a different scale)"""
+        self._prompt_embeds.clear()
+
+    def encode_prompt(self, prompt, negative_prompt, do_classifier_free_guidance=True):
+        """
+        prompt_embeds / negative_prompt_embeds for the pipeline, encoded once per
+        (prompt, negative prompt, loaded TI/LoRA set) and reused by every call
+        """
+        if self.pipe is None:
+            self.load()
+        key = (prompt, negative_prompt, do_classifier_free_guidance, self.adapter_state())
+        if key not in self._prompt_embeds:
+            if len(self._prompt_embeds) >= PROMPT_CACHE_SIZE:
+                self._prompt_embeds.clear()
+            with torch.no_grad():
+                self._prompt_embeds[key] = self.pipe.encode_prompt(
+                    prompt,
+                    device,
+                    num_images_per_prompt=1,
+                    do_classifier_free_guidance=do_classifier_free_guidance,
+                    negative_prompt=negative_prompt
+                )
+        return self._prompt_embeds[key]
@@ -0,0 +1,290 @@
+"""
+Long-running AMQP worker for the main_*_s3.py pipelines
+
+Consumes case-ready messages instead of listing input/ on every run:
+- models stay resident (the pipelines' lazy loaders live as long as the process)
+- a message is acked only after the results are uploaded
+- cases whose output/{case_id}/ already holds a result are acked and skipped
+- failures are rejected without requeue, so they land in the dead-letter
+  queue like the backend's own queues (see RabbitMQConfig)
+
+Message body: {"caseId": "missing-person-..."} (Jackson default), {"case_id": ...}
+or the bare case id.
+
+Usage:
+    python queue_worker.py smart
+    python queue_worker.py qwen-pose-tryon --prefetch 2 --concurrency 1
+
+Local testing: point AMQP_CONFIG at a throwaway broker
+(docker run -p 5672:5672 rabbitmq:3.12) and S3_CONFIG['endpoint_url'] at MinIO.
+CaseQueueWorker.handle_message has no broker dependency and can be driven directly.
+"""
+
+import json
+import signal
+import threading
+import time
+import importlib
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from config import S3_CONFIG
+except ImportError:
+    import sys
+    print("Error: config.py file not found!")
+    print("Please create config.py with S3_CONFIG and AMQP_CONFIG")
+    sys.exit(1)
+
+try:
+    from config import AMQP_CONFIG
+except ImportError:
+    AMQP_CONFIG = {}
+
+from s3_io import S3Handler
+
+# Worker name -> (module, per-case function)
+WORKERS = {
+    'upscale-v1': ('main_upscaleV1_s3', 'process_missing_person_case'),
+    'smart': ('main_upscale_smart_s3', 'process_missing_person_case_smart'),
+    'inpainting': ('main_upscale_inpainting_s3', 'process_missing_person_case_inpainting'),
+    'flux-outpaint': ('main_upscale_flux_outpaint_s3', 'process_missing_person_case_flux_outpaint'),
+    'qwen-tryon': ('main_qwen_tryon_s3', 'process_missing_person_case_tryon'),
+    'qwen-tryon-v2': ('main_qwen_tryon_v2_s3', 'process_missing_person_case_tryon_v2'),
+    'qwen-pose-tryon': ('main_qwen_pose_tryon_s3', 'process_missing_person_case_pose_tryon'),
+    'qwen-outpaint-tryon': ('main_qwen_outpaint_tryon_s3', 'process_missing_person_case_outpaint_tryon'),
+    'qwen-outpaint-tryon-v2': ('main_qwen_outpaint_tryon_s3_v2', 'process_missing_person_case_outpaint_tryon'),
+}
+
+DEFAULT_AMQP_CONFIG = {
+    'host': 'localhost',
+    'port': 5672,
+    'username': 'guest',
+    'password': 'guest',
+    'virtual_host': '/',
+    'queue': 'image-enhancement-queue',
+    'dead_letter_exchange': 'dlx',
+    'prefetch_count': 1,
+    'concurrency': 1,
+    'heartbeat': 600,
+}
+
+
+def load_process_fn(worker_name):
+    """Import a worker module (this is where its models get registered) and return its per-case function"""
+    module_name, function_name = WORKERS[worker_name]
+    module = importlib.import_module(module_name)
+    return getattr(module, function_name)
+
+
+def parse_case_id(body):
+    """Extract the case id from a message body, or None if it is not usable"""
+    if isinstance(body, bytes):
+        body = body.decode('utf-8', errors='replace')
+
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        payload = body.strip()
+
+    if isinstance(payload, dict):
+        payload = payload.get('caseId') or payload.get('case_id')
+
+    if not isinstance(payload, str):
+        return None
+    case_id = payload.strip()
+    if not case_id or '/' in case_id:
+        return None
+    return case_id
+
+
+class CaseQueueWorker:
+    """Broker-independent message handling: decide ack or reject for one message"""
+
+    def __init__(self, process_fn, s3_handler=None):
+        self.process_fn = process_fn
+        self.s3_handler = s3_handler or S3Handler(S3_CONFIG)
+        # The first case runs alone so the lazy model loaders never race
+        self._warm = threading.Event()
+        self._warm_lock = threading.Lock()
+        self.stats = {'processed': 0, 'skipped': 0, 'failed': 0, 'invalid': 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _process(self, case_id):
+        if self._warm.is_set():
+            return self.process_fn(case_id, self.s3_handler)
+        with self._warm_lock:
+            if self._warm.is_set():
+                return self.process_fn(case_id, self.s3_handler)
+            try:
+                return self.process_fn(case_id, self.s3_handler)
+            finally:
+                self._warm.set()
+
+    def handle_message(self, body):
+        """Process one message; returns True to ack, False to reject (dead-letter)"""
+        case_id = parse_case_id(body)
+        if case_id is None:
+            print(f"Rejecting malformed message: {body!r}")
+            self._count('invalid')
+            return False
+
+        start = time.time()
+        try:
+            if self.s3_handler.case_output_exists(case_id):
+                print(f"Skipping {case_id}: output already exists")
+                self._count('skipped')
+                return True
+
+            success = self._process(case_id)
+        except Exception as e:
+            print(f"Error processing case {case_id}: {e}")
+            import traceback
+            traceback.print_exc()
+            success = False
+
+        if success:
+            print(f"Case {case_id} done in {time.time() - start:.1f}s")
+            self._count('processed')
+            return True
+
+        print(f"Case {case_id} failed, sending to dead-letter queue")
+        self._count('failed')
+        return False
+
+
+class AMQPConsumer:
+    """Feeds queue messages to a CaseQueueWorker with bounded concurrency"""
+
+    def __init__(self, worker, amqp_config=None):
+        self.worker = worker
+        self.config = {**DEFAULT_AMQP_CONFIG, **AMQP_CONFIG, **(amqp_config or {})}
+        self.concurrency = max(1, int(self.config['concurrency']))
+        # Never hold fewer unacked messages than there are threads to run them
+        self.prefetch_count = max(int(self.config['prefetch_count']), self.concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='case')
+        self.connection = None
+        self.channel = None
+        self._stopping = False
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+
+    def _connect(self):
+        import pika
+
+        credentials = pika.PlainCredentials(self.config['username'], self.config['password'])
+        parameters = pika.ConnectionParameters(
+            host=self.config['host'],
+            port=self.config['port'],
+            virtual_host=self.config['virtual_host'],
+            credentials=credentials,
+            heartbeat=self.config['heartbeat'],
+            blocked_connection_timeout=300
+        )
+        self.connection = pika.BlockingConnection(parameters)
+        self.channel = self.connection.channel()
+
+        queue = self.config['queue']
+        dlx = self.config['dead_letter_exchange']
+        # Same layout as the backend queues: durable, failures routed to dlx
+        self.channel.exchange_declare(exchange=dlx, exchange_type='topic', durable=True)
+        self.channel.queue_declare(queue=queue, durable=True, arguments={
+            'x-dead-letter-exchange': dlx,
+            'x-dead-letter-routing-key': f'{queue}.dlq',
+        })
+        self.channel.basic_qos(prefetch_count=self.prefetch_count)
+        self.channel.basic_consume(queue=queue, on_message_callback=self._on_message)
+        print(f"Consuming '{queue}' on {self.config['host']}:{self.config['port']} "
+              f"(prefetch={self.prefetch_count}, concurrency={self.concurrency})")
+
+    def _on_message(self, channel, method, properties, body):
+        with self._in_flight_lock:
+            self._in_flight += 1
+        self.executor.submit(self._run, self.connection, channel, method.delivery_tag, body)
+
+    def _run(self, connection, channel, delivery_tag, body):
+        try:
+            ack = self.worker.handle_message(body)
+        except Exception as e:
+            print(f"Unexpected error handling message: {e}")
+            ack = False
+        # pika channels are not thread-safe: settle on the connection thread
+        try:
+            connection.add_callback_threadsafe(
+                functools.partial(self._settle, channel, delivery_tag, ack)
+            )
+        except Exception:
+            # Connection already gone; the broker redelivers the message
+            with self._in_flight_lock:
+                self._in_flight -= 1
+
+    def _settle(self, channel, delivery_tag, ack):
+        if channel.is_open:
+            if ack:
+                channel.basic_ack(delivery_tag=delivery_tag)
+            else:
+                channel.basic_reject(delivery_tag=delivery_tag, requeue=False)
+        with self._in_flight_lock:
+            self._in_flight -= 1
+
+    def stop(self, *args):
+        """Stop taking new messages; in-flight cases finish and are settled"""
+        self._stopping = True
+        if self.connection is not None and self.connection.is_open:
+            self.connection.add_callback_threadsafe(self.channel.stop_consuming)
+
+    def _drain(self):
+        while True:
+            with self._in_flight_lock:
+                if self._in_flight == 0:
+                    return
+            if not self.connection.is_open:
+                return
+            self.connection.process_data_events(time_limit=1)
+
+    def run(self, reconnect_delay=5):
+        import pika
+
+        while not self._stopping:
+            try:
+                self._connect()
+                self.channel.start_consuming()
+                self._drain()
+            except pika.exceptions.AMQPConnectionError as e:
+                # Unacked messages are redelivered by the broker after reconnect
+                print(f"Broker connection lost: {e}; reconnecting in {reconnect_delay}s")
+                time.sleep(reconnect_delay)
+            finally:
+                if self.connection is not None and self.connection.is_open:
+                    self.connection.close()
+
+        self.executor.shutdown(wait=True)
+        print(f"Worker stopped: {self.worker.stats}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Queue-driven missing person case worker")
+    parser.add_argument("worker", choices=sorted(WORKERS), help="Pipeline to run")
+    parser.add_argument("--queue", help="Queue name (default: AMQP_CONFIG['queue'])")
+    parser.add_argument("--prefetch", type=int, help="Unacked messages held by this worker")
+    parser.add_argument("--concurrency", type=int, help="Cases processed in parallel")
+    args = parser.parse_args()
+
+    overrides = {}
+    if args.queue:
+        overrides['queue'] = args.queue
+    if args.prefetch is not None:
+        overrides['prefetch_count'] = args.prefetch
+    if args.concurrency is not None:
+        overrides['concurrency'] = args.concurrency
+
+    consumer = AMQPConsumer(CaseQueueWorker(load_process_fn(args.worker)), overrides)
+    signal.signal(signal.SIGTERM, consumer.stop)
+    signal.signal(signal.SIGINT, consumer.stop)
+    consumer.run()
@@ -0,0 +1,277 @@
+"""
+Content-addressed cache for expensive pipeline stages
+
+Keys are a hash of the stage name, the *content* of its input images and
+the values that decide the output (model id/revision, prompt, steps,
+guidance, seed, LoRA names/weights...), so a re-run after a crash or a prompt-only
+change recomputes exactly the stages whose inputs changed.
+
+- Local disk tier with size-bounded LRU eviction (file mtime = last use)
+- Optional shared S3 tier under a prefix (read-through, write-through)
+- Failed stages are never stored
+
+RESULT_CACHE_CONFIG (optional, config.py):
+    enabled     default True
+    dir         default './cache/results'
+    max_bytes   default 20 GiB
+    s3_prefix   e.g. 'cache/results/' to share results between workers (default off)
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+try:
+    from config import RESULT_CACHE_CONFIG
+except ImportError:
+    RESULT_CACHE_CONFIG = {}
+
+# Bump to invalidate every entry after a change in how results are produced
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_DIR = './cache/results'
+DEFAULT_MAX_BYTES = 20 * 1024 ** 3
+
+
+class ResultCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES,
+                 s3_handler=None, s3_prefix=None, enabled=True):
+        self.enabled = enabled
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.s3_handler = s3_handler
+        self.s3_prefix = s3_prefix
+        self.stats = {'hits': 0, 's3_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+        self._lock = threading.Lock()
+        # (path, size, mtime) -> digest, so an input is hashed once per run
+        self._digests = OrderedDict()
+        self._total_bytes = 0
+        self._evicting = False
+
+        if self.enabled:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._total_bytes = sum(size for _, size, _ in self._scan())
+
+    # ----- keys -----
+
+    def file_digest(self, path):
+        """SHA-256 of a file's content (memoized by path, size and mtime)"""
+        stat = os.stat(path)
+        memo_key = (os.path.realpath(path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            digest = self._digests.get(memo_key)
+            if digest is not None:
+                self._digests.move_to_end(memo_key)
+                return digest
+
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+
+        with self._lock:
+            self._digests[memo_key] = digest
+            while len(self._digests) > 4096:
+                self._digests.popitem(last=False)
+        return digest
+
+    def _input_digest(self, value):
+        if isinstance(value, (str, os.PathLike)) and os.path.isfile(value):
+            return self.file_digest(value)
+        if hasattr(value, 'tobytes') and hasattr(value, 'mode') and hasattr(value, 'size'):
+            # PIL image held in memory
+            sha = hashlib.sha256(f'{value.mode}:{value.size}'.encode())
+            sha.update(value.tobytes())
+            return sha.hexdigest()
+        if isinstance(value, bytes):
+            return hashlib.sha256(value).hexdigest()
+        return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+    def key(self, stage, *inputs, **params):
+        """
+        Cache key for one stage run
+
+        Args:
+            stage: Stage name, e.g. 'realesrgan'
+            *inputs: Image paths, PIL images or bytes (hashed by content)
+            **params: Model ids, prompts, steps, seeds... (everything that changes the output)
+        """
+        material = json.dumps({
+            'version': CACHE_VERSION,
+            'stage': stage,
+            'inputs': [self._input_digest(value) for value in inputs],
+            'params': params,
+        }, sort_keys=True, default=str)
+        return f"{stage}-{hashlib.sha256(material.encode('utf-8')).hexdigest()}"
+
+    # ----- storage -----
+
+    def _path(self, name):
+        return os.path.join(self.cache_dir, os.path.splitext(name)[0][-2:], name)
+
+    def _scan(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for filename in files:
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def _write_local(self, name, data):
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            previous_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+        except OSError:
+            # e.g. disk full: don't leave a partial temp file behind
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with self._lock:
+            self._total_bytes += len(data) - previous_size
+        self._evict()
+
+    def _read_local(self, name):
+        path = self._path(name)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            pass  # evicted by another worker meanwhile; the data is still good
+        return data
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _evict(self):
+        with self._lock:
+            if self._evicting or self._total_bytes <= self.max_bytes:
+                return
+            self._evicting = True
+
+        try:
+            # Scan and sort without the lock, so digests and stats don't wait on the disk walk
+            entries = sorted(self._scan(), key=lambda entry: entry[2])
+
+            # Drop least recently used entries down to 90% of the budget
+            for path, size, _ in entries:
+                with self._lock:
+                    if self._total_bytes <= self.max_bytes * 0.9:
+                        break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                with self._lock:
+                    self._total_bytes -= size
+                    self.stats['evictions'] += 1
+        finally:
+            with self._lock:
+                self._evicting = False
+
+    def _get(self, name):
+        if not self.enabled:
+            return None
+
+        data = self._read_local(name)
+        if data is not None:
+            self._count('hits')
+            return data
+
+        if self.s3_handler is not None and self.s3_prefix:
+            try:
+                data = self.s3_handler.read_object(f'{self.s3_prefix}{name}')
+            except (ClientError, BotoCoreError) as e:
+                # The cache must never fail a case: an unreachable S3 tier is a miss
+                print(f"Warning: could not read {name} from shared result cache: {e}")
+                data = None
+            if data is not None:
+                self._count('s3_hits')
+                try:
+                    self._write_local(name, data)
+                except OSError as e:
+                    print(f"Warning: could not copy {name} into local result cache: {e}")
+                return data
+
+        self._count('misses')
+        return None
+
+    def _put(self, name, data, content_type=None):
+        if not self.enabled:
+            return
+        try:
+            self._write_local(name, data)
+            if self.s3_handler is not None and self.s3_prefix:
+                self.s3_handler.upload_bytes(data, f'{self.s3_prefix}{name}', content_type)
+            self._count('stores')
+        except (OSError, ClientError, BotoCoreError) as e:
+            # The cache must never fail a case
+            print(f"Warning: could not store {name} in result cache: {e}")
+
+    # ----- stage helpers -----
+
+    def fetch_file(self, key, output_path):
+        """Write a cached stage output to output_path; False on miss"""
+        data = self._get(key + os.path.splitext(output_path)[1].lower())
+        if data is None:
+            return False
+        with open(output_path, 'wb') as f:
+            f.write(data)
+        return True
+
+    def store_file(self, key, output_path):
+        with open(output_path, 'rb') as f:
+            self._put(key + os.path.splitext(output_path)[1].lower(), f.read())
+
+    def fetch_json(self, key):
+        """Cached JSON-serializable stage result, or None on miss"""
+        data = self._get(key + '.json')
+        return None if data is None else json.loads(data.decode('utf-8'))
+
+    def store_json(self, key, value):
+        self._put(
+            key + '.json',
+            json.dumps(value, ensure_ascii=False).encode('utf-8'),
+            'application/json'
+        )
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """Process-wide cache built from RESULT_CACHE_CONFIG"""
+    global _result_cache
+    with _result_cache_lock:
+        if _result_cache is None:
+            s3_prefix = RESULT_CACHE_CONFIG.get('s3_prefix')
+            s3_handler = None
+            if s3_prefix:
+                from s3_io import S3Handler
+                s3_handler = S3Handler()
+            _result_cache = ResultCache(
+                cache_dir=RESULT_CACHE_CONFIG.get('dir', DEFAULT_CACHE_DIR),
+                max_bytes=RESULT_CACHE_CONFIG.get('max_bytes', DEFAULT_MAX_BYTES),
+                s3_handler=s3_handler,
+                s3_prefix=s3_prefix,
+                enabled=RESULT_CACHE_CONFIG.get('enabled', True)
+            )
+        return _result_cache
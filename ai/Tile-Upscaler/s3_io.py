@@ -0,0 +1,248 @@
+"""
+Shared S3 I/O for the main_*_s3.py workers
+
+- One boto3 client per process, with a connection pool sized for the
+  transfer thread pool (boto3 clients are thread-safe, sessions are not)
+- Paginated listing (list_objects_v2 returns at most 1000 keys per call)
+- Parallel downloads/uploads on a bounded thread pool
+- Small objects fetched with a single GET into memory instead of going
+  through the multipart transfer manager
+
+Optional S3_CONFIG keys:
+    endpoint_url           local stand-in (MinIO, moto server), e.g. 'http://localhost:9000'
+    max_concurrency        parallel transfers per handler (default 8)
+    small_object_bytes     objects up to this size are read in one GET (default 8 MiB)
+"""
+
+import os
+import json
+import threading
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_SMALL_OBJECT_BYTES = 8 * 1024 * 1024
+
+# Written last by upload_processed_results, so it marks a finished case
+RESULT_MARKER = 'analysis_result.json'
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _load_default_config():
+    try:
+        from config import S3_CONFIG
+    except ImportError as e:
+        raise ImportError(
+            "config.py with S3_CONFIG not found "
+            "(copy config.example.py and fill in your credentials)"
+        ) from e
+    return S3_CONFIG
+
+
+def get_s3_client(s3_config=None):
+    """Return the process-wide S3 client for this configuration (created once)"""
+    s3_config = s3_config or _load_default_config()
+    max_concurrency = s3_config.get('max_concurrency', DEFAULT_MAX_CONCURRENCY)
+    cache_key = (
+        s3_config.get('endpoint_url'),
+        s3_config['region_name'],
+        s3_config['access_key_id'],
+        max_concurrency
+    )
+
+    with _clients_lock:
+        client = _clients.get(cache_key)
+        if client is None:
+            session = boto3.session.Session(
+                aws_access_key_id=s3_config['access_key_id'],
+                aws_secret_access_key=s3_config['secret_access_key'],
+                region_name=s3_config['region_name']
+            )
+            client = session.client(
+                's3',
+                endpoint_url=s3_config.get('endpoint_url'),
+                config=Config(
+                    # Transfer threads x multipart threads per transfer, plus listing
+                    max_pool_connections=max_concurrency * 2 + 2,
+                    retries={'max_attempts': 5, 'mode': 'adaptive'},
+                    tcp_keepalive=True
+                )
+            )
+            _clients[cache_key] = client
+        return client
+
+
+def reset_s3_clients():
+    """Drop cached clients (tests that swap endpoints between runs)"""
+    with _clients_lock:
+        _clients.clear()
+
+
+class S3Handler:
+    def __init__(self, s3_config=None, client=None):
+        s3_config = s3_config or _load_default_config()
+        self.s3_client = client or get_s3_client(s3_config)
+        self.bucket_name = s3_config['bucket_name']
+        self.max_concurrency = max(1, s3_config.get('max_concurrency', DEFAULT_MAX_CONCURRENCY))
+        self.small_object_bytes = s3_config.get('small_object_bytes', DEFAULT_SMALL_OBJECT_BYTES)
+        self.transfer_config = TransferConfig(
+            multipart_threshold=max(self.small_object_bytes, 8 * 1024 * 1024),
+            max_concurrency=2
+        )
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    @property
+    def executor(self):
+        """Bounded pool shared by all transfers of this handler (created on first use)"""
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_concurrency,
+                        thread_name_prefix='s3-io'
+                    )
+        return self._executor
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def iter_objects(self, prefix):
+        """Yield every object (dict with Key/Size) under a prefix, across pages"""
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                if not obj['Key'].endswith('/'):  # Skip directory markers
+                    yield obj
+
+    def list_prefixes(self, prefix):
+        """Immediate sub-folders of a prefix, across pages"""
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        prefixes = []
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix, Delimiter='/'):
+            for common in page.get('CommonPrefixes', []):
+                prefixes.append(common['Prefix'])
+        return prefixes
+
+    def list_missing_person_cases(self):
+        """List all missing person case folders in input directory"""
+        try:
+            cases = []
+            for prefix in self.list_prefixes('input/'):
+                folder_name = prefix.replace('input/', '').replace('/', '')
+                if folder_name.startswith('missing-person-'):
+                    cases.append(folder_name)
+            return cases
+        except ClientError as e:
+            print(f"Error listing cases: {e}")
+            return []
+
+    def case_output_exists(self, case_id):
+        """True when output/{case_id}/ already holds a complete result"""
+        try:
+            self.s3_client.head_object(
+                Bucket=self.bucket_name, Key=f'output/{case_id}/{RESULT_MARKER}'
+            )
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def read_object(self, key):
+        """Read a whole object into memory"""
+        response = self.s3_client.get_object(Bucket=self.bucket_name, Key=key)
+        return response['Body'].read()
+
+    def _download_object(self, obj, local_path):
+        if obj.get('Size', 0) <= self.small_object_bytes:
+            # One GET, no HEAD / multipart bookkeeping from the transfer manager
+            with open(local_path, 'wb') as f:
+                f.write(self.read_object(obj['Key']))
+        else:
+            self.s3_client.download_file(
+                self.bucket_name, obj['Key'], local_path, Config=self.transfer_config
+            )
+        print(f"Downloaded: {obj['Key']} -> {local_path}")
+        return local_path
+
+    def download_case_images(self, case_id, local_temp_dir):
+        """Download all images for a specific missing person case (sorted by name)"""
+        try:
+            case_dir = os.path.join(local_temp_dir, case_id)
+            os.makedirs(case_dir, exist_ok=True)
+
+            objects = list(self.iter_objects(f'input/{case_id}/'))
+            futures = [
+                self.executor.submit(
+                    self._download_object, obj,
+                    os.path.join(case_dir, os.path.basename(obj['Key']))
+                )
+                for obj in objects
+            ]
+            downloaded_files = [future.result() for future in futures]
+
+            # Sort files to ensure first = face, last = text
+            downloaded_files.sort()
+            return downloaded_files
+        except ClientError as e:
+            print(f"Error downloading case {case_id}: {e}")
+            return []
+
+    def download_case_buffers(self, case_id):
+        """Read all images of a case into memory: sorted list of (filename, BytesIO)"""
+        try:
+            objects = list(self.iter_objects(f'input/{case_id}/'))
+            futures = [self.executor.submit(self.read_object, obj['Key']) for obj in objects]
+            buffers = [
+                (os.path.basename(obj['Key']), BytesIO(future.result()))
+                for obj, future in zip(objects, futures)
+            ]
+            buffers.sort(key=lambda item: item[0])
+            return buffers
+        except ClientError as e:
+            print(f"Error downloading case {case_id}: {e}")
+            return []
+
+    def upload_file(self, local_path, key):
+        self.s3_client.upload_file(
+            local_path, self.bucket_name, key, Config=self.transfer_config
+        )
+        print(f"Uploaded: {key}")
+        return key
+
+    def upload_bytes(self, data, key, content_type=None):
+        extra = {'ContentType': content_type} if content_type else {}
+        self.s3_client.put_object(Bucket=self.bucket_name, Key=key, Body=data, **extra)
+        print(f"Uploaded: {key}")
+        return key
+
+    def upload_files(self, files):
+        """Upload (local_path, key) pairs in parallel"""
+        futures = [self.executor.submit(self.upload_file, path, key) for path, key in files]
+        return [future.result() for future in futures]
+
+    def upload_processed_results(self, case_id, enhanced_image_path, analysis_json):
+        """Upload processed results to output folder"""
+        try:
+            enhanced_key = f'output/{case_id}/enhanced_image.jpg'
+            self.upload_file(enhanced_image_path, enhanced_key)
+
+            # Written last: its presence marks a complete result
+            json_key = f'output/{case_id}/{RESULT_MARKER}'
+            json_content = json.dumps(analysis_json, indent=2, ensure_ascii=False)
+            self.upload_bytes(json_content.encode('utf-8'), json_key, 'application/json')
+
+            return True
+        except ClientError as e:
+            print(f"Error uploading results for case {case_id}: {e}")
+            return False
@@ -0,0 +1,172 @@
+"""
+Cross-case scheduling of the diffusion stages in the try-on / outpaint workers
+
+A case is written as a generator ("case steps") that yields a StageJob for
+every diffusion call and receives that call's result back:
+
+    extracted = yield StageJob(lazy_qwen_tryon.extract_clothes, (clothing_path, output_path))
+
+- run_case() drives a single case, one job at a time (queue worker, CLI)
+- run_cases() advances many cases together: jobs waiting on the same stage
+  (and group, e.g. canvas size) run back to back, as batched pipeline calls
+  when the stage has a batch_fn
+- Batch size is capped by STAGE_BATCH_SIZE and by free GPU memory, and is
+  halved on CUDA OOM
+- A failing batched call only fails the cases in that batch; stages without
+  a batch_fn run one case at a time and fail only that case
+
+Env:
+    STAGE_BATCH_SIZE        max samples per batched pipeline call (default 4)
+    STAGE_BYTES_PER_PIXEL   rough GPU memory per output pixel and sample (default 2048)
+    STAGE_MAX_CASES         cases in flight at once (default 16)
+"""
+
+import os
+import traceback
+
+import torch
+
+STAGE_BATCH_SIZE = int(os.getenv("STAGE_BATCH_SIZE", "4"))
+STAGE_BYTES_PER_PIXEL = int(os.getenv("STAGE_BYTES_PER_PIXEL", "2048"))
+STAGE_MAX_CASES = int(os.getenv("STAGE_MAX_CASES", "16"))
+
+
+class StageJob:
+    def __init__(self, fn, args, batch_fn=None, group=None, pixels=None):
+        """
+        Args:
+            fn: Single-item stage function, fn(*args)
+            args: Arguments of this job
+            batch_fn: Optional batched version, batch_fn([args, ...]) -> [result, ...]
+            group: Jobs only batch together with the same stage and group
+            pixels: Output pixels per sample, used to size batches to free memory
+        """
+        self.fn = fn
+        self.args = args
+        self.batch_fn = batch_fn
+        self.group = group
+        self.pixels = pixels
+
+    @property
+    def key(self):
+        return (self.batch_fn or self.fn, self.group)
+
+    @property
+    def name(self):
+        return getattr(self.batch_fn or self.fn, '__name__', 'stage')
+
+    def run(self, jobs):
+        """Run jobs of this stage, batched when possible"""
+        if self.batch_fn is not None:
+            return self.batch_fn([job.args for job in jobs])
+        return [self.fn(*job.args) for job in jobs]
+
+
+def memory_batch_size(pixels, max_batch_size=STAGE_BATCH_SIZE):
+    """Batch size that should fit in the currently free GPU memory"""
+    max_batch_size = max(1, max_batch_size)
+    if not pixels or not torch.cuda.is_available():
+        return max_batch_size
+    free_bytes, _ = torch.cuda.mem_get_info()
+    return max(1, min(max_batch_size, free_bytes // (pixels * STAGE_BYTES_PER_PIXEL)))
+
+
+def run_case(steps):
+    """Drive one case's steps to completion; returns the generator's return value"""
+    value, error = None, None
+    while True:
+        try:
+            job = steps.throw(error) if error is not None else steps.send(value)
+        except StopIteration as e:
+            return e.value
+
+        value, error = None, None
+        try:
+            value = job.run([job])[0]
+        except Exception as e:
+            error = e
+
+
+def run_cases(case_steps, max_batch_size=STAGE_BATCH_SIZE, max_cases=STAGE_MAX_CASES):
+    """
+    Run many cases stage by stage
+
+    Args:
+        case_steps: {case_id: generator} (generators start lazily, max_cases at a time)
+    Returns:
+        {case_id: return value of its steps, or False if it raised}
+    """
+    results = {}
+    waiting = {}  # case_id -> StageJob it is blocked on
+    queued = iter(case_steps.items())
+    active = {}
+
+    def advance(case_id, value=None, error=None):
+        steps = active[case_id]
+        try:
+            job = steps.throw(error) if error is not None else steps.send(value)
+        except StopIteration as e:
+            results[case_id] = e.value
+            del active[case_id]
+        except Exception as e:
+            print(f"Error: {case_id}: {e}")
+            traceback.print_exc()
+            results[case_id] = False
+            del active[case_id]
+        else:
+            waiting[case_id] = job
+
+    def admit():
+        for case_id, steps in queued:
+            active[case_id] = steps
+            advance(case_id)
+            if len(active) >= max_cases:
+                return
+
+    def run_batched(case_ids, jobs):
+        batch_size = memory_batch_size(jobs[0].pixels, max_batch_size)
+        print(f"\nStage {jobs[0].name}: {len(jobs)} cases, batch size {batch_size}")
+
+        start = 0
+        while start < len(jobs):
+            end = min(start + batch_size, len(jobs))
+            try:
+                outputs = jobs[0].run(jobs[start:end])
+            except Exception as e:
+                if isinstance(e, torch.cuda.OutOfMemoryError) and batch_size > 1:
+                    torch.cuda.empty_cache()
+                    batch_size //= 2
+                    print(f"Out of memory, retrying with batch size {batch_size}")
+                    continue
+                for case_id in case_ids[start:end]:
+                    advance(case_id, error=e)
+            else:
+                for case_id, output in zip(case_ids[start:end], outputs):
+                    advance(case_id, value=output)
+            start = end
+
+    admit()
+    while waiting:
+        # Largest group first, so cases move through the stages together
+        groups = {}
+        for case_id, job in waiting.items():
+            groups.setdefault(job.key, []).append(case_id)
+        case_ids = max(groups.values(), key=len)
+        jobs = [waiting.pop(case_id) for case_id in case_ids]
+
+        if jobs[0].batch_fn is None:
+            # Not batchable: one case at a time, so a failure only fails that case
+            print(f"\nStage {jobs[0].name}: {len(jobs)} cases")
+            for case_id, job in zip(case_ids, jobs):
+                try:
+                    output = job.fn(*job.args)
+                except Exception as e:
+                    advance(case_id, error=e)
+                else:
+                    advance(case_id, value=output)
+        else:
+            run_batched(case_ids, jobs)
+
+        admit()
+
+    return results
@@ -0,0 +1,163 @@
+"""
+s3_io checks against a stubbed S3 client (no network / credentials needed)
+
+    python test_s3_io.py
+"""
+
+import os
+import tempfile
+from io import BytesIO
+
+import boto3
+from botocore.response import StreamingBody
+from botocore.stub import Stubber, ANY
+
+from s3_io import S3Handler
+
+S3_CONFIG = {
+    'bucket_name': 'test-bucket',
+    'region_name': 'us-east-1',
+    'access_key_id': 'testing',
+    'secret_access_key': 'testing',
+    'max_concurrency': 4
+}
+
+CASE_ID = 'missing-person-a'
+FILES = {f'input/{CASE_ID}/{i:02d}.jpg': f'image {i}'.encode() for i in range(5)}
+
+
+def make_handler():
+    client = boto3.client(
+        's3',
+        region_name=S3_CONFIG['region_name'],
+        aws_access_key_id=S3_CONFIG['access_key_id'],
+        aws_secret_access_key=S3_CONFIG['secret_access_key']
+    )
+    return S3Handler(S3_CONFIG, client=client), Stubber(client)
+
+
+def add_listing(stubber, prefix, keys):
+    """Two list_objects_v2 pages joined by a continuation token"""
+    contents = [{'Key': key, 'Size': len(FILES.get(key, b''))} for key in keys]
+    split = len(contents) // 2
+    stubber.add_response(
+        'list_objects_v2',
+        {'Contents': contents[:split], 'IsTruncated': True, 'NextContinuationToken': 'page-2'},
+        {'Bucket': S3_CONFIG['bucket_name'], 'Prefix': prefix}
+    )
+    stubber.add_response(
+        'list_objects_v2',
+        {'Contents': contents[split:], 'IsTruncated': False},
+        {'Bucket': S3_CONFIG['bucket_name'], 'Prefix': prefix, 'ContinuationToken': 'page-2'}
+    )
+
+
+def add_gets(stubber, keys):
+    """GET responses; parallel downloads consume them in any order, so keys are not pinned"""
+    for key in keys:
+        body = FILES[key]
+        stubber.add_response(
+            'get_object',
+            {'Body': StreamingBody(BytesIO(body), len(body)), 'ContentLength': len(body)},
+            {'Bucket': S3_CONFIG['bucket_name'], 'Key': ANY}
+        )
+
+
+def test_list_cases_across_pages():
+    """Case prefixes from every page, non-case folders dropped"""
+    handler, stubber = make_handler()
+    stubber.add_response(
+        'list_objects_v2',
+        {
+            'CommonPrefixes': [{'Prefix': 'input/missing-person-a/'}, {'Prefix': 'input/tmp/'}],
+            'IsTruncated': True,
+            'NextContinuationToken': 'page-2'
+        },
+        {'Bucket': S3_CONFIG['bucket_name'], 'Prefix': 'input/', 'Delimiter': '/'}
+    )
+    stubber.add_response(
+        'list_objects_v2',
+        {'CommonPrefixes': [{'Prefix': 'input/missing-person-b/'}], 'IsTruncated': False},
+        {'Bucket': S3_CONFIG['bucket_name'], 'Prefix': 'input/', 'Delimiter': '/',
+         'ContinuationToken': 'page-2'}
+    )
+
+    with stubber:
+        cases = handler.list_missing_person_cases()
+        stubber.assert_no_pending_responses()
+
+    assert cases == ['missing-person-a', 'missing-person-b'], cases
+
+
+def test_iter_objects_skips_directory_markers():
+    handler, stubber = make_handler()
+    prefix = f'input/{CASE_ID}/'
+    add_listing(stubber, prefix, [prefix] + list(FILES))
+
+    with stubber:
+        keys = [obj['Key'] for obj in handler.iter_objects(prefix)]
+        stubber.assert_no_pending_responses()
+
+    assert keys == list(FILES), keys
+
+
+def test_download_case_buffers_parallel():
+    """Every object across both pages is read, results sorted by file name"""
+    handler, stubber = make_handler()
+    add_listing(stubber, f'input/{CASE_ID}/', list(FILES))
+    add_gets(stubber, list(FILES))
+
+    try:
+        with stubber:
+            buffers = handler.download_case_buffers(CASE_ID)
+            stubber.assert_no_pending_responses()
+    finally:
+        handler.close()
+
+    names = [name for name, _ in buffers]
+    assert names == sorted(os.path.basename(key) for key in FILES), names
+    assert sorted(buffer.getvalue() for _, buffer in buffers) == sorted(FILES.values())
+
+
+def test_download_case_images_parallel():
+    """Small objects are written from a single GET into the case folder"""
+    handler, stubber = make_handler()
+    add_listing(stubber, f'input/{CASE_ID}/', list(FILES))
+    add_gets(stubber, list(FILES))
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        try:
+            with stubber:
+                paths = handler.download_case_images(CASE_ID, temp_dir)
+                stubber.assert_no_pending_responses()
+        finally:
+            handler.close()
+
+        expected = [os.path.join(temp_dir, CASE_ID, os.path.basename(key)) for key in sorted(FILES)]
+        assert paths == expected, paths
+
+        contents = []
+        for path in paths:
+            with open(path, 'rb') as f:
+                contents.append(f.read())
+        assert sorted(contents) == sorted(FILES.values())
+
+
+if __name__ == "__main__":
+    tests = [
+        test_list_cases_across_pages,
+        test_iter_objects_skips_directory_markers,
+        test_download_case_buffers_parallel,
+        test_download_case_images_parallel
+    ]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✓ {test.__name__}")
+        except Exception as e:
+            failed += 1
+            print(f"✗ {test.__name__}: {e!r}")
+
+    print(f"\n{len(tests) - failed}/{len(tests)} passed")
+    raise SystemExit(1 if failed else 0)
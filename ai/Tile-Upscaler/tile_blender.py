@@ -0,0 +1,115 @@
+"""
+Streaming Gaussian tile blender for the tile upscalers
+
+The old blender kept full-resolution float32 `result` / `weight_sum`
+canvases plus a float64 weight grid resized for every edge tile. This one
+only accumulates a band of rows as tall as one tile:
+
+- tiles arrive in row-major order (top coordinate never decreases)
+- when a tile starts lower than the band, the rows above it can no longer
+  change, so they are normalized, converted to uint8 and written out
+- the output is a uint8 array, or a np.memmap on disk for very large images
+- weights are computed once per tile shape (float32)
+
+Peak memory is O(tile_height x width) instead of O(height x width).
+"""
+
+import os
+
+import numpy as np
+
+
+def gaussian_weight(height, width, sigma=0.3):
+    """Separable Gaussian over [-1, 1] x [-1, 1] sampled at the tile's own shape"""
+    y = np.exp(-np.linspace(-1, 1, height, dtype=np.float32) ** 2 / (2 * sigma ** 2))
+    x = np.exp(-np.linspace(-1, 1, width, dtype=np.float32) ** 2 / (2 * sigma ** 2))
+    return np.outer(y, x)
+
+
+class StreamingTileBlender:
+    def __init__(self, width, height, band_height, output_path=None, sigma=0.3, channels=3):
+        """
+        Args:
+            width, height: Output size
+            band_height: Tallest tile that will be added
+            output_path: Write rows into a .npy memmap at this path instead of RAM
+            sigma: Gaussian sigma of the tile weights
+        """
+        self.width = width
+        self.height = height
+        self.sigma = sigma
+        self.band_height = band_height
+
+        if output_path:
+            self.output = np.lib.format.open_memmap(
+                output_path, mode='w+', dtype=np.uint8, shape=(height, width, channels)
+            )
+        else:
+            self.output = np.empty((height, width, channels), dtype=np.uint8)
+        self.output_path = output_path
+
+        # Accumulators for rows [band_top, band_top + band_height)
+        self.band_top = 0
+        self._acc = np.zeros((band_height, width, channels), dtype=np.float32)
+        self._weight_sum = np.zeros((band_height, width, 1), dtype=np.float32)
+        self._weights = {}
+
+    def weight(self, height, width):
+        """Tile weight, precomputed once per tile shape"""
+        key = (height, width)
+        if key not in self._weights:
+            self._weights[key] = gaussian_weight(height, width, self.sigma)[:, :, np.newaxis]
+        return self._weights[key]
+
+    def _flush_rows(self, count):
+        """Normalize and emit the first `count` rows of the band, then shift it up"""
+        count = min(count, self.height - self.band_top)
+        if count <= 0:
+            return
+
+        rows = self._acc[:count] / self._weight_sum[:count]
+        self.output[self.band_top:self.band_top + count] = rows.astype(np.uint8)
+
+        remaining = self.band_height - count
+        if remaining > 0:
+            self._acc[:remaining] = self._acc[count:]
+            self._weight_sum[:remaining] = self._weight_sum[count:]
+        self._acc[max(remaining, 0):] = 0
+        self._weight_sum[max(remaining, 0):] = 0
+        self.band_top += count
+
+    def add(self, left, top, tile):
+        """
+        Blend a tile whose top-left corner is (left, top)
+
+        Args:
+            tile: uint8/float array [h, w, channels], already at its final size
+        """
+        if top < self.band_top:
+            raise ValueError(f"Tiles must arrive top to bottom (tile at row {top}, band starts at {self.band_top})")
+
+        # Everything above this tile is final
+        self._flush_rows(top - self.band_top)
+
+        h, w = tile.shape[:2]
+        if top + h > self.band_top + self.band_height:
+            raise ValueError(f"Tile height {h} exceeds band height {self.band_height}")
+
+        weight = self.weight(h, w)
+        band_row = top - self.band_top
+        self._acc[band_row:band_row + h, left:left + w] += tile * weight
+        self._weight_sum[band_row:band_row + h, left:left + w] += weight
+
+    def finish(self):
+        """Flush the remaining rows and return the uint8 image (memmap if output_path was set)"""
+        while self.band_top < self.height:
+            self._flush_rows(self.band_height)
+        if isinstance(self.output, np.memmap):
+            self.output.flush()
+        return self.output
+
+    def cleanup(self):
+        """Remove the memmap file (after the result has been saved elsewhere)"""
+        if self.output_path and os.path.exists(self.output_path):
+            del self.output
+            os.remove(self.output_path)
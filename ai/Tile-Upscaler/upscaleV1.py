@@ -12,6 +12,7 @@ import cv2
 import numpy as np
 
 from RealESRGAN import RealESRGAN
+from prompt_cache import PromptEmbeddingCache
 
 USE_TORCH_COMPILE = False
 ENABLE_CPU_OFFLOAD = os.getenv("ENABLE_CPU_OFFLOAD", "0") == "1"
@@ -32,9 +33,10 @@ def timer_func(func):
         return result
     return wrapper
 
-class LazyLoadPipeline:
+class LazyLoadPipeline(PromptEmbeddingCache):
     def __init__(self):
         self.pipe = None
+        super().__init__()
 
     @timer_func
     def load(self):
@@ -226,9 +228,13 @@ def process_image(input_path, output_path):
         
     negative_prompt = ", ".join(negative_prompt_parts)
     
+    prompt_embeds, negative_prompt_embeds = lazy_pipe.encode_prompt(
+        prompt, negative_prompt, do_classifier_free_guidance=guidance_scale > 1.0
+    )
+    
     options = {
-        "prompt": prompt,
-        "negative_prompt": negative_prompt,
+        "prompt_embeds": prompt_embeds,
+        "negative_prompt_embeds": negative_prompt_embeds,
         "image": condition_image,
         "control_image": condition_image,
         "width": condition_image.size[0],
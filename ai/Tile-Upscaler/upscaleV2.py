@@ -11,12 +11,17 @@ import cv2
 import numpy as np
 
 from RealESRGAN import RealESRGAN
+from prompt_cache import PromptEmbeddingCache
+from tile_blender import StreamingTileBlender
 
 import random
 import math
 
 USE_TORCH_COMPILE = False
 ENABLE_CPU_OFFLOAD = os.getenv("ENABLE_CPU_OFFLOAD", "0") == "1"
+TILE_BATCH_SIZE = int(os.getenv("TILE_BATCH_SIZE", "4"))
+# 이 픽셀 수 이상의 출력은 RAM 대신 디스크(memmap)에 행 단위로 기록
+BLEND_MEMMAP_PIXELS = int(os.getenv("BLEND_MEMMAP_PIXELS", str(64 * 1024 * 1024)))
 
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
@@ -39,9 +44,10 @@ def get_scheduler(scheduler_name, config):
     else:
         raise ValueError(f"Unknown scheduler: {scheduler_name}")
 
-class LazyLoadPipeline:
+class LazyLoadPipeline(PromptEmbeddingCache):
     def __init__(self):
         self.pipe = None
+        super().__init__()
 
     @timer_func
     def load(self):
@@ -215,13 +221,6 @@ def prepare_image(input_image, resolution, hdr):
     upscaled_image = progressive_upscale(input_image, resolution)
     return create_hdr_effect(upscaled_image, hdr)
 
-def create_gaussian_weight(tile_size, sigma=0.3):
-    x = np.linspace(-1, 1, tile_size)
-    y = np.linspace(-1, 1, tile_size)
-    xx, yy = np.meshgrid(x, y)
-    gaussian_weight = np.exp(-(xx**2 + yy**2) / (2 * sigma**2))
-    return gaussian_weight
-
 def adaptive_tile_size(image_size, base_tile_size=512, max_tile_size=1024):
     w, h = image_size
     aspect_ratio = w / h
@@ -233,27 +232,64 @@ def adaptive_tile_size(image_size, base_tile_size=512, max_tile_size=1024):
         tile_w = min(int(tile_h * aspect_ratio), max_tile_size)
     return max(tile_w, base_tile_size), max(tile_h, base_tile_size)
 
-def process_tile(tile, num_inference_steps, strength, guidance_scale, controlnet_strength):
-    prompt = "masterpiece, best quality, highres"
-    negative_prompt = "low quality, normal quality, ugly, blurry, blur, lowres, bad anatomy, bad hands, cropped, worst quality, verybadimagenegative_v1.3, JuggernautNegative-neg"
-    
+PROMPT = "masterpiece, best quality, highres"
+NEGATIVE_PROMPT = "low quality, normal quality, ugly, blurry, blur, lowres, bad anatomy, bad hands, cropped, worst quality, verybadimagenegative_v1.3, JuggernautNegative-neg"
+
+def encode_prompts(guidance_scale):
+    """고정 프롬프트를 한 번만 인코딩 (모든 타일 배치가 공유)"""
+    return lazy_pipe.encode_prompt(PROMPT, NEGATIVE_PROMPT, do_classifier_free_guidance=guidance_scale > 1.0)
+
+def process_tile_batch(tiles, seeds, num_inference_steps, strength, guidance_scale, controlnet_strength,
+                       prompt_embeds, negative_prompt_embeds):
+    """같은 크기의 타일 여러 장을 한 번의 파이프라인 호출로 처리 (타일마다 고유 시드)"""
+    batch_size = len(tiles)
     options = {
-        "prompt": prompt,
-        "negative_prompt": negative_prompt,
-        "image": tile,
-        "control_image": tile,
+        "prompt_embeds": prompt_embeds.repeat(batch_size, 1, 1),
+        "negative_prompt_embeds": None if negative_prompt_embeds is None else negative_prompt_embeds.repeat(batch_size, 1, 1),
+        "image": tiles,
+        "control_image": tiles,
         "num_inference_steps": num_inference_steps,
         "strength": strength,
         "guidance_scale": guidance_scale,
         "controlnet_conditioning_scale": float(controlnet_strength),
-        "generator": torch.Generator(device=device).manual_seed(random.randint(0, 2147483647)),
+        "generator": [torch.Generator(device=device).manual_seed(seed) for seed in seeds],
     }
     
-    return np.array(lazy_pipe(**options).images[0])
+    return [np.array(image) for image in lazy_pipe(**options).images]
+
+def process_tile(tile, num_inference_steps, strength, guidance_scale, controlnet_strength, seed=None):
+    if seed is None:
+        seed = random.randint(0, 2147483647)
+    prompt_embeds, negative_prompt_embeds = encode_prompts(guidance_scale)
+    return process_tile_batch([tile], [seed], num_inference_steps, strength, guidance_scale, controlnet_strength,
+                              prompt_embeds, negative_prompt_embeds)[0]
+
+def iter_tile_batches(boxes, seeds, batch_size, run_batch):
+    """
+    타일을 batch_size 단위로 처리하며 (시작 인덱스, 결과 타일들)을 반환합니다.
+    타일은 배치마다 잘라내므로 한 번에 배치 하나 분량만 메모리에 올라갑니다.
+    CUDA 메모리가 부족하면 배치 크기를 절반으로 줄여 다시 시도합니다.
+    """
+    start = 0
+    batch_size = max(1, batch_size)
+    while start < len(boxes):
+        end = min(start + batch_size, len(boxes))
+        try:
+            results = run_batch(boxes[start:end], seeds[start:end])
+        except torch.cuda.OutOfMemoryError:
+            if batch_size == 1:
+                raise
+            torch.cuda.empty_cache()
+            batch_size //= 2
+            print(f"Out of memory, retrying with tile batch size {batch_size}")
+            continue
+        yield start, results
+        start = end
 
 @timer_func
 def process_image(input_image_path, output_image_path, resolution=512, num_inference_steps=20, 
-                  strength=0.4, hdr=0, guidance_scale=3, controlnet_strength=0.75, scheduler_name="DDIM"):
+                  strength=0.4, hdr=0, guidance_scale=3, controlnet_strength=0.75, scheduler_name="DDIM",
+                  tile_batch_size=TILE_BATCH_SIZE, seed=None):
     """
     로컬 이미지 파일을 처리하고 결과를 저장합니다.
     
@@ -267,6 +303,11 @@ def process_image(input_image_path, output_image_path, resolution=512, num_infer
         guidance_scale: 가이드 스케일 (기본값: 6)
         controlnet_strength: ControlNet 강도 (기본값: 0.75)
         scheduler_name: 스케줄러 이름 (기본값: "DDIM")
+        tile_batch_size: 한 번의 파이프라인 호출로 처리할 타일 수 (기본값: TILE_BATCH_SIZE)
+        seed: 기준 시드, 타일 i는 seed + i 사용 (기본값: 무작위)
+    
+    타일은 행(row) 순서로 블렌딩되며, 완성된 행은 바로 uint8로 정규화되어 출력에 기록됩니다.
+    출력이 BLEND_MEMMAP_PIXELS 이상이면 출력 배열을 디스크(memmap)에 둡니다.
     """
     print(f"Loading image from: {input_image_path}")
     
@@ -293,55 +334,56 @@ def process_image(input_image_path, output_image_path, resolution=512, num_infer
     print(f"Image size: {W}x{H}, Tile size: {tile_width}x{tile_height}")
     print(f"Number of tiles: {num_tiles_x} x {num_tiles_y}")
     
-    # 결과 캔버스
-    result = np.zeros((H, W, 3), dtype=np.float32)
-    weight_sum = np.zeros((H, W, 1), dtype=np.float32)
+    # 행 단위 스트리밍 블렌더 (타일 높이만큼의 밴드만 float32로 유지)
+    memmap_path = output_image_path + '.blend.npy' if W * H >= BLEND_MEMMAP_PIXELS else None
+    blender = StreamingTileBlender(W, H, band_height=tile_height, output_path=memmap_path)
     
-    # 가우시안 가중치
-    gaussian_weight = create_gaussian_weight(max(tile_width, tile_height))
+    try:
+        # 타일 좌표 계산 (모든 타일은 같은 크기로 리사이즈되어 배치로 묶을 수 있음)
+        boxes = []
+        for i in range(num_tiles_y):
+            for j in range(num_tiles_x):
+                left = j * (tile_width - overlap)
+                top = i * (tile_height - overlap)
+                right = min(left + tile_width, W)
+                bottom = min(top + tile_height, H)
+                boxes.append((left, top, right, bottom))
     
-    # 타일 처리
-    total_tiles = num_tiles_x * num_tiles_y
-    current_tile = 0
+        # 타일별 고정 시드
+        base_seed = random.randint(0, 2147483647) if seed is None else seed
+        seeds = [base_seed + index for index in range(len(boxes))]
     
-    for i in range(num_tiles_y):
-        for j in range(num_tiles_x):
-            current_tile += 1
-            print(f"Processing tile {current_tile}/{total_tiles}...")
-            
-            # 타일 좌표 계산
-            left = j * (tile_width - overlap)
-            top = i * (tile_height - overlap)
-            right = min(left + tile_width, W)
-            bottom = min(top + tile_height, H)
-            
-            # 타일 크기 조정
-            current_tile_size = (bottom - top, right - left)
-            
-            tile = condition_image.crop((left, top, right, bottom))
-            tile = tile.resize((tile_width, tile_height))
-            
-            # 타일 처리
-            result_tile = process_tile(tile, num_inference_steps, strength, guidance_scale, controlnet_strength)
-            
-            # 가우시안 가중치 적용
-            if current_tile_size != (tile_width, tile_height):
-                result_tile = cv2.resize(result_tile, current_tile_size[::-1])
-                tile_weight = cv2.resize(gaussian_weight, current_tile_size[::-1])
-            else:
-                tile_weight = gaussian_weight[:current_tile_size[0], :current_tile_size[1]]
+        # 프롬프트 임베딩은 이미지당 한 번만 계산
+        prompt_embeds, negative_prompt_embeds = encode_prompts(guidance_scale)
+    
+        def run_batch(batch_boxes, batch_seeds):
+            batch_tiles = [condition_image.crop(box).resize((tile_width, tile_height)) for box in batch_boxes]
+            return process_tile_batch(batch_tiles, batch_seeds, num_inference_steps, strength, guidance_scale,
+                                      controlnet_strength, prompt_embeds, negative_prompt_embeds)
+    
+        # 타일 배치 처리
+        total_tiles = len(boxes)
+        for start, result_tiles in iter_tile_batches(boxes, seeds, tile_batch_size, run_batch):
+            print(f"Processed tiles {start + 1}-{start + len(result_tiles)}/{total_tiles}")
+        
+            for (left, top, right, bottom), result_tile in zip(boxes[start:], result_tiles):
+                # 가장자리 타일은 원래 영역 크기로 되돌림
+                if (right - left, bottom - top) != (tile_width, tile_height):
+                    result_tile = cv2.resize(result_tile, (right - left, bottom - top))
             
-            # 결과에 타일 추가
-            result[top:bottom, left:right] += result_tile * tile_weight[:, :, np.newaxis]
-            weight_sum[top:bottom, left:right] += tile_weight[:, :, np.newaxis]
+                # 가우시안 가중치로 밴드에 누적 (위쪽의 완성된 행은 출력으로 기록됨)
+                blender.add(left, top, result_tile)
     
-    # 정규화
-    final_result = (result / weight_sum).astype(np.uint8)
+        # 남은 행 정규화
+        final_result = blender.finish()
     
-    # 결과 저장
-    output_image = Image.fromarray(final_result)
-    output_image.save(output_image_path)
-    print(f"Image saved to: {output_image_path}")
+        # 결과 저장
+        output_image = Image.fromarray(final_result)
+        output_image.save(output_image_path)
+        print(f"Image saved to: {output_image_path}")
+    finally:
+        # 실패해도 이미지 크기만 한 .blend.npy가 남지 않도록
+        blender.cleanup()
     
     return output_image
 
@@ -17,6 +17,7 @@ import cv2
 import numpy as np
 
 from RealESRGAN import RealESRGAN
+from prompt_cache import PromptEmbeddingCache
 
 from huggingface_hub import hf_hub_download
 
@@ -56,9 +57,10 @@ def timer_func(func):
         return result
     return wrapper
 
-class LazyLoadPipeline:
+class LazyLoadPipeline(PromptEmbeddingCache):
     def __init__(self):
         self.pipe = None
+        super().__init__()
 
     @timer_func
     def load(self):
@@ -168,9 +170,13 @@ def process_image(input_path, output_path, resolution=512, num_inference_steps=2
     prompt = "masterpiece, best quality, highres"
     negative_prompt = "low quality, normal quality, ugly, blurry, blur, lowres, bad anatomy, bad hands, cropped, worst quality, verybadimagenegative_v1.3, JuggernautNegative-neg"
     
+    prompt_embeds, negative_prompt_embeds = lazy_pipe.encode_prompt(
+        prompt, negative_prompt, do_classifier_free_guidance=guidance_scale > 1.0
+    )
+    
     options = {
-        "prompt": prompt,
-        "negative_prompt": negative_prompt,
+        "prompt_embeds": prompt_embeds,
+        "negative_prompt_embeds": negative_prompt_embeds,
         "image": condition_image,
         "control_image": condition_image,
         "width": condition_image.size[0],
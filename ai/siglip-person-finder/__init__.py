@@ -4,10 +4,14 @@ SigLIP Person Finder - Text-based Person Search System
 
 from .model import SigLIPPersonFinder, expand_text_query
 from .video_pipeline import PersonSearchPipeline
+from .watchlist import CaseWatchlist
+from .crop_index import CropEmbeddingIndex
 
 __version__ = "0.1.0"
 __all__ = [
     "SigLIPPersonFinder",
     "PersonSearchPipeline",
+    "CaseWatchlist",
+    "CropEmbeddingIndex",
     "expand_text_query"
 ]
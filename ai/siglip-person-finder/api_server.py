@@ -6,41 +6,115 @@ Usage:
     uvicorn api_server:app --reload --host 0.0.0.0 --port 8000
 """
 
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import asyncio
 import io
+import threading
+import numpy as np
 from PIL import Image
 import base64
 import logging
 
-from model import SigLIPPersonFinder
+from batcher import MicroBatcher
+from warm_start import StartupTracker, load_finder
+import embedding_transport
+from config import API_MAX_BATCH_SIZE, API_MAX_WAIT_MS, EAGER_LOAD
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize FastAPI app
-app = FastAPI(
-    title="SigLIP Person Finder API",
-    description="Text-based person search using SigLIP",
-    version="0.1.0"
-)
-
-# Initialize model (lazy loading)
+# Initialize model (eagerly at startup when EAGER_LOAD, else on first request)
 finder = None
+_finder_lock = threading.Lock()
+startup = StartupTracker()
 
 
 def get_finder():
-    """Lazy load the SigLIP model"""
+    """Load (and warm up) the SigLIP model once"""
     global finder
     if finder is None:
-        logger.info("Loading SigLIP model...")
-        finder = SigLIPPersonFinder()
-        logger.info("Model loaded!")
+        with _finder_lock:
+            if finder is None:
+                logger.info("Loading SigLIP model...")
+                try:
+                    loaded, timings = load_finder()
+                except Exception as e:
+                    startup.mark_failed(e)
+                    raise
+                finder = loaded
+                startup.mark_ready(timings)
+                logger.info("Model loaded!")
     return finder
 
 
+def _encode_texts(texts: List[str]) -> np.ndarray:
+    """Batch function: text queries -> features [N, D]"""
+    features = get_finder().encode_text(texts).float().cpu().numpy()
+    startup.mark_first_result()
+    return features
+
+
+def _encode_images(images: List[Image.Image]) -> np.ndarray:
+    """Batch function: images -> features [N, D]"""
+    features = get_finder().encode_image(images).float().cpu().numpy()
+    startup.mark_first_result()
+    return features
+
+
+# Concurrent requests are coalesced into batched forwards. Both batchers share
+# one model thread so text and image batches never run concurrently.
+model_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="siglip")
+text_batcher = MicroBatcher(
+    _encode_texts, API_MAX_BATCH_SIZE, API_MAX_WAIT_MS, model_executor, name="text"
+)
+image_batcher = MicroBatcher(
+    _encode_images, API_MAX_BATCH_SIZE, API_MAX_WAIT_MS, model_executor, name="image"
+)
+
+
+def _log_load_failure(future: asyncio.Future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error(f"Eager model load failed: {future.exception()}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start/stop the request batchers with the server"""
+    text_batcher.start()
+    image_batcher.start()
+
+    if EAGER_LOAD:
+        # Load on the model thread without blocking startup: the server is
+        # live immediately and becomes ready once the model is warm. Batches
+        # queue behind the load on the same thread.
+        load = asyncio.get_running_loop().run_in_executor(model_executor, get_finder)
+        load.add_done_callback(_log_load_failure)
+
+    yield
+    await text_batcher.stop()
+    await image_batcher.stop()
+
+
+# Initialize FastAPI app
+app = FastAPI(
+    title="SigLIP Person Finder API",
+    description="Text-based person search using SigLIP",
+    version="0.1.0",
+    lifespan=lifespan
+)
+
+
+def load_image(img_bytes: bytes) -> Image.Image:
+    """Decode an uploaded image (run off the event loop)"""
+    return Image.open(io.BytesIO(img_bytes)).convert("RGB")
+
+
 class SearchRequest(BaseModel):
     """Search request schema"""
     text_query: str
@@ -61,22 +135,44 @@ async def root():
         "version": "0.1.0",
         "endpoints": {
             "health": "/health",
+            "liveness": "/health/live",
+            "readiness": "/health/ready",
             "search": "/search (POST)",
             "encode_text": "/encode/text (POST)",
-            "encode_image": "/encode/image (POST)"
-        }
+            "encode_image": "/encode/image (POST)",
+            "encode_images": "/encode/images (POST)"
+        },
+        "formats": list(embedding_transport.SUPPORTED_FORMATS)
     }
 
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
+    """Health check endpoint (liveness; readiness is reported in 'startup')"""
     return {
         "status": "healthy",
-        "model_loaded": finder is not None
+        "model_loaded": finder is not None,
+        "startup": startup.info(),
+        "batching": {
+            "text": text_batcher.info(),
+            "image": image_batcher.info()
+        }
     }
 
 
+@app.get("/health/live")
+async def liveness():
+    """Liveness probe: the process is serving requests"""
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness probe: 503 until the model is loaded and warmed up"""
+    info = startup.info()
+    return JSONResponse(status_code=200 if info["ready"] else 503, content=info)
+
+
 @app.post("/search")
 async def search_person(
     text_query: str = Form(...),
@@ -95,29 +191,33 @@ async def search_person(
         List of matching results with similarity scores
     """
     try:
-        # Get model
-        model = get_finder()
-
         # Load images
         pil_images = []
         for img_file in images:
             img_bytes = await img_file.read()
-            img = Image.open(io.BytesIO(img_bytes))
-            pil_images.append(img)
-
-        # Search
-        results = model.search(
-            text_query=text_query,
-            images=pil_images,
-            threshold=threshold
+            pil_images.append(await run_in_threadpool(load_image, img_bytes))
+
+        # Encode through the batchers (shared with concurrent requests)
+        features = await asyncio.gather(
+            text_batcher.submit(text_query),
+            *[image_batcher.submit(img) for img in pil_images]
         )
+        text_features = features[0] / np.linalg.norm(features[0])
+        image_features = np.stack(features[1:])
+        image_features /= np.linalg.norm(image_features, axis=1, keepdims=True)
+
+        # Cosine similarity, filtered by threshold and sorted (descending)
+        similarities = image_features @ text_features
+        order = np.argsort(-similarities)
 
         # Format response (without images)
         response = []
-        for result in results:
+        for idx in order:
+            if similarities[idx] < threshold:
+                break
             response.append({
-                "index": result["index"],
-                "similarity": result["similarity"]
+                "index": int(idx),
+                "similarity": float(similarities[idx])
             })
 
         return JSONResponse(content={
@@ -133,21 +233,48 @@ async def search_person(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def negotiate_format(request: Request, dtype: str):
+    """Response format from the Accept header (406 if unsupported)"""
+    try:
+        return embedding_transport.negotiate(request.headers.get("accept"), dtype)
+    except embedding_transport.NotAcceptable as e:
+        raise HTTPException(status_code=406, detail=str(e))
+
+
+def binary_response(matrix: np.ndarray, media_type: str, dtype: np.dtype) -> Response:
+    """Features [N, D] as a raw/npy/msgpack body"""
+    return Response(
+        content=embedding_transport.serialize(matrix, media_type, dtype),
+        media_type=media_type,
+        headers=embedding_transport.headers(matrix.shape, dtype)
+    )
+
+
 @app.post("/encode/text")
-async def encode_text(text_query: str = Form(...)):
+async def encode_text(
+    request: Request,
+    text_query: str = Form(...),
+    dtype: str = Query("float32", description="Binary element type: float32 or float16")
+):
     """
     Encode text query into feature vector.
 
     Args:
         text_query: Text description
+        dtype: Element type for binary responses
 
     Returns:
-        Feature vector (as list)
+        Feature vector (JSON list, or a [1, D] binary matrix per Accept header)
     """
+    media_type, np_dtype = negotiate_format(request, dtype)
+
     try:
-        model = get_finder()
-        features = model.encode_text(text_query)
-        features_list = features[0].cpu().numpy().tolist()
+        features = await text_batcher.submit(text_query)
+
+        if media_type != embedding_transport.JSON:
+            return binary_response(features[np.newaxis], media_type, np_dtype)
+
+        features_list = features.tolist()
 
         return JSONResponse(content={
             "query": text_query,
@@ -161,26 +288,35 @@ async def encode_text(text_query: str = Form(...)):
 
 
 @app.post("/encode/image")
-async def encode_image(image: UploadFile = File(...)):
+async def encode_image(
+    request: Request,
+    image: UploadFile = File(...),
+    dtype: str = Query("float32", description="Binary element type: float32 or float16")
+):
     """
     Encode image into feature vector.
 
     Args:
         image: Image file
+        dtype: Element type for binary responses
 
     Returns:
-        Feature vector (as list)
+        Feature vector (JSON list, or a [1, D] binary matrix per Accept header)
     """
-    try:
-        model = get_finder()
+    media_type, np_dtype = negotiate_format(request, dtype)
 
+    try:
         # Load image
         img_bytes = await image.read()
-        img = Image.open(io.BytesIO(img_bytes))
+        img = await run_in_threadpool(load_image, img_bytes)
 
         # Encode
-        features = model.encode_image(img)
-        features_list = features[0].cpu().numpy().tolist()
+        features = await image_batcher.submit(img)
+
+        if media_type != embedding_transport.JSON:
+            return binary_response(features[np.newaxis], media_type, np_dtype)
+
+        features_list = features.tolist()
 
         return JSONResponse(content={
             "filename": image.filename,
@@ -193,6 +329,75 @@ async def encode_image(image: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/encode/images")
+async def encode_images(
+    request: Request,
+    images: List[UploadFile] = File(...),
+    dtype: str = Query("float32", description="Binary element type: float32 or float16")
+):
+    """
+    Encode many images into a packed feature matrix.
+
+    Images are encoded in chunks of API_MAX_BATCH_SIZE; raw and npy
+    responses are streamed chunk by chunk, rows in upload order.
+
+    Args:
+        images: Image files
+        dtype: Element type for binary responses
+
+    Returns:
+        Feature matrix [N, D] in the negotiated format
+    """
+    media_type, np_dtype = negotiate_format(request, dtype)
+
+    if not images:
+        raise HTTPException(status_code=400, detail="No images uploaded")
+
+    async def encode_chunk(chunk: List[bytes]) -> np.ndarray:
+        pil_images = [await run_in_threadpool(load_image, img_bytes) for img_bytes in chunk]
+        return np.stack(await asyncio.gather(*[image_batcher.submit(img) for img in pil_images]))
+
+    try:
+        # Read every upload now: the form files are closed once the endpoint
+        # returns, while the streamed chunks are encoded after that
+        uploads = [await img_file.read() for img_file in images]
+        chunks = [uploads[i:i + API_MAX_BATCH_SIZE] for i in range(0, len(uploads), API_MAX_BATCH_SIZE)]
+
+        # Encode the first chunk up front so errors surface as a 500, not a cut stream
+        first = await encode_chunk(chunks[0])
+    except Exception as e:
+        logger.error(f"Encoding error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if media_type in (embedding_transport.RAW, embedding_transport.NPY):
+        async def remaining_chunks():
+            for chunk in chunks[1:]:
+                yield await encode_chunk(chunk)
+
+        shape = (len(images), first.shape[1])
+        return StreamingResponse(
+            embedding_transport.stream(first, remaining_chunks(), len(images), media_type, np_dtype),
+            media_type=media_type,
+            headers=embedding_transport.headers(shape, np_dtype)
+        )
+
+    try:
+        features = np.concatenate([first] + [await encode_chunk(chunk) for chunk in chunks[1:]])
+    except Exception as e:
+        logger.error(f"Encoding error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if media_type == embedding_transport.MSGPACK:
+        return binary_response(features, media_type, np_dtype)
+
+    return JSONResponse(content={
+        "filenames": [img_file.filename for img_file in images],
+        "features": features.tolist(),
+        "count": len(features),
+        "dimension": features.shape[1]
+    })
+
+
 if __name__ == "__main__":
     import uvicorn
 
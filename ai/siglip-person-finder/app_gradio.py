@@ -16,11 +16,11 @@ import gradio as gr
 import numpy as np
 from PIL import Image
 import logging
-from typing import List, Tuple, Optional
+from typing import Iterator, List, Tuple, Optional
 import cv2
 
-from model import SigLIPPersonFinder
 from video_pipeline import PersonSearchPipeline
+from warm_start import load_finder
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -31,12 +31,13 @@ pipeline = None
 
 
 def get_models():
-    """Lazy load models"""
+    """Load models once (eagerly at launch, see __main__) and warm them up"""
     global finder, pipeline
     if finder is None:
         logger.info("Loading SigLIP model...")
-        finder = SigLIPPersonFinder()
+        finder, _ = load_finder()
         pipeline = PersonSearchPipeline(siglip_model=finder)
+        pipeline.warmup()
         logger.info("Models loaded!")
     return finder, pipeline
 
@@ -143,16 +144,32 @@ def search_images(
         return [], f"❌ 오류 발생: {str(e)}"
 
 
+def format_video_results(results: List[dict]) -> List[Tuple[Image.Image, str]]:
+    """Gallery items for video search results"""
+    gallery = []
+    for result in results:
+        crop = result['person_crop']
+        sim = result['similarity']
+        timestamp = result['timestamp']
+        frame = result['frame_idx']
+
+        caption = f"유사도: {sim:.3f}\n시간: {timestamp:.2f}초 (프레임 {frame})"
+        gallery.append((crop, caption))
+    return gallery
+
+
 def search_video(
     text_query: str,
     video_file: str,
     threshold: float,
     frame_skip: int,
     max_results: int
-) -> Tuple[List[Tuple[Image.Image, str]], str]:
+) -> Iterator[Tuple[List[Tuple[Image.Image, str]], str]]:
     """
     Search for person in video using text query.
 
+    Streams the current top results while the video is being processed.
+
     Args:
         text_query: Text description
         video_file: Path to video file
@@ -160,51 +177,52 @@ def search_video(
         frame_skip: Process every N frames
         max_results: Maximum results to show
 
-    Returns:
+    Yields:
         Gallery of results and status message
     """
     if not text_query or not text_query.strip():
-        return [], "⚠️ 텍스트 쿼리를 입력해주세요!"
+        yield [], "⚠️ 텍스트 쿼리를 입력해주세요!"
+        return
 
     if not video_file:
-        return [], "⚠️ 비디오를 업로드해주세요!"
+        yield [], "⚠️ 비디오를 업로드해주세요!"
+        return
 
     try:
         model, pipe = get_models()
 
         # Update pipeline settings
         pipe.similarity_threshold = threshold
-        pipe.frame_skip = frame_skip
+        pipe.set_frame_skip(frame_skip)
 
-        # Search in video
+        # Search in video, showing intermediate top results
         logger.info(f"Searching in video: {video_file}")
-        results = pipe.search_in_video(
+        for update in pipe.iter_search_in_video(
             video_path=video_file,
             text_query=text_query,
-            max_results=max_results,
-            save_results=False  # Don't save to disk
-        )
+            max_results=int(max_results)
+        ):
+            results = update['results']
+            if update['done']:
+                break
+
+            total = update['total_frames'] or 1
+            yield (
+                format_video_results(results),
+                f"⏳ 처리 중... {update['frame_idx']}/{total} 프레임 "
+                f"({100 * update['frame_idx'] / total:.0f}%), 현재 상위 {len(results)}개"
+            )
 
         if not results:
-            return [], f"❌ 비디오에서 매칭을 찾지 못했습니다 (임계값: {threshold:.2f})"
-
-        # Format results
-        gallery = []
-        for result in results:
-            crop = result['person_crop']
-            sim = result['similarity']
-            timestamp = result['timestamp']
-            frame = result['frame_idx']
-
-            caption = f"유사도: {sim:.3f}\n시간: {timestamp:.2f}초 (프레임 {frame})"
-            gallery.append((crop, caption))
+            yield [], f"❌ 비디오에서 매칭을 찾지 못했습니다 (임계값: {threshold:.2f})"
+            return
 
         status = f"✅ {len(results)}개의 매칭을 찾았습니다! (임계값: {threshold:.2f})"
-        return gallery, status
+        yield format_video_results(results), status
 
     except Exception as e:
         logger.error(f"Video search error: {e}")
-        return [], f"❌ 오류 발생: {str(e)}"
+        yield [], f"❌ 오류 발생: {str(e)}"
 
 
 # Example queries
@@ -393,6 +411,9 @@ if __name__ == "__main__":
     print("🚀 Starting SigLIP Person Finder Web UI")
     print("=" * 60 + "\n")
 
+    # Load before accepting requests so the first search is not a cold start
+    get_models()
+
     demo.launch(
         server_name="0.0.0.0",
         server_port=7860,
@@ -13,8 +13,8 @@ import cv2
 from typing import List
 import logging
 
-from model import SigLIPPersonFinder
 from video_pipeline import PersonSearchPipeline
+from warm_start import load_finder
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -31,9 +31,10 @@ st.set_page_config(
 
 @st.cache_resource
 def load_models():
-    """Load models once and cache"""
-    finder = SigLIPPersonFinder()
+    """Load models once, warm them up and cache"""
+    finder, _ = load_finder()
     pipeline = PersonSearchPipeline(siglip_model=finder)
+    pipeline.warmup()
     return finder, pipeline
 
 
@@ -43,6 +44,10 @@ def main():
     텍스트 기반 인물 검색 시스템 - 자연어 설명만으로 사진이나 영상에서 사람을 찾아냅니다!
     """)
 
+    # Load models on first page view rather than on the first search
+    with st.spinner("모델 로딩 중..."):
+        load_models()
+
     # Sidebar
     with st.sidebar:
         st.header("⚙️ 설정")
@@ -255,7 +260,7 @@ def main():
                         # Load models
                         finder, pipeline = load_models()
                         pipeline.similarity_threshold = threshold
-                        pipeline.frame_skip = frame_skip
+                        pipeline.set_frame_skip(frame_skip)
 
                         # Search
                         results = pipeline.search_in_video(
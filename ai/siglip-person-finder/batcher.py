@@ -0,0 +1,144 @@
+"""
+Dynamic request micro-batching for the API server
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent single-item requests into batched model calls.
+
+    Handlers ``await submit(item)``; a background task drains the queue into
+    batches of at most ``max_batch_size`` items, waiting at most
+    ``max_wait_ms`` after the first item for more to arrive. Each batch runs
+    ``batch_fn(items)`` on a dedicated worker thread (so the event loop never
+    blocks on the model) and row ``i`` of its result resolves request ``i``.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], Sequence[Any]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        executor: Optional[ThreadPoolExecutor] = None,
+        name: str = "batcher"
+    ):
+        """
+        Args:
+            batch_fn: Function mapping a list of items to one result per item
+            max_batch_size: Largest batch passed to batch_fn
+            max_wait_ms: Longest time the first item of a batch waits for company
+            executor: Worker thread(s) running batch_fn (default: a private
+                single-thread executor); share one to serialize several batchers
+                on the same model
+            name: Name used in logs
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        self._executor = executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"requests": 0, "batches": 0, "max_batch": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Start the batching loop on the running event loop."""
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop the batching loop; pending requests fail with CancelledError."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        while self._queue is not None and not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.cancel()
+
+    async def submit(self, item: Any) -> Any:
+        """Queue one item and wait for its result."""
+        if not self.running:
+            self.start()
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect(self) -> List:
+        """Wait for one request, then gather more until full or max_wait elapses."""
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            # Take whatever is already queued without waiting
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = await self._collect()
+
+            # Drop requests whose client already went away
+            batch = [(item, future) for item, future in batch if not future.done()]
+            if not batch:
+                continue
+
+            items = [item for item, _ in batch]
+            self.stats["requests"] += len(items)
+            self.stats["batches"] += 1
+            self.stats["max_batch"] = max(self.stats["max_batch"], len(items))
+
+            try:
+                results = await loop.run_in_executor(self._executor, self.batch_fn, items)
+            except Exception as e:
+                logger.error(f"{self.name}: batch of {len(items)} failed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def info(self) -> Dict[str, float]:
+        """Request/batch counters and the mean batch size."""
+        batches = self.stats["batches"]
+        return {
+            **self.stats,
+            "mean_batch": self.stats["requests"] / batches if batches else 0.0,
+        }
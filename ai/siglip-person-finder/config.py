@@ -6,6 +6,17 @@ Configuration file for SigLIP Person Finder
 MODEL_NAME = "adonaivera/siglip-person-search-openset"
 BACKUP_MODEL_NAME = "google/siglip-base-patch16-224"  # Fallback model
 
+# Cold Start
+MODEL_CACHE_DIR = "./models/siglip-local"  # safetensors copy of downloaded models (None = off)
+WARMUP_ON_START = True  # Run a dummy batch right after loading
+EAGER_LOAD = True  # API server loads the model at startup instead of on first request
+COLD_START_BUDGET_S = 60  # Warn when loading + warmup takes longer than this
+
+# Inference Backend
+BACKEND = "torch"  # "torch" (transformers) or "onnx" (run export_onnx.py first)
+ONNX_MODEL_DIR = "./models/siglip-onnx"  # Output of export_onnx.py
+ONNX_QUANTIZED = False  # Use the int8 dynamically quantized graphs
+
 # Detection Configuration
 YOLO_MODEL = "yolov8n.pt"  # YOLOv8 Nano for person detection
 PERSON_CLASS_ID = 0  # COCO dataset person class
@@ -14,14 +25,33 @@ PERSON_CLASS_ID = 0  # COCO dataset person class
 SIMILARITY_THRESHOLD_SURVEILLANCE = 0.30  # Higher recall, lower precision
 SIMILARITY_THRESHOLD_RETAIL = 0.40  # Higher precision
 DEFAULT_SIMILARITY_THRESHOLD = 0.35
+IMAGE_SIMILARITY_THRESHOLD = 0.80  # Reference-image matches (image-image cosine runs far above text-image)
 
 # Video Processing
 DEFAULT_FPS = 30
 FRAME_SKIP = 1  # Process every N frames (1 = process all frames)
+ADAPTIVE_FRAME_SKIP = False  # Gate detection on motion/person presence
+MAX_FRAME_SKIP = 30  # Largest stride on static, empty scenes (adaptive mode)
+CROP_BATCH_SIZE = 32  # Person crops encoded per SigLIP forward pass
+SNAPSHOT_EVERY = 150  # Frames between streamed top-k snapshots (progress UIs)
+
+# Text Embedding Cache
+TEXT_CACHE_SIZE = 1024  # Most recently used text queries kept per process
+TEXT_CACHE_PATH = None  # e.g. "./cache/text_embeddings.npz" to persist across restarts
+
+# API Server Request Batching
+API_MAX_BATCH_SIZE = 32  # Concurrent encode requests merged into one forward
+API_MAX_WAIT_MS = 5  # Longest a request waits for others to join its batch
 
 # Device Configuration
 DEVICE = "cuda"  # Will fallback to "cpu" if CUDA unavailable
 
+# Crop Embedding Index (ingest once, re-query by text)
+INDEX_DIR = "./index"
+INDEX_IVF_ITERATIONS = 10  # k-means iterations when building IVF
+INDEX_IVF_NPROBE = 8  # IVF partitions scanned per query
+INDEX_FLUSH_ROWS = 4096  # Crops buffered during ingest before one append to the index
+
 # Output Configuration
 MAX_RESULTS = 10  # Maximum number of results to return
 SAVE_CROPS = True  # Save person crops from matches
@@ -0,0 +1,425 @@
+"""
+Persistent on-disk index of person-crop SigLIP embeddings
+
+Crops are encoded once at ingest time; later text queries only need
+``encode_text`` plus a top-k lookup over the memory-mapped vectors.
+"""
+
+import json
+import os
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+import logging
+
+from config import INDEX_IVF_ITERATIONS, INDEX_IVF_NPROBE
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Per-crop metadata stored next to each embedding row
+METADATA_DTYPE = np.dtype([
+    ("source_id", np.int32),
+    ("frame_idx", np.int64),
+    ("timestamp", np.float64),
+    ("bbox", np.int32, (4,)),
+    ("bbox_idx", np.int32),
+])
+
+
+class CropEmbeddingIndex:
+    """
+    Append-only, memory-mapped index of L2-normalized crop embeddings.
+
+    Layout of ``index_dir``:
+        index.json      dimension, committed row count, model name and source lists
+        embeddings.f32  raw float32 matrix [count, dim]
+        metadata.bin    METADATA_DTYPE records [count]
+        ivf_*           optional IVF partitioning (see ``build_ivf``)
+        hnsw.bin        optional HNSW graph (see ``build_hnsw``, needs hnswlib)
+
+    Search is exact (flat) by default and uses IVF or HNSW when built.
+
+    ``count`` in index.json is only advanced after the row files are
+    written, so rows past it (a crash mid-``add``) and rows of an ingest
+    that never reached ``finish_source`` are truncated when the index is
+    opened.
+    """
+
+    def __init__(
+        self,
+        index_dir: Union[str, Path],
+        dim: Optional[int] = None,
+        model_name: Optional[str] = None
+    ):
+        """
+        Open an existing index or create a new one.
+
+        Args:
+            index_dir: Directory holding the index files
+            dim: Embedding dimension (required when creating a new index)
+            model_name: Model that produced the embeddings (checked on reopen)
+        """
+        self.index_dir = Path(index_dir)
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+
+        self._info_path = self.index_dir / "index.json"
+        self._vectors_path = self.index_dir / "embeddings.f32"
+        self._metadata_path = self.index_dir / "metadata.bin"
+        self._ivf_assign_path = self.index_dir / "ivf_assign.i32"
+
+        self._vectors = None
+        self._metadata = None
+        self._ivf = None
+        self._hnsw = None
+
+        if self._info_path.exists():
+            with open(self._info_path, encoding="utf-8") as f:
+                self.info = json.load(f)
+            if model_name and self.info["model_name"] and model_name != self.info["model_name"]:
+                raise ValueError(
+                    f"Index was built with {self.info['model_name']}, not {model_name}"
+                )
+            self._recover()
+        else:
+            if dim is None:
+                raise ValueError("dim is required to create a new index")
+            self.info = {
+                "dim": int(dim),
+                "count": 0,
+                "model_name": model_name,
+                "sources": [],
+                "ingested": [],
+                "pending": None,
+                "ivf_lists": 0,
+            }
+            self._save_info()
+
+    def __len__(self) -> int:
+        return self.info["count"]
+
+    @property
+    def dim(self) -> int:
+        return self.info["dim"]
+
+    def _save_info(self):
+        # index.json holds the committed row count: replace it atomically
+        tmp_path = self._info_path.with_name(self._info_path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.info, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._info_path)
+
+    @staticmethod
+    def _append(path: Path, data: bytes):
+        """Append rows and make them durable before the count that covers them is saved."""
+        with open(path, "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _row_files(self):
+        files = [
+            (self._vectors_path, self.dim * np.dtype(np.float32).itemsize),
+            (self._metadata_path, METADATA_DTYPE.itemsize),
+        ]
+        if self.info["ivf_lists"]:
+            files.append((self._ivf_assign_path, np.dtype(np.int32).itemsize))
+        return files
+
+    def _recover(self):
+        """Drop rows that were never committed or belong to an unfinished ingest."""
+        pending = self.info.get("pending")
+        count = self.info["count"]
+        if pending:
+            logger.warning(
+                f"Dropping {count - pending['start']} rows of interrupted ingest: {pending['source']}"
+            )
+            count = pending["start"]
+            self.info["count"] = count
+            self.info["pending"] = None
+            self._drop_hnsw()
+            self._save_info()
+
+        for path, row_bytes in self._row_files():
+            if path.exists() and path.stat().st_size > count * row_bytes:
+                with open(path, "r+b") as f:
+                    f.truncate(count * row_bytes)
+
+    def _drop_hnsw(self):
+        if self._hnsw is not None or (self.index_dir / "hnsw.bin").exists():
+            logger.warning("HNSW graph is stale; call build_hnsw() again")
+            self._hnsw = None
+            (self.index_dir / "hnsw.bin").unlink(missing_ok=True)
+
+    def _source_id(self, source: str) -> int:
+        sources = self.info["sources"]
+        if source not in sources:
+            sources.append(source)
+        return sources.index(source)
+
+    def has_source(self, source: str) -> bool:
+        """Whether a video/image has been completely ingested."""
+        return source in self.info["ingested"]
+
+    def begin_source(self, source: str):
+        """
+        Mark the start of an ingest; its rows are dropped on the next open
+        unless ``finish_source`` is called.
+        """
+        self.info["pending"] = {"source": source, "start": self.info["count"]}
+        self._save_info()
+
+    def finish_source(self, source: str):
+        """Record a source as ingested (also when it produced no crops)."""
+        self._source_id(source)
+        if source not in self.info["ingested"]:
+            self.info["ingested"].append(source)
+        self.info["pending"] = None
+        self._save_info()
+
+    def add(
+        self,
+        features: np.ndarray,
+        source: str,
+        frame_idx: Sequence[int],
+        timestamps: Sequence[float],
+        bboxes: Sequence[Tuple[int, int, int, int]],
+        bbox_idx: Sequence[int]
+    ):
+        """
+        Append crop embeddings and their metadata.
+
+        Args:
+            features: Crop embeddings [N, dim]
+            source: Video path or image path the crops came from
+            frame_idx: Frame index per crop (0 for still images)
+            timestamps: Timestamp in seconds per crop
+            bboxes: Bounding box (x1, y1, x2, y2) per crop
+            bbox_idx: Detection index within the frame per crop
+        """
+        features = np.asarray(features, dtype=np.float32)
+        if features.ndim != 2 or features.shape[1] != self.dim:
+            raise ValueError(f"Expected features [N, {self.dim}], got {features.shape}")
+        if len(features) == 0:
+            return
+
+        features = features / np.linalg.norm(features, axis=1, keepdims=True)
+
+        records = np.empty(len(features), dtype=METADATA_DTYPE)
+        records["source_id"] = self._source_id(source)
+        records["frame_idx"] = frame_idx
+        records["timestamp"] = timestamps
+        records["bbox"] = bboxes
+        records["bbox_idx"] = bbox_idx
+
+        self._append(self._vectors_path, features.tobytes())
+        self._append(self._metadata_path, records.tobytes())
+
+        # Keep an existing IVF partition up to date without retraining
+        if self.info["ivf_lists"]:
+            self._ivf_append(features)
+
+        # Commit the rows only after every file has them
+        self.info["count"] += len(features)
+        self._save_info()
+
+        # Re-map lazily on next access
+        self._vectors = None
+        self._metadata = None
+
+        self._drop_hnsw()
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """Read-only memory map of all embeddings [count, dim]."""
+        if self._vectors is None:
+            if len(self) == 0:
+                return np.empty((0, self.dim), dtype=np.float32)
+            self._vectors = np.memmap(
+                self._vectors_path, dtype=np.float32, mode="r",
+                shape=(len(self), self.dim)
+            )
+        return self._vectors
+
+    @property
+    def metadata(self) -> np.ndarray:
+        """Read-only memory map of all metadata records [count]."""
+        if self._metadata is None:
+            if len(self) == 0:
+                return np.empty(0, dtype=METADATA_DTYPE)
+            self._metadata = np.memmap(
+                self._metadata_path, dtype=METADATA_DTYPE, mode="r",
+                shape=(len(self),)
+            )
+        return self._metadata
+
+    def build_ivf(
+        self,
+        n_lists: Optional[int] = None,
+        iterations: int = INDEX_IVF_ITERATIONS,
+        sample_size: int = 100_000,
+        chunk_size: int = 65_536,
+        seed: int = 0
+    ):
+        """
+        Partition the index with spherical k-means (IVF).
+
+        Args:
+            n_lists: Number of partitions (default: ~sqrt(count))
+            iterations: k-means iterations
+            sample_size: Vectors sampled for training the centroids
+            chunk_size: Rows assigned per step (bounds memory use)
+            seed: Random seed for sampling/initialization
+        """
+        count = len(self)
+        if count == 0:
+            raise ValueError("Cannot build IVF on an empty index")
+
+        n_lists = n_lists or max(1, int(np.sqrt(count)))
+        n_lists = min(n_lists, count)
+        rng = np.random.default_rng(seed)
+
+        sample_idx = np.sort(rng.choice(count, size=min(sample_size, count), replace=False))
+        sample = np.asarray(self.vectors[sample_idx])
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            for list_id in range(n_lists):
+                members = sample[assign == list_id]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    centroids[list_id] = centroid / np.linalg.norm(centroid)
+
+        assign = np.empty(count, dtype=np.int32)
+        for start in range(0, count, chunk_size):
+            block = self.vectors[start:start + chunk_size]
+            assign[start:start + chunk_size] = np.argmax(block @ centroids.T, axis=1)
+
+        np.save(self.index_dir / "ivf_centroids.npy", centroids.astype(np.float32))
+        assign.tofile(self._ivf_assign_path)
+
+        self.info["ivf_lists"] = int(n_lists)
+        self._save_info()
+        self._ivf = None
+
+        logger.info(f"Built IVF index with {n_lists} lists over {count} vectors")
+
+    def _ivf_append(self, features: np.ndarray):
+        centroids, _, _ = self._load_ivf()
+        new_assign = np.argmax(features @ centroids.T, axis=1).astype(np.int32)
+        self._append(self._ivf_assign_path, new_assign.tobytes())
+        self._ivf = None
+
+    def _load_ivf(self):
+        if self._ivf is None:
+            centroids = np.load(self.index_dir / "ivf_centroids.npy")
+            assign = np.fromfile(self._ivf_assign_path, dtype=np.int32, count=len(self))
+            # Row ids grouped by list for fast candidate gathering
+            order = np.argsort(assign, kind="stable")
+            bounds = np.searchsorted(assign[order], np.arange(len(centroids) + 1))
+            self._ivf = (centroids, assign, (order, bounds))
+        return self._ivf
+
+    def build_hnsw(self, m: int = 16, ef_construction: int = 200):
+        """
+        Build an HNSW graph over the index (requires the optional hnswlib).
+
+        Args:
+            m: Graph degree
+            ef_construction: Construction-time candidate list size
+        """
+        try:
+            import hnswlib
+        except ImportError as e:
+            raise ImportError("build_hnsw() requires hnswlib: pip install hnswlib") from e
+
+        graph = hnswlib.Index(space="ip", dim=self.dim)
+        graph.init_index(max_elements=len(self), M=m, ef_construction=ef_construction)
+        graph.add_items(np.asarray(self.vectors), np.arange(len(self)))
+        graph.save_index(str(self.index_dir / "hnsw.bin"))
+        self._hnsw = graph
+
+        logger.info(f"Built HNSW graph over {len(self)} vectors")
+
+    def _load_hnsw(self):
+        if self._hnsw is None and (self.index_dir / "hnsw.bin").exists():
+            import hnswlib
+            graph = hnswlib.Index(space="ip", dim=self.dim)
+            graph.load_index(str(self.index_dir / "hnsw.bin"), max_elements=len(self))
+            self._hnsw = graph
+        return self._hnsw
+
+    def search(
+        self,
+        query_features: np.ndarray,
+        top_k: int = 10,
+        threshold: Optional[float] = None,
+        nprobe: int = INDEX_IVF_NPROBE,
+        exact: bool = False
+    ) -> List[Dict]:
+        """
+        Find the crops most similar to a query embedding.
+
+        Args:
+            query_features: Query embedding [dim] or [1, dim]
+            top_k: Number of results to return
+            threshold: Optional minimum similarity
+            nprobe: IVF partitions to scan (ignored for flat/HNSW search)
+            exact: Force a flat scan even if IVF/HNSW is built
+
+        Returns:
+            List of dicts with similarity, source, frame_idx, timestamp,
+            bbox and bbox_idx, sorted by similarity (descending)
+        """
+        if len(self) == 0:
+            return []
+
+        query = np.asarray(query_features, dtype=np.float32).reshape(-1)
+        query = query / np.linalg.norm(query)
+        top_k = min(top_k, len(self))
+
+        hnsw = None if exact else self._load_hnsw()
+        if hnsw is not None:
+            hnsw.set_ef(max(top_k * 2, 50))
+            labels, distances = hnsw.knn_query(query, k=top_k)
+            rows = labels[0].astype(np.int64)
+            scores = 1.0 - distances[0]
+        else:
+            if exact or not self.info["ivf_lists"]:
+                candidates = None
+                scores = self.vectors @ query
+            else:
+                centroids, _, (order, bounds) = self._load_ivf()
+                probe = np.argsort(-(centroids @ query))[:nprobe]
+                candidates = np.sort(np.concatenate(
+                    [order[bounds[l]:bounds[l + 1]] for l in probe]
+                ))
+                scores = self.vectors[candidates] @ query
+
+            k = min(top_k, len(scores))
+            if k == 0:
+                return []
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            rows = best if candidates is None else candidates[best]
+            scores = scores[best]
+
+        sources = self.info["sources"]
+        results = []
+        for row, score in zip(rows, scores):
+            if threshold is not None and score < threshold:
+                break
+            record = self.metadata[row]
+            results.append({
+                'similarity': float(score),
+                'source': sources[record["source_id"]],
+                'frame_idx': int(record["frame_idx"]),
+                'timestamp': float(record["timestamp"]),
+                'bbox': tuple(int(v) for v in record["bbox"]),
+                'bbox_idx': int(record["bbox_idx"]),
+            })
+
+        return results
@@ -0,0 +1,147 @@
+"""
+Binary serialization of embedding matrices for the API server
+
+Supported response formats (chosen from the request's Accept header):
+    application/json          {"features": [...]} float lists (default)
+    application/octet-stream  raw little-endian rows, row-major
+    application/x-npy         NumPy .npy file
+    application/msgpack       {"shape", "dtype", "data": raw bytes} (needs msgpack)
+
+Binary formats carry float32 by default or float16 on request. The shape
+and dtype are also sent as X-Embedding-Shape / X-Embedding-Dtype headers.
+"""
+
+import io
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+import numpy as np
+
+JSON = "application/json"
+RAW = "application/octet-stream"
+NPY = "application/x-npy"
+MSGPACK = "application/msgpack"
+
+_ALIASES = {
+    "application/*": JSON,
+    "*/*": JSON,
+    "application/x-msgpack": MSGPACK,
+    "application/vnd.msgpack": MSGPACK,
+}
+SUPPORTED_FORMATS = (JSON, RAW, NPY, MSGPACK)
+DTYPES = {"float32": np.dtype("<f4"), "float16": np.dtype("<f2")}
+
+
+class NotAcceptable(ValueError):
+    """No supported format/dtype matches the request."""
+
+
+def negotiate(accept: Optional[str], dtype: str = "float32") -> Tuple[str, np.dtype]:
+    """
+    Pick the response format from an Accept header.
+
+    Args:
+        accept: Accept header value (None/empty means JSON)
+        dtype: Requested element type for binary formats
+
+    Returns:
+        (media type, little-endian numpy dtype)
+    """
+    if dtype not in DTYPES:
+        raise NotAcceptable(f"Unsupported dtype '{dtype}', use one of {list(DTYPES)}")
+
+    if not accept:
+        return JSON, DTYPES[dtype]
+
+    candidates = []
+    for position, part in enumerate(accept.split(",")):
+        media_type, *params = [p.strip() for p in part.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        media_type = _ALIASES.get(media_type.lower(), media_type.lower())
+        if media_type in SUPPORTED_FORMATS and quality > 0:
+            candidates.append((-quality, position, media_type))
+
+    if not candidates:
+        raise NotAcceptable(f"Acceptable formats: {', '.join(SUPPORTED_FORMATS)}")
+
+    if MSGPACK in [c[2] for c in candidates]:
+        try:
+            import msgpack  # noqa: F401
+        except ImportError:
+            candidates = [c for c in candidates if c[2] != MSGPACK]
+            if not candidates:
+                raise NotAcceptable("msgpack is not installed on the server")
+
+    return min(candidates)[2], DTYPES[dtype]
+
+
+def headers(shape: Tuple[int, ...], dtype: np.dtype) -> Dict[str, str]:
+    """Shape/dtype headers sent with binary responses."""
+    return {
+        "X-Embedding-Shape": ",".join(str(d) for d in shape),
+        "X-Embedding-Dtype": dtype.name,
+    }
+
+
+def _npy_header(shape: Tuple[int, ...], dtype: np.dtype) -> bytes:
+    buffer = io.BytesIO()
+    np.lib.format.write_array_header_1_0(buffer, {
+        "descr": np.lib.format.dtype_to_descr(dtype),
+        "fortran_order": False,
+        "shape": tuple(shape),
+    })
+    return buffer.getvalue()
+
+
+def serialize(matrix: np.ndarray, media_type: str, dtype: np.dtype) -> bytes:
+    """
+    Serialize a feature matrix [N, D] as a binary body.
+
+    Args:
+        matrix: Features
+        media_type: RAW, NPY or MSGPACK
+        dtype: Element type of the body
+    """
+    matrix = np.ascontiguousarray(matrix, dtype=dtype)
+
+    if media_type == RAW:
+        return matrix.tobytes()
+    if media_type == NPY:
+        return _npy_header(matrix.shape, dtype) + matrix.tobytes()
+    if media_type == MSGPACK:
+        import msgpack
+        return msgpack.packb({
+            "shape": list(matrix.shape),
+            "dtype": dtype.name,
+            "data": matrix.tobytes(),
+        }, use_bin_type=True)
+
+    raise ValueError(f"Not a binary format: {media_type}")
+
+
+async def stream(
+    first_chunk: np.ndarray,
+    rest: AsyncIterator[np.ndarray],
+    num_rows: int,
+    media_type: str,
+    dtype: np.dtype
+) -> AsyncIterator[bytes]:
+    """
+    Stream a matrix of ``num_rows`` rows as RAW or NPY, chunk by chunk.
+
+    The first chunk is passed separately so its width (and any encoding
+    error) is known before the response starts.
+    """
+    if media_type == NPY:
+        yield _npy_header((num_rows, first_chunk.shape[1]), dtype)
+    elif media_type != RAW:
+        raise ValueError(f"Not a streamable format: {media_type}")
+
+    yield np.ascontiguousarray(first_chunk, dtype=dtype).tobytes()
+    async for chunk in rest:
+        yield np.ascontiguousarray(chunk, dtype=dtype).tobytes()
@@ -0,0 +1,296 @@
+"""
+Export the SigLIP text and vision towers to ONNX (optionally int8)
+
+Writes into ONNX_MODEL_DIR:
+    text.onnx / vision.onnx            fp32 graphs with a dynamic batch axis
+    text.int8.onnx / vision.int8.onnx  dynamically quantized weights (--quantize)
+    processor files                    so the ONNX backend loads offline
+    export_info.json                   source model name and export settings
+    report.json                        accuracy vs. speed against PyTorch (--report)
+
+Usage:
+    python export_onnx.py --quantize --report
+    python export_onnx.py --report --crops ./crops   # fixed set of real person crops
+
+Then set BACKEND = "onnx" (and ONNX_QUANTIZED) in config.py.
+"""
+
+import argparse
+import json
+import time
+import torch
+import numpy as np
+from PIL import Image
+from pathlib import Path
+from typing import Dict, List, Optional
+import logging
+
+from config import MODEL_NAME, ONNX_MODEL_DIR
+from model import SigLIPPersonFinder
+from onnx_backend import TEXT_GRAPH, VISION_GRAPH, INFO_FILE, graph_path
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Fixed queries used by the accuracy report
+REPORT_QUERIES = [
+    "A man wearing a white t-shirt and black pants",
+    "A woman in a red jacket with long hair",
+    "A person with a blue backpack",
+    "남자, 파란색 상의, 검은색 바지",
+    "여자, 빨간색 재킷, 긴 머리",
+    "흰색 운동화를 신은 남자",
+]
+
+
+class _TextTower(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids):
+        return self.model.get_text_features(input_ids=input_ids)
+
+
+class _VisionTower(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        return self.model.get_image_features(pixel_values=pixel_values)
+
+
+def export_towers(
+    finder: SigLIPPersonFinder,
+    output_dir: Path,
+    opset: int = 17,
+    quantize: bool = False
+):
+    """
+    Export both towers of a loaded PyTorch SigLIP model.
+
+    Args:
+        finder: PyTorch-backed SigLIPPersonFinder
+        output_dir: Destination directory
+        opset: ONNX opset version
+        quantize: Also write int8 dynamically quantized graphs
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    model = finder.model.to("cpu").eval()
+
+    text_inputs = finder.processor(
+        text=["a person"], padding="max_length", truncation=True, return_tensors="pt"
+    )
+    image_inputs = finder.processor(
+        images=[Image.new("RGB", (128, 256))], return_tensors="pt"
+    )
+
+    logger.info("Exporting text tower...")
+    torch.onnx.export(
+        _TextTower(model),
+        (text_inputs["input_ids"],),
+        str(output_dir / TEXT_GRAPH),
+        input_names=["input_ids"],
+        output_names=["text_embeds"],
+        dynamic_axes={"input_ids": {0: "batch", 1: "sequence"}, "text_embeds": {0: "batch"}},
+        opset_version=opset,
+        do_constant_folding=True
+    )
+
+    logger.info("Exporting vision tower...")
+    torch.onnx.export(
+        _VisionTower(model),
+        (image_inputs["pixel_values"],),
+        str(output_dir / VISION_GRAPH),
+        input_names=["pixel_values"],
+        output_names=["image_embeds"],
+        dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+        opset_version=opset,
+        do_constant_folding=True
+    )
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        for graph in (TEXT_GRAPH, VISION_GRAPH):
+            logger.info(f"Quantizing {graph} to int8...")
+            quantize_dynamic(
+                str(graph_path(output_dir, graph)),
+                str(graph_path(output_dir, graph, quantized=True)),
+                op_types_to_quantize=["MatMul", "Gemm"],
+                weight_type=QuantType.QInt8
+            )
+
+    finder.processor.save_pretrained(output_dir)
+    with open(output_dir / INFO_FILE, "w", encoding="utf-8") as f:
+        json.dump({
+            "model_name": finder.model_name,
+            "opset": opset,
+            "quantized": quantize,
+            "torch_version": torch.__version__,
+        }, f, indent=2)
+
+    finder.model.to(finder.device)
+    logger.info(f"Exported SigLIP towers to {output_dir}")
+
+
+def load_report_crops(crop_dir: Optional[str], count: int, seed: int = 0) -> List[Image.Image]:
+    """
+    Fixed crop set for the report: the first ``count`` images of a folder
+    (sorted by name) or, without a folder, seeded synthetic person-sized crops.
+    """
+    if crop_dir:
+        paths = sorted(
+            p for p in Path(crop_dir).iterdir()
+            if p.suffix.lower() in (".jpg", ".jpeg", ".png")
+        )[:count]
+        return [Image.open(p).convert("RGB") for p in paths]
+
+    rng = np.random.default_rng(seed)
+    return [
+        Image.fromarray(rng.integers(0, 255, (256, 128, 3), dtype=np.uint8))
+        for _ in range(count)
+    ]
+
+
+def _time_ms(fn, iterations: int, warmup: int = 3) -> float:
+    for _ in range(warmup):
+        fn()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def _cosine_rows(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return np.sum(a * b, axis=1)
+
+
+def compare_backends(
+    reference: SigLIPPersonFinder,
+    candidate: SigLIPPersonFinder,
+    crops: List[Image.Image],
+    queries: List[str] = REPORT_QUERIES,
+    batch_size: int = 16,
+    iterations: int = 10
+) -> Dict:
+    """
+    Accuracy and speed of a candidate backend against the PyTorch reference.
+
+    Accuracy: per-row cosine between the two backends' embeddings, the max
+    absolute difference of the query x crop similarity matrix and how often
+    each query's top-1 / top-5 crops agree.
+    Speed: mean latency of one image batch and one text batch.
+    """
+    ref_image = reference.encode_image(crops).float().cpu().numpy()
+    cand_image = candidate.encode_image(crops).float().cpu().numpy()
+    ref_text = reference.encode_text(queries, use_cache=False).float().cpu().numpy()
+    cand_text = candidate.encode_text(queries, use_cache=False).float().cpu().numpy()
+
+    def similarity(text, image):
+        text = text / np.linalg.norm(text, axis=1, keepdims=True)
+        image = image / np.linalg.norm(image, axis=1, keepdims=True)
+        return text @ image.T
+
+    ref_sim = similarity(ref_text, ref_image)
+    cand_sim = similarity(cand_text, cand_image)
+
+    k = min(5, len(crops))
+    ref_top = np.argsort(-ref_sim, axis=1)[:, :k]
+    cand_top = np.argsort(-cand_sim, axis=1)[:, :k]
+
+    image_cos = _cosine_rows(ref_image, cand_image)
+    text_cos = _cosine_rows(ref_text, cand_text)
+
+    batch = crops[:batch_size]
+    timings = {}
+    for name, finder in (("reference", reference), ("candidate", candidate)):
+        timings[name] = {
+            "image_batch_ms": _time_ms(lambda: finder.encode_image(batch), iterations),
+            "text_batch_ms": _time_ms(lambda: finder.encode_text(queries, use_cache=False), iterations),
+        }
+
+    return {
+        "crops": len(crops),
+        "queries": len(queries),
+        "image_batch_size": len(batch),
+        "accuracy": {
+            "image_cosine_mean": float(image_cos.mean()),
+            "image_cosine_min": float(image_cos.min()),
+            "text_cosine_mean": float(text_cos.mean()),
+            "text_cosine_min": float(text_cos.min()),
+            "similarity_max_abs_diff": float(np.abs(ref_sim - cand_sim).max()),
+            "top1_agreement": float(np.mean(ref_top[:, 0] == cand_top[:, 0])),
+            f"top{k}_overlap": float(np.mean([
+                len(set(r) & set(c)) / k for r, c in zip(ref_top, cand_top)
+            ])),
+        },
+        "speed": {
+            **timings,
+            "image_speedup": timings["reference"]["image_batch_ms"] / timings["candidate"]["image_batch_ms"],
+            "text_speedup": timings["reference"]["text_batch_ms"] / timings["candidate"]["text_batch_ms"],
+        },
+    }
+
+
+def print_report(name: str, report: Dict):
+    acc = report["accuracy"]
+    speed = report["speed"]
+    print(f"\n=== {name} vs PyTorch ({report['crops']} crops, {report['queries']} queries) ===")
+    print(f"  image cosine   mean {acc['image_cosine_mean']:.5f}  min {acc['image_cosine_min']:.5f}")
+    print(f"  text cosine    mean {acc['text_cosine_mean']:.5f}  min {acc['text_cosine_min']:.5f}")
+    print(f"  similarity max |diff|: {acc['similarity_max_abs_diff']:.5f}")
+    for key, value in acc.items():
+        if key.startswith("top"):
+            print(f"  {key}: {value:.2%}")
+    print(f"  image batch ({report['image_batch_size']}): "
+          f"{speed['reference']['image_batch_ms']:.1f}ms -> {speed['candidate']['image_batch_ms']:.1f}ms "
+          f"({speed['image_speedup']:.2f}x)")
+    print(f"  text batch ({report['queries']}): "
+          f"{speed['reference']['text_batch_ms']:.1f}ms -> {speed['candidate']['text_batch_ms']:.1f}ms "
+          f"({speed['text_speedup']:.2f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export SigLIP towers to ONNX")
+    parser.add_argument("--model", default=MODEL_NAME, help="HuggingFace model name")
+    parser.add_argument("--output", default=ONNX_MODEL_DIR, help="Output directory")
+    parser.add_argument("--opset", type=int, default=17, help="ONNX opset version")
+    parser.add_argument("--quantize", action="store_true", help="Also export int8 graphs")
+    parser.add_argument("--report", action="store_true", help="Compare against PyTorch")
+    parser.add_argument("--crops", help="Folder of person crops for the report")
+    parser.add_argument("--num-crops", type=int, default=64, help="Crops used by the report")
+    parser.add_argument("--iterations", type=int, default=10, help="Timing iterations")
+    args = parser.parse_args()
+
+    output_dir = Path(args.output)
+    reference = SigLIPPersonFinder(model_name=args.model, device="cpu", backend="torch")
+    export_towers(reference, output_dir, opset=args.opset, quantize=args.quantize)
+
+    if not args.report:
+        return
+
+    crops = load_report_crops(args.crops, args.num_crops)
+    reports = {}
+    for quantized in ([False, True] if args.quantize else [False]):
+        name = "onnx-int8" if quantized else "onnx-fp32"
+        candidate = SigLIPPersonFinder(
+            device="cpu", backend="onnx",
+            onnx_model_dir=str(output_dir), onnx_quantized=quantized
+        )
+        reports[name] = compare_backends(
+            reference, candidate, crops, iterations=args.iterations
+        )
+        print_report(name, reports[name])
+
+    reports["crop_source"] = args.crops or "synthetic (seed 0)"
+    with open(output_dir / "report.json", "w", encoding="utf-8") as f:
+        json.dump(reports, f, ensure_ascii=False, indent=2)
+    print(f"\nReport saved to {output_dir / 'report.json'}")
+
+
+if __name__ == "__main__":
+    main()
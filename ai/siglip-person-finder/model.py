@@ -2,14 +2,28 @@
 SigLIP Person Finder Model Loader and Feature Extractor
 """
 
+import shutil
+import time
 import torch
 from transformers import AutoProcessor, AutoModel
 from PIL import Image
 import numpy as np
+from pathlib import Path
 from typing import List, Union, Optional
 import logging
 
-from config import MODEL_NAME, BACKUP_MODEL_NAME, DEVICE
+from config import (
+    MODEL_NAME,
+    BACKUP_MODEL_NAME,
+    DEVICE,
+    BACKEND,
+    ONNX_MODEL_DIR,
+    ONNX_QUANTIZED,
+    MODEL_CACHE_DIR,
+    TEXT_CACHE_SIZE,
+    TEXT_CACHE_PATH
+)
+from text_cache import TextEmbeddingCache, normalize_query
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -24,7 +38,11 @@ class SigLIPPersonFinder:
     def __init__(
         self,
         model_name: str = MODEL_NAME,
-        device: Optional[str] = None
+        device: Optional[str] = None,
+        text_cache: Optional[TextEmbeddingCache] = None,
+        backend: str = BACKEND,
+        onnx_model_dir: str = ONNX_MODEL_DIR,
+        onnx_quantized: bool = ONNX_QUANTIZED
     ):
         """
         Initialize the SigLIP Person Finder model.
@@ -32,32 +50,120 @@ class SigLIPPersonFinder:
         Args:
             model_name: HuggingFace model name
             device: Device to run model on ('cuda', 'cpu', or None for auto-detect)
+            text_cache: Text embedding cache to use (default: a new one sized
+                by TEXT_CACHE_SIZE, persisted to TEXT_CACHE_PATH if set)
+            backend: 'torch' (transformers) or 'onnx' (graphs from export_onnx.py)
+            onnx_model_dir: Exported ONNX model directory (onnx backend)
+            onnx_quantized: Use the int8 graphs (onnx backend)
         """
         self.device = device or (DEVICE if torch.cuda.is_available() else "cpu")
+        self.backend = backend
         logger.info(f"Using device: {self.device}")
 
-        # Load model and processor
+        if backend == "onnx":
+            self._load_onnx(onnx_model_dir, onnx_quantized)
+        elif backend == "torch":
+            self._load_torch(model_name)
+        else:
+            raise ValueError(f"Unknown backend '{backend}', use 'torch' or 'onnx'")
+
+        if text_cache is None:
+            text_cache = TextEmbeddingCache(TEXT_CACHE_SIZE, TEXT_CACHE_PATH)
+        self.text_cache = text_cache
+
+    def _load_torch(self, model_name: str):
+        """Load the transformers model, falling back to the backup model."""
         try:
             logger.info(f"Loading model: {model_name}")
-            self.processor = AutoProcessor.from_pretrained(model_name)
-            self.model = AutoModel.from_pretrained(model_name)
-            self.model.to(self.device)
-            self.model.eval()
+            self.processor, self.model = self._load_pretrained(model_name)
+            self.model_name = model_name
             logger.info("Model loaded successfully!")
         except Exception as e:
             logger.warning(f"Failed to load {model_name}: {e}")
             logger.info(f"Trying backup model: {BACKUP_MODEL_NAME}")
-            self.processor = AutoProcessor.from_pretrained(BACKUP_MODEL_NAME)
-            self.model = AutoModel.from_pretrained(BACKUP_MODEL_NAME)
-            self.model.to(self.device)
-            self.model.eval()
+            self.processor, self.model = self._load_pretrained(BACKUP_MODEL_NAME)
+            self.model_name = BACKUP_MODEL_NAME
+
+        self.model.to(self.device)
+        self.model.eval()
+
+    @staticmethod
+    def _load_pretrained(model_name: str):
+        """
+        Load processor and model, preferring the local safetensors cache.
 
-    def encode_text(self, text_queries: Union[str, List[str]]) -> torch.Tensor:
+        A model fetched from the hub is written to MODEL_CACHE_DIR so the next
+        start memory-maps it from local disk instead of resolving/downloading.
+        """
+        if not MODEL_CACHE_DIR:
+            return AutoProcessor.from_pretrained(model_name), AutoModel.from_pretrained(model_name)
+
+        local_dir = Path(MODEL_CACHE_DIR) / model_name.replace("/", "--")
+        if (local_dir / "config.json").exists():
+            logger.info(f"Using cached artifact: {local_dir}")
+            return (
+                AutoProcessor.from_pretrained(local_dir),
+                AutoModel.from_pretrained(local_dir, use_safetensors=True)
+            )
+
+        processor = AutoProcessor.from_pretrained(model_name)
+        model = AutoModel.from_pretrained(model_name)
+
+        # Write to a temp dir first so an interrupted save never looks complete
+        tmp_dir = local_dir.with_name(local_dir.name + ".tmp")
+        try:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            model.save_pretrained(tmp_dir, safe_serialization=True)
+            processor.save_pretrained(tmp_dir)
+            tmp_dir.rename(local_dir)
+            logger.info(f"Cached model artifact at {local_dir}")
+        except OSError as e:
+            logger.warning(f"Could not cache model artifact at {local_dir}: {e}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        return processor, model
+
+    def _load_onnx(self, model_dir: str, quantized: bool):
+        """Load exported ONNX towers and the processor saved next to them."""
+        from onnx_backend import ONNXSigLIPModel
+
+        logger.info(f"Loading ONNX model: {model_dir}")
+        self.processor = AutoProcessor.from_pretrained(model_dir)
+        self.model = ONNXSigLIPModel(model_dir, quantized=quantized, device=self.device)
+
+        # Distinct cache key: ONNX/int8 embeddings differ slightly from PyTorch
+        self.model_name = f"{self.model.name_or_path}@onnx{'-int8' if quantized else ''}"
+        logger.info("Model loaded successfully!")
+
+    def warmup(self, batch_size: int = 1) -> float:
+        """
+        Run one dummy text and image batch so lazy initialization (kernel
+        selection, allocator growth, ONNX Runtime graph setup) happens before
+        the first real request.
+
+        Returns:
+            Elapsed seconds
+        """
+        start = time.perf_counter()
+        self.encode_text(["a person"] * batch_size, use_cache=False)
+        self.encode_image([Image.new("RGB", (128, 256))] * batch_size)
+        return time.perf_counter() - start
+
+    def encode_text(
+        self,
+        text_queries: Union[str, List[str]],
+        use_cache: bool = True
+    ) -> torch.Tensor:
         """
         Encode text queries into feature embeddings.
 
+        Queries are normalized (see ``normalize_query``) and looked up in the
+        text embedding cache; only the misses run through the text tower, in
+        a single batch.
+
         Args:
             text_queries: Single text query or list of queries
+            use_cache: Read/write the text embedding cache
 
         Returns:
             Tensor of text embeddings [batch_size, embedding_dim]
@@ -65,9 +171,35 @@ class SigLIPPersonFinder:
         if isinstance(text_queries, str):
             text_queries = [text_queries]
 
+        if not use_cache:
+            return self._encode_text_batch(text_queries)
+
+        queries = [normalize_query(query) for query in text_queries]
+        embeddings = self.text_cache.get_many(self.model_name, queries)
+
+        # Encode each distinct miss once
+        missing = list(dict.fromkeys(
+            query for query, embedding in zip(queries, embeddings) if embedding is None
+        ))
+        if missing:
+            encoded = self._encode_text_batch(missing).float().cpu().numpy()
+            self.text_cache.put_many(self.model_name, missing, encoded)
+            encoded_by_query = dict(zip(missing, encoded))
+            embeddings = [
+                encoded_by_query[query] if embedding is None else embedding
+                for query, embedding in zip(queries, embeddings)
+            ]
+
+        return torch.from_numpy(np.stack(embeddings)).to(self.device)
+
+    def _encode_text_batch(self, text_queries: List[str]) -> torch.Tensor:
+        """Run the text tower on a batch of queries."""
+        # SigLIP's text tower ignores the attention mask, so pad to the fixed
+        # training length: an embedding must not depend on its batch mates
         inputs = self.processor(
             text=text_queries,
-            padding=True,
+            padding="max_length",
+            truncation=True,
             return_tensors="pt"
         ).to(self.device)
 
@@ -0,0 +1,99 @@
+"""
+Motion-gated adaptive frame scheduling for video search
+"""
+
+import cv2
+import numpy as np
+
+
+class MotionGatedScheduler:
+    """
+    Decides per frame whether the person detector should run.
+
+    Motion is measured on a downscaled grayscale frame against a running
+    background model. While people are visible or the scene moves, frames are
+    sampled at ``min_stride``; on static, empty scenes the stride doubles after
+    each empty detection up to ``max_stride``.
+    """
+
+    def __init__(
+        self,
+        min_stride: int = 1,
+        max_stride: int = 30,
+        motion_threshold: float = 0.002,
+        pixel_threshold: int = 25,
+        background_rate: float = 0.05,
+        downscale_width: int = 160
+    ):
+        """
+        Initialize the scheduler.
+
+        Args:
+            min_stride: Frame stride while people/motion are present
+            max_stride: Maximum frame stride on static scenes
+            motion_threshold: Fraction of changed pixels that counts as motion
+            pixel_threshold: Grayscale difference that counts as a changed pixel
+            background_rate: Running-average rate of the background model
+            downscale_width: Width of the frame used for motion estimation
+        """
+        self.min_stride = max(1, min_stride)
+        self.max_stride = max(self.min_stride, max_stride)
+        self.motion_threshold = motion_threshold
+        self.pixel_threshold = pixel_threshold
+        self.background_rate = background_rate
+        self.downscale_width = downscale_width
+        self.reset()
+
+    def reset(self):
+        """Reset state before a new video."""
+        self._background = None
+        self._stride = self.min_stride
+        # Process the first frame, like the fixed frame_skip path does
+        self._since_processed = self.min_stride - 1
+        self._persons_present = False
+        self.last_motion = 0.0
+        self.stats = {'frames': 0, 'processed': 0}
+
+    def _motion(self, frame: np.ndarray) -> float:
+        """Fraction of pixels that differ from the background model."""
+        h, w = frame.shape[:2]
+        scale = self.downscale_width / float(w)
+        small = cv2.resize(frame, (self.downscale_width, max(1, int(h * scale))),
+                           interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        gray = cv2.GaussianBlur(gray, (5, 5), 0).astype(np.float32)
+
+        if self._background is None:
+            self._background = gray
+            return 1.0
+
+        diff = cv2.absdiff(gray, self._background)
+        cv2.accumulateWeighted(gray, self._background, self.background_rate)
+
+        return float(np.count_nonzero(diff > self.pixel_threshold)) / diff.size
+
+    def should_process(self, frame: np.ndarray) -> bool:
+        """Whether the detector should run on this frame."""
+        self.stats['frames'] += 1
+        self._since_processed += 1
+        self.last_motion = self._motion(frame)
+
+        if self._persons_present or self.last_motion >= self.motion_threshold:
+            stride = self.min_stride
+        else:
+            stride = self._stride
+
+        if self._since_processed < stride:
+            return False
+
+        self._since_processed = 0
+        self.stats['processed'] += 1
+        return True
+
+    def report(self, num_persons: int):
+        """Adjust the stride from the number of persons found in a processed frame."""
+        self._persons_present = num_persons > 0
+        if self._persons_present:
+            self._stride = self.min_stride
+        else:
+            self._stride = min(self.max_stride, self._stride * 2)
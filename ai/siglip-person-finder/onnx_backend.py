@@ -0,0 +1,112 @@
+"""
+ONNX Runtime backend for the SigLIP text and vision towers
+
+Loads the graphs written by export_onnx.py and exposes the subset of the
+transformers model API that SigLIPPersonFinder uses, so the rest of the
+code does not care which backend is active.
+"""
+
+import json
+import torch
+from pathlib import Path
+from typing import Optional, Union
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TEXT_GRAPH = "text.onnx"
+VISION_GRAPH = "vision.onnx"
+INFO_FILE = "export_info.json"
+
+
+def graph_path(model_dir: Union[str, Path], graph: str, quantized: bool = False) -> Path:
+    """Path of an exported graph (``*.int8.onnx`` when quantized)."""
+    if quantized:
+        graph = graph.replace(".onnx", ".int8.onnx")
+    return Path(model_dir) / graph
+
+
+class ONNXSigLIPModel:
+    """
+    SigLIP towers running on ONNX Runtime.
+
+    Mirrors ``get_text_features`` / ``get_image_features`` of the
+    transformers model (torch tensors in and out).
+    """
+
+    def __init__(
+        self,
+        model_dir: Union[str, Path],
+        quantized: bool = False,
+        device: str = "cpu",
+        num_threads: int = 0
+    ):
+        """
+        Args:
+            model_dir: Directory written by export_onnx.py
+            quantized: Use the int8 dynamically quantized graphs
+            device: 'cuda' to prefer the CUDA execution provider
+            num_threads: ONNX Runtime intra-op threads (0 = default)
+        """
+        import onnxruntime as ort
+
+        self.model_dir = Path(model_dir)
+        self.quantized = quantized
+        self.device = device
+
+        info_path = self.model_dir / INFO_FILE
+        if not info_path.exists():
+            raise FileNotFoundError(
+                f"No exported SigLIP model in {self.model_dir}; run export_onnx.py first"
+            )
+        with open(info_path, encoding="utf-8") as f:
+            self.info = json.load(f)
+
+        # Same attribute transformers models expose (used e.g. for index checks)
+        self.name_or_path = self.info["model_name"]
+
+        providers = ["CPUExecutionProvider"]
+        if device.startswith("cuda") and "CUDAExecutionProvider" in ort.get_available_providers():
+            providers.insert(0, "CUDAExecutionProvider")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+
+        self.text_session = ort.InferenceSession(
+            str(graph_path(self.model_dir, TEXT_GRAPH, quantized)), options, providers=providers
+        )
+        self.vision_session = ort.InferenceSession(
+            str(graph_path(self.model_dir, VISION_GRAPH, quantized)), options, providers=providers
+        )
+        logger.info(
+            f"ONNX SigLIP loaded from {self.model_dir} "
+            f"({'int8' if quantized else 'fp32'}, {self.text_session.get_providers()[0]})"
+        )
+
+    def to(self, device: str) -> "ONNXSigLIPModel":
+        """Outputs are placed on ``device`` (sessions are fixed at load time)."""
+        self.device = device
+        return self
+
+    def eval(self) -> "ONNXSigLIPModel":
+        return self
+
+    def _run(self, session, name: str, value: torch.Tensor) -> torch.Tensor:
+        outputs = session.run(None, {name: value.detach().cpu().numpy()})
+        return torch.from_numpy(outputs[0]).to(self.device)
+
+    def get_text_features(
+        self,
+        input_ids: torch.Tensor,
+        attention_mask: Optional[torch.Tensor] = None,
+        **kwargs
+    ) -> torch.Tensor:
+        """Text embeddings [batch_size, embedding_dim] (attention mask is unused by SigLIP)."""
+        return self._run(self.text_session, "input_ids", input_ids.to(torch.int64))
+
+    def get_image_features(self, pixel_values: torch.Tensor, **kwargs) -> torch.Tensor:
+        """Image embeddings [batch_size, embedding_dim]."""
+        return self._run(self.vision_session, "pixel_values", pixel_values.to(torch.float32))
@@ -32,7 +32,7 @@ def test_text_encoding(finder):
         ]
 
         features = finder.encode_text(queries)
-        print(f"✓ Text encoding successful")
+        print("✓ Text encoding successful")
         print(f"  Input: {len(queries)} queries")
         print(f"  Output shape: {features.shape}")
         print(f"  Feature dimension: {features.shape[1]}")
@@ -54,7 +54,7 @@ def test_image_encoding(finder):
         ]
 
         features = finder.encode_image(dummy_images)
-        print(f"✓ Image encoding successful")
+        print("✓ Image encoding successful")
         print(f"  Input: {len(dummy_images)} images")
         print(f"  Output shape: {features.shape}")
 
@@ -82,8 +82,8 @@ def test_similarity_computation(finder):
         # Compute similarity
         similarity = finder.compute_similarity(text_features, image_features)
 
-        print(f"✓ Similarity computation successful")
-        print(f"  Text queries: 1")
+        print("✓ Similarity computation successful")
+        print("  Text queries: 1")
         print(f"  Images: {len(dummy_images)}")
         print(f"  Similarity matrix shape: {similarity.shape}")
         print(f"  Similarity values: {similarity[0].cpu().numpy()}")
@@ -111,7 +111,7 @@ def test_search_function(finder):
             threshold=0.0  # Low threshold for dummy data
         )
 
-        print(f"✓ Search function successful")
+        print("✓ Search function successful")
         print(f"  Input images: {len(dummy_images)}")
         print(f"  Found matches: {len(results)}")
 
@@ -124,6 +124,68 @@ def test_search_function(finder):
         return False
 
 
+def test_text_cache(finder):
+    """Test 6: Text embedding cache"""
+    print("\n=== Test 6: Text Embedding Cache ===")
+    try:
+        finder.text_cache.clear()
+
+        queries = ["파란색 상의를 입은 여자", "A man wearing a white shirt"]
+        first = finder.encode_text(queries)
+
+        # Same queries with extra whitespace, plus one new query
+        second = finder.encode_text(["파란색  상의를 입은 여자 ", "A man wearing a white shirt", "흰색 운동화"])
+        uncached = finder.encode_text(queries, use_cache=False)
+
+        info = finder.text_cache.info()
+        assert info["hits"] == 2 and info["misses"] == 3, info
+        assert torch.allclose(first, second[:2])
+        assert torch.allclose(first, uncached, atol=1e-5)
+
+        print("✓ Text cache successful")
+        print(f"  Hits: {info['hits']}, Misses: {info['misses']}, Size: {info['size']}")
+
+        return True
+    except Exception as e:
+        print(f"✗ Text cache failed: {e}")
+        return False
+
+
+def test_watchlist_thresholds():
+    """Test 7: Watchlist keeps text and image references on separate thresholds"""
+    print("\n=== Test 7: Watchlist Thresholds ===")
+    try:
+        from watchlist import CaseWatchlist
+
+        def unit_mix(cosine, other_axis, dim=8):
+            """Unit vector with the given cosine to axis 0"""
+            vector = torch.zeros(dim)
+            vector[0] = cosine
+            vector[other_axis] = (1 - cosine ** 2) ** 0.5
+            return vector
+
+        crop = torch.zeros(1, 8)
+        crop[0, 0] = 1.0
+
+        watchlist = CaseWatchlist(None, text_threshold=0.35, image_threshold=0.80)
+        # Unrelated reference photo: above the text threshold, far below the image one
+        watchlist.add_case_features("unrelated", unit_mix(0.5, 1), kind="image")
+        watchlist.add_case_features("described", unit_mix(0.4, 2), kind="text")
+        watchlist.add_case_features("photographed", unit_mix(0.9, 3), kind="image")
+
+        matches = {case_id: kind for _, case_id, _, kind in watchlist.matches(crop)}
+        assert "unrelated" not in matches, matches
+        assert matches == {"described": "text", "photographed": "image"}, matches
+
+        print("✓ Watchlist thresholds successful")
+        print(f"  Matches: {matches}")
+
+        return True
+    except Exception as e:
+        print(f"✗ Watchlist thresholds failed: {e}")
+        return False
+
+
 def main():
     print("=" * 60)
     print("SigLIP Person Finder - Test Suite")
@@ -139,6 +201,8 @@ def main():
     test_image_encoding(finder)
     test_similarity_computation(finder)
     test_search_function(finder)
+    test_text_cache(finder)
+    test_watchlist_thresholds()
 
     print("\n" + "=" * 60)
     print("All tests completed!")
@@ -0,0 +1,172 @@
+"""
+LRU cache of SigLIP text embeddings
+"""
+
+import atexit
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Hashable, List, Optional, Tuple, Union
+import logging
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """
+    Canonical form of a text query used as cache key.
+
+    Applies Unicode NFC (composed Hangul) and collapses whitespace. Case is
+    preserved because the SigLIP tokenizer is case-sensitive.
+    """
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+class TextEmbeddingCache:
+    """
+    Bounded, thread-safe LRU of text embeddings keyed by (model, query).
+
+    Embeddings are stored as float32 numpy rows. When ``path`` is given the
+    cache is loaded from it on creation and written back at interpreter exit
+    (or on ``save()``).
+    """
+
+    def __init__(self, max_size: int = 1024, path: Optional[Union[str, Path]] = None):
+        """
+        Args:
+            max_size: Maximum number of cached queries
+            path: Optional .npz file to persist the cache to
+        """
+        self.max_size = max(1, max_size)
+        self.path = Path(path) if path else None
+        self._entries: "OrderedDict[Tuple[Hashable, str], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if self.path is not None:
+            if self.path.exists():
+                self.load()
+            atexit.register(self.save)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_many(
+        self,
+        model_name: Hashable,
+        queries: List[str]
+    ) -> List[Optional[np.ndarray]]:
+        """
+        Look up normalized queries; counts a hit or miss per query.
+
+        Returns:
+            Cached embedding or None per query
+        """
+        found = []
+        with self._lock:
+            for query in queries:
+                key = (model_name, query)
+                embedding = self._entries.get(key)
+                if embedding is None:
+                    self.misses += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                found.append(embedding)
+        return found
+
+    def put_many(self, model_name: Hashable, queries: List[str], embeddings: np.ndarray):
+        """Insert normalized queries with their embeddings [N, D], evicting LRU entries."""
+        with self._lock:
+            for query, embedding in zip(queries, embeddings):
+                key = (model_name, query)
+                self._entries[key] = np.array(embedding, dtype=np.float32)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self) -> Dict[str, Union[int, float]]:
+        """Hit/miss counters, in the spirit of functools.lru_cache.cache_info()."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+        }
+
+    def save(self, path: Optional[Union[str, Path]] = None):
+        """Write the cache (least recently used first) to an .npz file."""
+        path = Path(path) if path else self.path
+        if path is None or not self._entries:
+            return
+
+        with self._lock:
+            keys = list(self._entries.keys())
+            vectors = list(self._entries.values())
+
+        # Rows of different models may differ in dimension; store each group separately
+        groups: Dict[int, List[int]] = {}
+        for i, vector in enumerate(vectors):
+            groups.setdefault(len(vector), []).append(i)
+
+        arrays = {}
+        for dim, rows in groups.items():
+            arrays[f"models_{dim}"] = np.array([str(keys[i][0]) for i in rows])
+            arrays[f"queries_{dim}"] = np.array([keys[i][1] for i in rows])
+            arrays[f"vectors_{dim}"] = np.stack([vectors[i] for i in rows])
+            arrays[f"order_{dim}"] = np.array(rows, dtype=np.int64)
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        tmp_path.replace(path)
+
+        logger.info(f"Saved {len(keys)} text embeddings to {path}")
+
+    def load(self, path: Optional[Union[str, Path]] = None):
+        """Merge entries from an .npz file written by ``save()``."""
+        path = Path(path) if path else self.path
+        try:
+            data = np.load(path, allow_pickle=False)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable text cache {path}: {e}")
+            return
+
+        entries = []
+        for name in data.files:
+            if not name.startswith("vectors_"):
+                continue
+            dim = name[len("vectors_"):]
+            entries.extend(zip(
+                data[f"order_{dim}"].tolist(),
+                data[f"models_{dim}"].tolist(),
+                data[f"queries_{dim}"].tolist(),
+                data[name]
+            ))
+
+        entries.sort(key=lambda e: e[0])
+        with self._lock:
+            for _, model_name, query, vector in entries:
+                self._entries[(model_name, query)] = vector.astype(np.float32)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+        logger.info(f"Loaded {len(entries)} text embeddings from {path}")
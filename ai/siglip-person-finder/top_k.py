@@ -0,0 +1,66 @@
+"""
+Bounded top-k collector for streaming search results
+"""
+
+import heapq
+import itertools
+from typing import Dict, List
+
+
+class TopKCollector:
+    """
+    Min-heap holding the ``k`` most similar results seen so far.
+
+    The weakest kept result sits at the root, so a new candidate costs one
+    comparison when it loses and O(log k) when it wins. Evicted results are
+    dropped entirely (including any 'person_crop'), keeping memory bounded
+    by ``k`` no matter how long the video or how low the threshold.
+    """
+
+    def __init__(self, k: int):
+        """
+        Args:
+            k: Number of results to keep
+        """
+        self.k = max(1, k)
+        self._heap = []
+        self._counter = itertools.count()  # tie-breaker, results are not comparable
+        self.version = 0  # bumped whenever the kept set changes
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    @property
+    def floor(self) -> float:
+        """Similarity a candidate must beat to enter (-inf until full)."""
+        if len(self._heap) < self.k:
+            return float("-inf")
+        return self._heap[0][0]
+
+    def push(self, result: Dict) -> bool:
+        """
+        Offer a result carrying a 'similarity' key.
+
+        Returns:
+            True if the result was kept
+        """
+        similarity = result['similarity']
+        if similarity <= self.floor:
+            return False
+
+        entry = (similarity, next(self._counter), result)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        else:
+            heapq.heapreplace(self._heap, entry)
+
+        self.version += 1
+        return True
+
+    def results(self) -> List[Dict]:
+        """Kept results sorted by similarity (descending)."""
+        return [result for _, _, result in sorted(self._heap, key=lambda e: (-e[0], e[1]))]
+
+    def snapshot(self) -> List[Dict]:
+        """Shallow copies of the current results, safe to hand to a UI thread."""
+        return [dict(result) for result in self.results()]
@@ -3,25 +3,36 @@ Video Processing Pipeline for Person Search using SigLIP
 """
 
 import cv2
+import time
 import torch
 import numpy as np
 from PIL import Image
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple
+from typing import Hashable, Iterator, List, Dict, Optional, Tuple
 import logging
 from tqdm import tqdm
 from ultralytics import YOLO
 
 from model import SigLIPPersonFinder
+from watchlist import CaseWatchlist
+from crop_index import CropEmbeddingIndex
+from motion_gate import MotionGatedScheduler
+from top_k import TopKCollector
 from config import (
     YOLO_MODEL,
     PERSON_CLASS_ID,
     DEFAULT_SIMILARITY_THRESHOLD,
     DEFAULT_FPS,
     FRAME_SKIP,
+    ADAPTIVE_FRAME_SKIP,
+    MAX_FRAME_SKIP,
+    CROP_BATCH_SIZE,
+    SNAPSHOT_EVERY,
     MAX_RESULTS,
     SAVE_CROPS,
-    OUTPUT_DIR
+    OUTPUT_DIR,
+    INDEX_DIR,
+    INDEX_FLUSH_ROWS
 )
 
 logging.basicConfig(level=logging.INFO)
@@ -38,7 +49,9 @@ class PersonSearchPipeline:
         siglip_model: Optional[SigLIPPersonFinder] = None,
         yolo_model_path: str = YOLO_MODEL,
         similarity_threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
-        frame_skip: int = FRAME_SKIP
+        frame_skip: int = FRAME_SKIP,
+        adaptive_skip: bool = ADAPTIVE_FRAME_SKIP,
+        crop_batch_size: int = CROP_BATCH_SIZE
     ):
         """
         Initialize the person search pipeline.
@@ -47,17 +60,67 @@ class PersonSearchPipeline:
             siglip_model: Pre-initialized SigLIP model (or None to create new)
             yolo_model_path: Path to YOLO model
             similarity_threshold: Minimum similarity for matches
-            frame_skip: Process every N frames
+            frame_skip: Process every N frames (minimum stride when adaptive)
+            adaptive_skip: Gate detection on motion/person presence, backing
+                off to MAX_FRAME_SKIP on static scenes
+            crop_batch_size: Person crops gathered (across frames) per
+                SigLIP forward pass
         """
         self.siglip = siglip_model or SigLIPPersonFinder()
         self.detector = YOLO(yolo_model_path)
         self.similarity_threshold = similarity_threshold
         self.frame_skip = frame_skip
+        self.frame_scheduler = MotionGatedScheduler(
+            min_stride=frame_skip,
+            max_stride=MAX_FRAME_SKIP
+        ) if adaptive_skip else None
+        self.crop_batch_size = max(1, crop_batch_size)
         self.output_dir = Path(OUTPUT_DIR)
         self.output_dir.mkdir(exist_ok=True)
 
         logger.info(f"Pipeline initialized with threshold: {similarity_threshold}")
 
+    def warmup(self) -> float:
+        """
+        Run the detector once on a blank frame so the first real frame does
+        not pay for lazy initialization.
+
+        Returns:
+            Elapsed seconds
+        """
+        start = time.perf_counter()
+        self.detector(np.zeros((640, 640, 3), dtype=np.uint8), verbose=False)
+        return time.perf_counter() - start
+
+    def set_frame_skip(self, frame_skip: int):
+        """
+        Change the frame stride (the minimum stride when adaptive).
+
+        Args:
+            frame_skip: Process every N frames
+        """
+        self.frame_skip = frame_skip
+        if self.frame_scheduler is not None:
+            self.frame_scheduler.min_stride = max(1, frame_skip)
+            self.frame_scheduler.max_stride = max(self.frame_scheduler.min_stride, MAX_FRAME_SKIP)
+            self.frame_scheduler.reset()
+
+    def _should_skip(self, frame: np.ndarray, frame_idx: int) -> bool:
+        """Fixed-stride or motion-gated frame skipping."""
+        if self.frame_scheduler is not None:
+            return not self.frame_scheduler.should_process(frame)
+        return frame_idx % self.frame_skip != 0
+
+    def _reset_scheduler(self):
+        """Reset adaptive skipping state before a new video."""
+        if self.frame_scheduler is not None:
+            self.frame_scheduler.reset()
+
+    def _report_persons(self, bboxes: List[Tuple[int, int, int, int]]):
+        """Adjust the adaptive stride from a processed video frame's person count."""
+        if self.frame_scheduler is not None:
+            self.frame_scheduler.report(len(bboxes))
+
     def detect_persons(self, frame: np.ndarray) -> List[Tuple[int, int, int, int]]:
         """
         Detect all persons in a frame using YOLO.
@@ -113,7 +176,8 @@ class PersonSearchPipeline:
         video_path: str,
         text_query: str,
         max_results: int = MAX_RESULTS,
-        save_results: bool = SAVE_CROPS
+        save_results: bool = SAVE_CROPS,
+        keep_crops: bool = True
     ) -> List[Dict]:
         """
         Search for a person in a video using text description.
@@ -123,10 +187,50 @@ class PersonSearchPipeline:
             text_query: Text description of person to find
             max_results: Maximum number of results to return
             save_results: Whether to save result crops
+            keep_crops: Hold crops of the current top results in memory;
+                if False only coordinates are kept and the winners' crops are
+                re-read from the video at the end
 
         Returns:
             List of match results with metadata
         """
+        results = []
+        for update in self.iter_search_in_video(
+            video_path, text_query, max_results, keep_crops=keep_crops
+        ):
+            results = update['results']
+
+        # Save results
+        if save_results and results:
+            self._save_results(results, video_path, text_query)
+
+        return results
+
+    def iter_search_in_video(
+        self,
+        video_path: str,
+        text_query: str,
+        max_results: int = MAX_RESULTS,
+        snapshot_every: int = SNAPSHOT_EVERY,
+        keep_crops: bool = True
+    ) -> Iterator[Dict]:
+        """
+        Search a video, streaming top-k snapshots for progress UIs.
+
+        Only the best ``max_results`` matches are retained while scanning.
+
+        Args:
+            video_path: Path to video file
+            text_query: Text description of person to find
+            max_results: Maximum number of results to return
+            snapshot_every: Emit a snapshot at most every N frames (and only
+                when the top results changed)
+            keep_crops: See search_in_video
+
+        Yields:
+            Dicts with 'results' (sorted, copied), 'frame_idx',
+            'total_frames' and 'done'; the last one has done=True
+        """
         logger.info(f"Searching in video: {video_path}")
         logger.info(f"Query: '{text_query}'")
 
@@ -141,9 +245,157 @@ class PersonSearchPipeline:
         # Encode text query once
         text_features = self.siglip.encode_text(text_query)
 
-        results = []
+        top_k = TopKCollector(max_results)
+        frame_idx = 0
+        last_snapshot_frame = 0
+        last_snapshot_version = 0
+
+        # Crops waiting to be encoded, gathered across frames
+        crops = []
+        crop_meta = []
+
+        self._reset_scheduler()
+
+        # Progress bar
+        pbar = tqdm(total=total_frames, desc="Processing video")
+
+        try:
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+
+                # Skip frames
+                if self._should_skip(frame, frame_idx):
+                    frame_idx += 1
+                    pbar.update(1)
+                    continue
+
+                # Detect persons
+                bboxes = self.detect_persons(frame)
+                self._report_persons(bboxes)
+
+                # Queue each detected person for batched encoding
+                for bbox_idx, bbox in enumerate(bboxes):
+                    person_crop = self.crop_person(frame, bbox)
+                    if person_crop is None:
+                        continue
+
+                    crops.append(person_crop)
+                    crop_meta.append({
+                        'source': str(video_path),
+                        'frame_idx': frame_idx,
+                        'timestamp': frame_idx / fps,
+                        'bbox': bbox,
+                        'bbox_idx': bbox_idx
+                    })
+
+                if len(crops) >= self.crop_batch_size:
+                    self._score_crop_batch(text_features, crops, crop_meta, top_k, keep_crops)
+
+                frame_idx += 1
+                pbar.update(1)
+
+                if (frame_idx - last_snapshot_frame >= snapshot_every
+                        and top_k.version != last_snapshot_version):
+                    last_snapshot_frame = frame_idx
+                    last_snapshot_version = top_k.version
+                    yield {
+                        'results': top_k.snapshot(),
+                        'frame_idx': frame_idx,
+                        'total_frames': total_frames,
+                        'done': False
+                    }
+
+            # Encode the remaining partial batch
+            self._score_crop_batch(text_features, crops, crop_meta, top_k, keep_crops)
+        finally:
+            cap.release()
+            pbar.close()
+
+        results = top_k.results()
+        if not keep_crops:
+            self.materialize_crops(results)
+
+        logger.info(f"Found {len(results)} matches")
+
+        yield {
+            'results': results,
+            'frame_idx': frame_idx,
+            'total_frames': total_frames,
+            'done': True
+        }
+
+    def _score_crop_batch(
+        self,
+        text_features: torch.Tensor,
+        crops: List[Image.Image],
+        crop_meta: List[Dict],
+        top_k: TopKCollector,
+        keep_crops: bool = True
+    ):
+        """
+        Encode a micro-batch of crops with one forward pass and one matmul.
+
+        Matches above the threshold are offered to ``top_k`` (their metadata
+        dict plus 'similarity' and, if ``keep_crops``, 'person_crop');
+        ``crops`` and ``crop_meta`` are cleared for the next batch.
+        """
+        if not crops:
+            return
+
+        image_features = self.siglip.encode_image(crops)
+        similarities = self.siglip.compute_similarity(
+            text_features,
+            image_features
+        )[0].float().cpu().numpy()  # [N], single GPU->CPU sync
+
+        floor = max(self.similarity_threshold, top_k.floor)
+        for crop_idx in np.flatnonzero(similarities >= floor):
+            result = crop_meta[crop_idx]
+            result['similarity'] = float(similarities[crop_idx])
+            if keep_crops:
+                result['person_crop'] = crops[crop_idx]
+            top_k.push(result)
+
+        crops.clear()
+        crop_meta.clear()
+
+    def search_watchlist_in_video(
+        self,
+        video_path: str,
+        watchlist: CaseWatchlist,
+        max_results_per_case: int = MAX_RESULTS
+    ) -> Dict[Hashable, List[Dict]]:
+        """
+        Search for every case in a watchlist with a single pass over a video.
+
+        Each frame is decoded, detected and encoded once; all crops of the
+        frame are scored against every case in one matmul.
+
+        Args:
+            video_path: Path to video file
+            watchlist: Cases to search for
+            max_results_per_case: Maximum number of results kept per case
+
+        Returns:
+            Dict mapping case id to its match results (only cases with hits)
+        """
+        logger.info(f"Searching {len(watchlist)} cases in video: {video_path}")
+
+        # Open video
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise ValueError(f"Cannot open video: {video_path}")
+
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = cap.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS
+
+        case_top_k: Dict[Hashable, TopKCollector] = {}
         frame_idx = 0
 
+        self._reset_scheduler()
+
         # Progress bar
         pbar = tqdm(total=total_frames, desc="Processing video")
 
@@ -153,40 +405,41 @@ class PersonSearchPipeline:
                 break
 
             # Skip frames
-            if frame_idx % self.frame_skip != 0:
+            if self._should_skip(frame, frame_idx):
                 frame_idx += 1
                 pbar.update(1)
                 continue
 
-            # Detect persons
+            # Detect and crop persons
+            crops = []
+            crop_meta = []
             bboxes = self.detect_persons(frame)
-
-            # Process each detected person
+            self._report_persons(bboxes)
             for bbox_idx, bbox in enumerate(bboxes):
                 person_crop = self.crop_person(frame, bbox)
-                if person_crop is None:
-                    continue
-
-                # Encode person image
-                image_features = self.siglip.encode_image(person_crop)
-
-                # Compute similarity
-                similarity = self.siglip.compute_similarity(
-                    text_features,
-                    image_features
-                )[0, 0].item()
-
-                # Check threshold
-                if similarity >= self.similarity_threshold:
-                    result = {
+                if person_crop is not None:
+                    crops.append(person_crop)
+                    crop_meta.append((bbox_idx, bbox))
+
+            if crops:
+                # Encode all crops of the frame at once and score every case
+                image_features = self.siglip.encode_image(crops)
+
+                # Text references use the pipeline threshold, reference images their own
+                matches = watchlist.matches(image_features, text_threshold=self.similarity_threshold)
+                for crop_idx, case_id, similarity, match_type in matches:
+                    bbox_idx, bbox = crop_meta[crop_idx]
+                    if case_id not in case_top_k:
+                        case_top_k[case_id] = TopKCollector(max_results_per_case)
+                    case_top_k[case_id].push({
                         'frame_idx': frame_idx,
                         'timestamp': frame_idx / fps,
                         'similarity': similarity,
+                        'match_type': match_type,
                         'bbox': bbox,
-                        'person_crop': person_crop,
+                        'person_crop': crops[crop_idx],
                         'bbox_idx': bbox_idx
-                    }
-                    results.append(result)
+                    })
 
             frame_idx += 1
             pbar.update(1)
@@ -194,19 +447,12 @@ class PersonSearchPipeline:
         cap.release()
         pbar.close()
 
-        # Sort by similarity
-        results.sort(key=lambda x: x['similarity'], reverse=True)
+        # Best results per case, sorted by similarity
+        case_results = {case_id: top_k.results() for case_id, top_k in case_top_k.items()}
 
-        # Limit results
-        results = results[:max_results]
-
-        logger.info(f"Found {len(results)} matches")
+        logger.info(f"Found matches for {len(case_results)}/{len(watchlist)} cases")
 
-        # Save results
-        if save_results and results:
-            self._save_results(results, video_path, text_query)
-
-        return results
+        return case_results
 
     def search_in_image_folder(
         self,
@@ -235,7 +481,9 @@ class PersonSearchPipeline:
         # Encode text query
         text_features = self.siglip.encode_text(text_query)
 
-        results = []
+        top_k = TopKCollector(max_results)
+        crops = []
+        crop_meta = []
 
         for img_path in tqdm(image_files, desc="Processing images"):
             frame = cv2.imread(str(img_path))
@@ -245,30 +493,263 @@ class PersonSearchPipeline:
             # Detect persons
             bboxes = self.detect_persons(frame)
 
-            # Process each person
+            # Queue each person for batched encoding
             for bbox_idx, bbox in enumerate(bboxes):
                 person_crop = self.crop_person(frame, bbox)
                 if person_crop is None:
                     continue
 
-                # Compute similarity
-                image_features = self.siglip.encode_image(person_crop)
-                similarity = self.siglip.compute_similarity(
-                    text_features,
-                    image_features
-                )[0, 0].item()
+                crops.append(person_crop)
+                crop_meta.append({
+                    'image_path': str(img_path),
+                    'bbox': bbox,
+                    'bbox_idx': bbox_idx
+                })
 
-                if similarity >= self.similarity_threshold:
-                    results.append({
-                        'image_path': str(img_path),
-                        'similarity': similarity,
-                        'bbox': bbox,
-                        'person_crop': person_crop,
-                        'bbox_idx': bbox_idx
-                    })
+            if len(crops) >= self.crop_batch_size:
+                self._score_crop_batch(text_features, crops, crop_meta, top_k)
+
+        self._score_crop_batch(text_features, crops, crop_meta, top_k)
+
+        return top_k.results()
+
+    def open_index(self, index_dir: str = INDEX_DIR) -> CropEmbeddingIndex:
+        """
+        Open (or create) a crop embedding index for this pipeline's model.
+
+        Args:
+            index_dir: Directory holding the index files
+
+        Returns:
+            CropEmbeddingIndex
+        """
+        dim = self.siglip.encode_text("person").shape[-1]
+        # Stable across hub and local-cache loads; includes the @onnx[-int8] suffix
+        return CropEmbeddingIndex(index_dir, dim=dim, model_name=self.siglip.model_name)
+
+    def ingest_video(
+        self,
+        video_path: str,
+        index: CropEmbeddingIndex,
+        skip_existing: bool = True
+    ) -> int:
+        """
+        Detect and encode every person crop of a video once and store it.
+
+        Args:
+            video_path: Path to video file
+            index: Index to append the crop embeddings to
+            skip_existing: Skip videos that were already ingested
+
+        Returns:
+            Number of crops added
+        """
+        if skip_existing and index.has_source(str(video_path)):
+            logger.info(f"Already ingested: {video_path}")
+            return 0
+
+        logger.info(f"Ingesting video: {video_path}")
+
+        # Open video
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise ValueError(f"Cannot open video: {video_path}")
+
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = cap.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS
+
+        source = str(video_path)
+        buffer = self._new_ingest_buffer()
+        added = 0
+        frame_idx = 0
+
+        index.begin_source(source)
+
+        self._reset_scheduler()
+
+        # Progress bar
+        pbar = tqdm(total=total_frames, desc="Ingesting video")
+
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+
+            # Skip frames
+            if self._should_skip(frame, frame_idx):
+                frame_idx += 1
+                pbar.update(1)
+                continue
+
+            bboxes = self.detect_persons(frame)
+            self._report_persons(bboxes)
+            added += self._ingest_frame(frame, bboxes, buffer, frame_idx, frame_idx / fps)
+            if len(buffer["bboxes"]) >= INDEX_FLUSH_ROWS:
+                self._flush_ingest(index, source, buffer)
+
+            frame_idx += 1
+            pbar.update(1)
+
+        cap.release()
+        pbar.close()
+
+        # Registered only now: an interrupted ingest is redone on the next run
+        self._flush_ingest(index, source, buffer)
+        index.finish_source(source)
+
+        logger.info(f"Ingested {added} crops from {video_path}")
+        return added
 
-        results.sort(key=lambda x: x['similarity'], reverse=True)
-        return results[:max_results]
+    def ingest_image_folder(
+        self,
+        image_folder: str,
+        index: CropEmbeddingIndex,
+        skip_existing: bool = True
+    ) -> int:
+        """
+        Detect and encode every person crop of an image folder once and store it.
+
+        Args:
+            image_folder: Path to folder containing images
+            index: Index to append the crop embeddings to
+            skip_existing: Skip images that were already ingested
+
+        Returns:
+            Number of crops added
+        """
+        image_folder = Path(image_folder)
+        image_files = list(image_folder.glob("*.jpg")) + \
+                     list(image_folder.glob("*.png")) + \
+                     list(image_folder.glob("*.jpeg"))
+
+        added = 0
+        for img_path in tqdm(image_files, desc="Ingesting images"):
+            if skip_existing and index.has_source(str(img_path)):
+                continue
+
+            frame = cv2.imread(str(img_path))
+            if frame is None:
+                continue
+
+            source = str(img_path)
+            buffer = self._new_ingest_buffer()
+            index.begin_source(source)
+            added += self._ingest_frame(frame, self.detect_persons(frame), buffer, 0, 0.0)
+            self._flush_ingest(index, source, buffer)
+            index.finish_source(source)
+
+        logger.info(f"Ingested {added} crops from {image_folder}")
+        return added
+
+    @staticmethod
+    def _new_ingest_buffer() -> Dict[str, List]:
+        return {"features": [], "frame_idx": [], "timestamps": [], "bboxes": [], "bbox_idx": []}
+
+    def _ingest_frame(
+        self,
+        frame: np.ndarray,
+        bboxes: List[Tuple[int, int, int, int]],
+        buffer: Dict[str, List],
+        frame_idx: int,
+        timestamp: float
+    ) -> int:
+        """Encode all detected person crops of one frame into the ingest buffer."""
+        crops = []
+        kept_bboxes = []
+        bbox_indices = []
+        for bbox_idx, bbox in enumerate(bboxes):
+            person_crop = self.crop_person(frame, bbox)
+            if person_crop is not None:
+                crops.append(person_crop)
+                kept_bboxes.append(bbox)
+                bbox_indices.append(bbox_idx)
+
+        if not crops:
+            return 0
+
+        buffer["features"].append(self.siglip.encode_image(crops).float().cpu().numpy())
+        buffer["frame_idx"].extend([frame_idx] * len(crops))
+        buffer["timestamps"].extend([timestamp] * len(crops))
+        buffer["bboxes"].extend(kept_bboxes)
+        buffer["bbox_idx"].extend(bbox_indices)
+        return len(crops)
+
+    def _flush_ingest(self, index: CropEmbeddingIndex, source: str, buffer: Dict[str, List]):
+        """Append buffered crops to the index in one write and clear the buffer."""
+        if buffer["bboxes"]:
+            index.add(
+                np.concatenate(buffer["features"]),
+                source=source,
+                frame_idx=buffer["frame_idx"],
+                timestamps=buffer["timestamps"],
+                bboxes=buffer["bboxes"],
+                bbox_idx=buffer["bbox_idx"]
+            )
+        for values in buffer.values():
+            values.clear()
+
+    def search_index(
+        self,
+        index: CropEmbeddingIndex,
+        text_query: str,
+        max_results: int = MAX_RESULTS,
+        with_crops: bool = False
+    ) -> List[Dict]:
+        """
+        Search previously ingested crops with a text query.
+
+        Only the text tower runs; no video is decoded unless ``with_crops``.
+
+        Args:
+            index: Index filled by ingest_video / ingest_image_folder
+            text_query: Text description of person to find
+            max_results: Maximum number of results to return
+            with_crops: Re-read the source frames to attach 'person_crop'
+
+        Returns:
+            List of match results with metadata (including 'source')
+        """
+        text_features = self.siglip.encode_text(text_query).float().cpu().numpy()
+        results = index.search(
+            text_features[0],
+            top_k=max_results,
+            threshold=self.similarity_threshold
+        )
+
+        if with_crops:
+            self.materialize_crops(results)
+
+        return results
+
+    def materialize_crops(self, results: List[Dict]) -> List[Dict]:
+        """
+        Attach 'person_crop' to results by re-reading their source frames.
+
+        Args:
+            results: Results carrying 'source', 'frame_idx' and 'bbox'
+
+        Returns:
+            The same results, with 'person_crop' filled in where readable
+        """
+        by_source: Dict[str, List[Dict]] = {}
+        for result in results:
+            by_source.setdefault(result['source'], []).append(result)
+
+        for source, source_results in by_source.items():
+            frame = cv2.imread(source) if Path(source).suffix.lower() in (".jpg", ".jpeg", ".png") else None
+            if frame is not None:
+                for result in source_results:
+                    result['person_crop'] = self.crop_person(frame, result['bbox'])
+                continue
+
+            cap = cv2.VideoCapture(source)
+            for result in sorted(source_results, key=lambda x: x['frame_idx']):
+                cap.set(cv2.CAP_PROP_POS_FRAMES, result['frame_idx'])
+                ret, frame = cap.read()
+                result['person_crop'] = self.crop_person(frame, result['bbox']) if ret else None
+            cap.release()
+
+        return results
 
     def _save_results(
         self,
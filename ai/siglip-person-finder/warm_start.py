@@ -0,0 +1,98 @@
+"""
+Eager model loading, warmup and startup timing for the apps and API server
+"""
+
+import threading
+import time
+from typing import Dict, Optional, Tuple
+import logging
+
+from config import COLD_START_BUDGET_S, WARMUP_ON_START
+from model import SigLIPPersonFinder
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Reference point for time-to-ready / time-to-first-result (module import is
+# the first thing the apps do after interpreter start)
+PROCESS_START = time.monotonic()
+
+
+def load_finder(warmup: bool = WARMUP_ON_START, **kwargs) -> Tuple[SigLIPPersonFinder, Dict[str, float]]:
+    """
+    Load SigLIP (from the local artifact cache when available) and warm it up.
+
+    Args:
+        warmup: Run a dummy batch after loading
+        **kwargs: Passed to SigLIPPersonFinder
+
+    Returns:
+        (finder, timings) with load_s, warmup_s and total_s
+    """
+    start = time.perf_counter()
+    finder = SigLIPPersonFinder(**kwargs)
+    load_s = time.perf_counter() - start
+
+    warmup_s = finder.warmup() if warmup else 0.0
+    timings = {
+        "load_s": load_s,
+        "warmup_s": warmup_s,
+        "total_s": load_s + warmup_s,
+    }
+
+    logger.info(f"SigLIP ready in {timings['total_s']:.1f}s "
+                f"(load {load_s:.1f}s, warmup {warmup_s:.1f}s)")
+    if timings["total_s"] > COLD_START_BUDGET_S:
+        logger.warning(f"Cold start exceeded budget of {COLD_START_BUDGET_S}s")
+
+    return finder, timings
+
+
+class StartupTracker:
+    """
+    Readiness state of a service, kept apart from liveness.
+
+    A process is live as soon as it serves requests; it is ready once the
+    model is loaded and warmed up.
+    """
+
+    def __init__(self, budget_s: float = COLD_START_BUDGET_S):
+        self.budget_s = budget_s
+        self._lock = threading.Lock()
+        self.ready = False
+        self.error: Optional[str] = None
+        self.timings: Dict[str, float] = {}
+        self.time_to_ready_s: Optional[float] = None
+        self.time_to_first_result_s: Optional[float] = None
+
+    def mark_ready(self, timings: Dict[str, float]):
+        with self._lock:
+            self.timings = timings
+            self.time_to_ready_s = time.monotonic() - PROCESS_START
+            self.ready = True
+            self.error = None
+
+    def mark_failed(self, error: BaseException):
+        with self._lock:
+            self.error = str(error)
+
+    def mark_first_result(self):
+        """Record time-to-first-result (only the first call counts)."""
+        if self.time_to_first_result_s is None:
+            with self._lock:
+                if self.time_to_first_result_s is None:
+                    self.time_to_first_result_s = time.monotonic() - PROCESS_START
+                    logger.info(f"Time to first result: {self.time_to_first_result_s:.1f}s")
+
+    def info(self) -> Dict:
+        elapsed = self.time_to_ready_s if self.ready else time.monotonic() - PROCESS_START
+        return {
+            "ready": self.ready,
+            "error": self.error,
+            "uptime_s": time.monotonic() - PROCESS_START,
+            "time_to_ready_s": self.time_to_ready_s,
+            "time_to_first_result_s": self.time_to_first_result_s,
+            "budget_s": self.budget_s,
+            "within_budget": elapsed <= self.budget_s,
+            **self.timings,
+        }
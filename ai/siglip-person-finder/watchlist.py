@@ -0,0 +1,221 @@
+"""
+Multi-case watchlist for searching many missing persons in one pass
+"""
+
+import torch
+from PIL import Image
+import numpy as np
+from typing import Dict, Hashable, List, Optional, Tuple, Union
+import logging
+
+from model import SigLIPPersonFinder
+from config import DEFAULT_SIMILARITY_THRESHOLD, IMAGE_SIMILARITY_THRESHOLD
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Reference kinds; each is scored and thresholded on its own scale
+REFERENCE_KINDS = ("text", "image")
+
+
+class CaseWatchlist:
+    """
+    Index of SigLIP embeddings for every active case, keyed by case id.
+
+    Each case may hold several text descriptions and/or reference images.
+    Text and image references are kept apart: SigLIP image-to-image cosine
+    runs far higher than text-to-image, so each kind has its own threshold.
+    Per kind, all references are stacked into one normalized matrix so a
+    batch of person crops is scored against every case with a single matmul.
+    """
+
+    def __init__(
+        self,
+        siglip_model: Optional[SigLIPPersonFinder],
+        text_threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+        image_threshold: float = IMAGE_SIMILARITY_THRESHOLD
+    ):
+        """
+        Initialize an empty watchlist.
+
+        Args:
+            siglip_model: SigLIP model used to encode case descriptions/images
+                (None if only precomputed embeddings are added)
+            text_threshold: Minimum similarity for a text reference match
+            image_threshold: Minimum similarity for a reference image match
+        """
+        self.siglip = siglip_model
+        self.thresholds = {"text": text_threshold, "image": image_threshold}
+        self._case_features: Dict[str, Dict[Hashable, torch.Tensor]] = {kind: {} for kind in REFERENCE_KINDS}
+        self.case_ids: List[Hashable] = []
+        # Per kind: (reference matrix [R, D], padded gather index [C, Kmax]) or None
+        self._stacks: Optional[Dict[str, Optional[Tuple[torch.Tensor, torch.Tensor]]]] = None
+        self._device: Optional[torch.device] = None
+
+    def __len__(self) -> int:
+        return len(self._all_case_ids())
+
+    def __contains__(self, case_id: Hashable) -> bool:
+        return any(case_id in features for features in self._case_features.values())
+
+    def _all_case_ids(self) -> List[Hashable]:
+        return list(dict.fromkeys(
+            case_id for kind in REFERENCE_KINDS for case_id in self._case_features[kind]
+        ))
+
+    def add_case(
+        self,
+        case_id: Hashable,
+        text_queries: Optional[Union[str, List[str]]] = None,
+        images: Optional[List[Union[Image.Image, np.ndarray]]] = None
+    ):
+        """
+        Add (or replace) a case from text descriptions and/or reference images.
+
+        Args:
+            case_id: Case identifier (e.g. MissingCase id)
+            text_queries: Description(s) of the person
+            images: Reference image(s) of the person
+        """
+        if not text_queries and not images:
+            raise ValueError(f"Case {case_id} needs text_queries or images")
+
+        self.remove_case(case_id)
+        if text_queries:
+            self.add_case_features(case_id, self.siglip.encode_text(text_queries), kind="text")
+        if images:
+            self.add_case_features(case_id, self.siglip.encode_image(images), kind="image")
+
+    def add_case_features(self, case_id: Hashable, features: torch.Tensor, kind: str = "text"):
+        """
+        Add (or replace) one kind of reference for a case from precomputed SigLIP embeddings.
+
+        Args:
+            case_id: Case identifier
+            features: Embeddings [K, embedding_dim]
+            kind: "text" or "image"
+        """
+        if kind not in REFERENCE_KINDS:
+            raise ValueError(f"Unknown reference kind: {kind}")
+
+        features = torch.as_tensor(features, dtype=torch.float32)
+        if features.dim() == 1:
+            features = features.unsqueeze(0)
+
+        self._case_features[kind][case_id] = features / features.norm(dim=-1, keepdim=True)
+        self._stacks = None
+
+    def remove_case(self, case_id: Hashable):
+        """Remove a case from the watchlist."""
+        for features in self._case_features.values():
+            if features.pop(case_id, None) is not None:
+                self._stacks = None
+
+    def _stack(
+        self,
+        kind: str,
+        device: Union[str, torch.device]
+    ) -> Optional[Tuple[torch.Tensor, torch.Tensor]]:
+        """Stack one kind of reference into a matrix plus a padded gather index."""
+        features = self._case_features[kind]
+        blocks = [features.get(case_id) for case_id in self.case_ids]
+        counts = torch.tensor([0 if block is None else len(block) for block in blocks])
+        if int(counts.sum()) == 0:
+            return None
+
+        reference_matrix = torch.cat([block for block in blocks if block is not None], dim=0).to(device)
+
+        num_refs = reference_matrix.shape[0]
+        offsets = torch.cumsum(counts, dim=0) - counts
+        slots = torch.arange(int(counts.max()))
+        mask = slots.unsqueeze(0) < counts.unsqueeze(1)
+
+        # Empty slots (and cases without this kind) point at an extra -inf column appended in score()
+        pad_index = torch.where(
+            mask,
+            offsets.unsqueeze(1) + slots.unsqueeze(0),
+            torch.full_like(mask, num_refs, dtype=torch.long)
+        ).to(device)
+        return reference_matrix, pad_index
+
+    def _build(self, device: Union[str, torch.device]):
+        self.case_ids = self._all_case_ids()
+        self._stacks = {kind: self._stack(kind, device) for kind in REFERENCE_KINDS}
+        self._device = device
+
+    def score(self, image_features: torch.Tensor) -> Dict[str, torch.Tensor]:
+        """
+        Score person crops against every case.
+
+        Args:
+            image_features: Crop embeddings [N, embedding_dim]
+
+        Returns:
+            Per reference kind, a similarity matrix [N, C]: the best match over
+            the case's references of that kind, -inf if it has none
+            (columns follow ``case_ids``)
+        """
+        if not len(self):
+            raise ValueError("Watchlist is empty")
+        if self._stacks is None or self._device != image_features.device:
+            self._build(image_features.device)
+
+        image_features = image_features.float()
+        image_features = image_features / image_features.norm(dim=-1, keepdim=True)
+
+        scores = {}
+        for kind, stack in self._stacks.items():
+            if stack is None:
+                scores[kind] = torch.full(
+                    (image_features.shape[0], len(self.case_ids)),
+                    float("-inf"),
+                    device=image_features.device
+                )
+                continue
+
+            reference_matrix, pad_index = stack
+            similarities = torch.matmul(image_features, reference_matrix.T)  # [N, R]
+            padding = torch.full(
+                (similarities.shape[0], 1),
+                float("-inf"),
+                device=similarities.device
+            )
+            per_case = torch.cat([similarities, padding], dim=1)[:, pad_index]  # [N, C, Kmax]
+            scores[kind] = per_case.max(dim=2).values
+
+        return scores
+
+    def matches(
+        self,
+        image_features: torch.Tensor,
+        text_threshold: Optional[float] = None
+    ) -> List[Tuple[int, Hashable, float, str]]:
+        """
+        Crop/case pairs that pass the threshold of their reference kind.
+
+        Args:
+            image_features: Crop embeddings [N, embedding_dim]
+            text_threshold: Override for the text reference threshold
+
+        Returns:
+            List of (crop index, case id, similarity, kind). When both kinds
+            match, the one with the larger margin over its threshold is kept.
+        """
+        thresholds = dict(self.thresholds)
+        if text_threshold is not None:
+            thresholds["text"] = text_threshold
+
+        best: Dict[Tuple[int, int], Tuple[float, float, str]] = {}
+        for kind, scores in self.score(image_features).items():
+            scores = scores.cpu().numpy()
+            for crop_idx, case_idx in np.argwhere(scores >= thresholds[kind]):
+                similarity = float(scores[crop_idx, case_idx])
+                margin = similarity - thresholds[kind]
+                key = (int(crop_idx), int(case_idx))
+                if key not in best or margin > best[key][0]:
+                    best[key] = (margin, similarity, kind)
+
+        return [
+            (crop_idx, self.case_ids[case_idx], similarity, kind)
+            for (crop_idx, case_idx), (_, similarity, kind) in sorted(best.items())
+        ]
@@ -0,0 +1,87 @@
+"""
+YOLO 전처리 마이크로 벤치마크
+- 기존 방식: 640x640 강제 리사이즈 + 매 호출 새 배열 할당
+- letterbox 방식: 종횡비 유지 + 미리 할당한 입력 버퍼 재사용
+- (옵션) IOBinding 사용 여부에 따른 detect_persons 전체 시간
+"""
+
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from missing_person_detector_onnx import MissingPersonDetectorONNX
+
+
+def preprocess_stretch(image, input_size=640):
+    """기존 전처리 (비교용): 종횡비 무시 리사이즈, 단계마다 새 배열 할당"""
+    img_resized = cv2.resize(image, (input_size, input_size))
+    img_rgb = cv2.cvtColor(img_resized, cv2.COLOR_BGR2RGB)
+    img_normalized = img_rgb.astype(np.float32) / 255.0
+    img_transposed = np.transpose(img_normalized, (2, 0, 1))
+    return np.expand_dims(img_transposed, axis=0)
+
+
+def measure(fn, iterations, warmup=10):
+    """평균 실행 시간 (ms)"""
+    for _ in range(warmup):
+        fn()
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='YOLO 전처리 마이크로 벤치마크')
+    parser.add_argument('--yolo', default='yolov8n.onnx', help='YOLO ONNX 모델 경로')
+    parser.add_argument('--osnet', default='osnet_x1_0.onnx', help='OSNet ONNX 모델 경로')
+    parser.add_argument('--width', type=int, default=1920, help='입력 프레임 폭')
+    parser.add_argument('--height', type=int, default=1080, help='입력 프레임 높이')
+    parser.add_argument('--iterations', type=int, default=200, help='반복 횟수')
+    parser.add_argument('--no-gpu', action='store_true', help='GPU 비활성화 (CPU만 사용)')
+    args = parser.parse_args()
+
+    frame = np.random.randint(0, 255, (args.height, args.width, 3), dtype=np.uint8)
+
+    detector = MissingPersonDetectorONNX(
+        yolo_onnx_path=args.yolo,
+        osnet_onnx_path=args.osnet,
+        use_gpu=not args.no_gpu
+    )
+    binding_detector = MissingPersonDetectorONNX(
+        yolo_onnx_path=args.yolo,
+        osnet_onnx_path=args.osnet,
+        use_gpu=not args.no_gpu,
+        use_io_binding=True
+    )
+
+    input_size = detector.yolo_input_size
+
+    def run_stretch():
+        input_data = preprocess_stretch(frame, input_size)
+        detector.yolo_session.run(None, {detector.yolo_input_name: input_data})
+
+    print("\n" + "=" * 60)
+    print(f"📊 YOLO 전처리 벤치마크 ({args.width}x{args.height}, {args.iterations}회)")
+    print("=" * 60)
+
+    stretch_ms = measure(lambda: preprocess_stretch(frame, input_size), args.iterations)
+    letterbox_ms = measure(lambda: detector.preprocess_yolo(frame), args.iterations)
+    print(f"전처리 (기존 stretch):      {stretch_ms:.3f}ms")
+    print(f"전처리 (letterbox + 버퍼):  {letterbox_ms:.3f}ms ({stretch_ms / letterbox_ms:.2f}x)")
+
+    full_stretch_ms = measure(run_stretch, args.iterations)
+    full_letterbox_ms = measure(lambda: detector.detect_persons(frame), args.iterations)
+    full_binding_ms = measure(lambda: binding_detector.detect_persons(frame), args.iterations)
+    print(f"\n탐지 전체 (기존 stretch):   {full_stretch_ms:.3f}ms")
+    print(f"탐지 전체 (letterbox):      {full_letterbox_ms:.3f}ms")
+    print(f"탐지 전체 (+ IOBinding):    {full_binding_ms:.3f}ms")
+    print(f"사용 Provider: {detector.providers[0]}")
+    print("=" * 60 + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -15,7 +15,8 @@ from PIL import Image
 import os
 
 
-def convert_yolov8_to_onnx(model_path='yolov8n.pt', output_path='yolov8n.onnx', imgsz=640):
+def convert_yolov8_to_onnx(model_path='yolov8n.pt', output_path='yolov8n.onnx', imgsz=640,
+                           dynamic_batch=False):
     """
     YOLOv8 모델을 ONNX로 변환
 
@@ -23,6 +24,7 @@ def convert_yolov8_to_onnx(model_path='yolov8n.pt', output_path='yolov8n.onnx',
         model_path: YOLOv8 PyTorch 모델 경로
         output_path: 출력 ONNX 모델 경로
         imgsz: 입력 이미지 크기 (기본값: 640)
+        dynamic_batch: 동적 배치 축으로 export (detect_persons_batch로 여러 프레임 동시 추론)
     """
     print(f"\n{'='*60}")
     print("🔄 YOLOv8 → ONNX 변환 시작...")
@@ -38,7 +40,7 @@ def convert_yolov8_to_onnx(model_path='yolov8n.pt', output_path='yolov8n.onnx',
             imgsz=imgsz,
             simplify=True,  # 모델 단순화 (속도 향상)
             opset=12,       # ONNX opset 버전
-            dynamic=False   # 고정 입력 크기 (더 빠름)
+            dynamic=dynamic_batch  # 기본은 고정 입력 크기 (더 빠름)
         )
 
         # 생성된 파일명 확인 (ultralytics는 자동으로 이름 생성)
@@ -59,7 +61,7 @@ def convert_yolov8_to_onnx(model_path='yolov8n.pt', output_path='yolov8n.onnx',
             print(f"   파일 크기: {os.path.getsize(output_path) / 1024 / 1024:.2f} MB")
 
             # 성능 테스트
-            test_onnx_yolo(output_path, imgsz)
+            test_onnx_yolo(output_path, imgsz, batch_sizes=(1, 4, 8) if dynamic_batch else (1,))
 
             return output_path
         else:
@@ -122,6 +124,11 @@ def convert_osnet_to_onnx(output_path='osnet_x1_0.onnx'):
         onnx_model = onnx.load(output_path)
         onnx.checker.check_model(onnx_model)
 
+        # 배치 축이 동적으로 export 되었는지 확인 (프레임 단위 배치 임베딩용)
+        batch_dim = onnx_model.graph.input[0].type.tensor_type.shape.dim[0]
+        if not batch_dim.dim_param:
+            raise ValueError(f"OSNet 입력 배치 축이 고정되어 있습니다: {batch_dim.dim_value}")
+
         print(f"\n✅ OSNet ONNX 변환 완료!")
         print(f"   저장 경로: {output_path}")
         print(f"   파일 크기: {os.path.getsize(output_path) / 1024 / 1024:.2f} MB")
@@ -138,8 +145,8 @@ def convert_osnet_to_onnx(output_path='osnet_x1_0.onnx'):
         return None
 
 
-def test_onnx_yolo(onnx_path, imgsz=640, iterations=50):
-    """ONNX YOLOv8 성능 테스트"""
+def test_onnx_yolo(onnx_path, imgsz=640, iterations=50, batch_sizes=(1,)):
+    """ONNX YOLOv8 성능 테스트 (동적 배치 모델은 배치 크기별)"""
     import time
 
     print(f"\n📊 YOLOv8 ONNX 성능 테스트 중... ({iterations}회)")
@@ -147,31 +154,36 @@ def test_onnx_yolo(onnx_path, imgsz=640, iterations=50):
     # ONNX Runtime 세션 생성
     providers = ['CUDAExecutionProvider', 'CPUExecutionProvider'] if torch.cuda.is_available() else ['CPUExecutionProvider']
     session = ort.InferenceSession(onnx_path, providers=providers)
+    input_name = session.get_inputs()[0].name
+
+    for batch_size in batch_sizes:
+        # 더미 입력 생성
+        dummy_input = np.random.randn(batch_size, 3, imgsz, imgsz).astype(np.float32)
 
-    # 더미 입력 생성
-    dummy_input = np.random.randn(1, 3, imgsz, imgsz).astype(np.float32)
+        # Warm-up
+        for _ in range(5):
+            session.run(None, {input_name: dummy_input})
 
-    # Warm-up
-    for _ in range(5):
-        session.run(None, {session.get_inputs()[0].name: dummy_input})
+        # 성능 측정
+        times = []
+        for _ in range(iterations):
+            start = time.time()
+            outputs = session.run(None, {input_name: dummy_input})
+            times.append(time.time() - start)
 
-    # 성능 측정
-    times = []
-    for _ in range(iterations):
-        start = time.time()
-        session.run(None, {session.get_inputs()[0].name: dummy_input})
-        times.append(time.time() - start)
+        assert outputs[0].shape[0] == batch_size
 
-    avg_time = np.mean(times) * 1000  # ms
-    fps = 1000 / avg_time
+        avg_time = np.mean(times) * 1000  # ms
+        fps = 1000 * batch_size / avg_time
+
+        print(f"   [batch={batch_size}] 평균 추론 시간: {avg_time:.2f}ms")
+        print(f"   [batch={batch_size}] 예상 FPS: {fps:.1f}")
 
-    print(f"   평균 추론 시간: {avg_time:.2f}ms")
-    print(f"   예상 FPS: {fps:.1f}")
     print(f"   사용 Provider: {session.get_providers()[0]}")
 
 
-def test_onnx_osnet(onnx_path, iterations=100):
-    """ONNX OSNet 성능 테스트"""
+def test_onnx_osnet(onnx_path, iterations=100, batch_sizes=(1, 8, 32)):
+    """ONNX OSNet 성능 테스트 (배치 크기별)"""
     import time
 
     print(f"\n📊 OSNet ONNX 성능 테스트 중... ({iterations}회)")
@@ -180,29 +192,40 @@ def test_onnx_osnet(onnx_path, iterations=100):
     providers = ['CUDAExecutionProvider', 'CPUExecutionProvider'] if torch.cuda.is_available() else ['CPUExecutionProvider']
     session = ort.InferenceSession(onnx_path, providers=providers)
 
-    # 더미 입력 생성
-    dummy_input = np.random.randn(1, 3, 256, 128).astype(np.float32)
+    for batch_size in batch_sizes:
+        # 더미 입력 생성
+        dummy_input = np.random.randn(batch_size, 3, 256, 128).astype(np.float32)
+
+        # Warm-up
+        for _ in range(5):
+            session.run(None, {'input': dummy_input})
 
-    # Warm-up
-    for _ in range(5):
-        session.run(None, {'input': dummy_input})
+        # 성능 측정
+        times = []
+        for _ in range(iterations):
+            start = time.time()
+            outputs = session.run(None, {'input': dummy_input})
+            times.append(time.time() - start)
 
-    # 성능 측정
-    times = []
-    for _ in range(iterations):
-        start = time.time()
-        session.run(None, {'input': dummy_input})
-        times.append(time.time() - start)
+        assert outputs[0].shape[0] == batch_size
 
-    avg_time = np.mean(times) * 1000  # ms
+        avg_time = np.mean(times) * 1000  # ms
+
+        print(f"   [batch={batch_size}] 평균 추론 시간: {avg_time:.2f}ms")
+        print(f"   [batch={batch_size}] 초당 처리 가능: {1000 * batch_size / avg_time:.0f} 명")
 
-    print(f"   평균 추론 시간: {avg_time:.2f}ms")
-    print(f"   초당 처리 가능: {1000/avg_time:.0f} 명")
     print(f"   사용 Provider: {session.get_providers()[0]}")
 
 
 def main():
     """메인 함수"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='YOLOv8 / OSNet ONNX 변환기')
+    parser.add_argument('--dynamic-batch', action='store_true',
+                        help='YOLOv8을 동적 배치로 export (여러 프레임/카메라 동시 추론)')
+    args = parser.parse_args()
+
     print("\n" + "="*60)
     print("🚀 ONNX 모델 변환기")
     print("="*60)
@@ -221,7 +244,8 @@ def main():
     yolo_onnx = convert_yolov8_to_onnx(
         model_path='yolov8n.pt',
         output_path='yolov8n.onnx',
-        imgsz=640
+        imgsz=640,
+        dynamic_batch=args.dynamic_batch
     )
 
     # 2. OSNet 변환
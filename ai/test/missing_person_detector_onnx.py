@@ -1,22 +1,136 @@
 """
 ONNX 기반 최적화된 실종자 탐지 시스템
 - YOLOv8 ONNX: 2-3배 속도 향상
-- OSNet ONNX: 1.5-2배 속도 향상
-- 프레임 스킵: 선택적 프레임 처리
+- OSNet ONNX: 1.5-2배 속도 향상 (프레임 단위 배치 임베딩)
+- 프레임 스킵: 선택적 프레임 처리 (고정 간격 또는 움직임 기반 적응형)
 - 해상도 다운스케일: 메모리 및 속도 최적화
-- 멀티스레딩: 병렬 처리
+- letterbox 전처리: 종횡비 유지 + 입력 버퍼 재사용 (옵션: IOBinding)
+- 멀티스레딩: 디코딩/추론/인코딩 단계 파이프라인
+- 인물 추적: 같은 사람의 OSNet 재임베딩 생략 (옵션)
 """
 
 import cv2
 import numpy as np
 import onnxruntime as ort
-from PIL import Image
 import time
+import queue
+import threading
 from concurrent.futures import ThreadPoolExecutor
 import torch
 
+from person_tracker import PersonTracker, appearance_histogram
+from motion_gate import MotionGatedScheduler
+
+
+class MissingPersonWatchlist:
+    """
+    여러 실종 사건(case)의 OSNet 참조 임베딩을 하나의 인덱스로 관리
+
+    모든 사건의 참조 임베딩을 (R, D) 행렬 하나로 쌓아 두고, 탐지 임베딩과
+    행렬곱 한 번으로 비교한 뒤 사건별로 매칭 전략을 적용합니다.
+    영상 한 번의 디코딩/탐지/임베딩으로 모든 사건의 결과를 얻을 수 있습니다.
+    """
+
+    def __init__(self):
+        self._case_embeddings = {}  # case_id -> (K, D)
+        self.case_ids = []
+        self.reference_matrix = None  # (R, D)
+        self._pad_index = None  # (C, Kmax), 빈 칸은 패딩 열(R)을 가리킴
+        self._pad_mask = None  # (C, Kmax)
+        self._counts = None  # (C,)
+
+    def __len__(self):
+        return len(self._case_embeddings)
+
+    def __contains__(self, case_id):
+        return case_id in self._case_embeddings
+
+    def add_case(self, case_id, embeddings):
+        """
+        사건 추가 (같은 case_id가 있으면 교체)
+
+        Args:
+            case_id: 사건 ID (예: MissingCase ID)
+            embeddings: (K, D) L2 정규화된 참조 임베딩
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.ndim == 1:
+            embeddings = embeddings[np.newaxis]
+        if embeddings.shape[0] == 0:
+            raise ValueError(f"참조 임베딩이 없습니다: {case_id}")
+
+        self._case_embeddings[case_id] = embeddings
+        self.reference_matrix = None
+
+    def remove_case(self, case_id):
+        """사건 제거"""
+        if self._case_embeddings.pop(case_id, None) is not None:
+            self.reference_matrix = None
+
+    def _build(self):
+        """사건별 임베딩을 하나의 행렬과 패딩 인덱스로 재구성"""
+        self.case_ids = list(self._case_embeddings.keys())
+        blocks = [self._case_embeddings[case_id] for case_id in self.case_ids]
+
+        self._counts = np.array([len(block) for block in blocks], dtype=np.int64)
+        self.reference_matrix = np.ascontiguousarray(np.concatenate(blocks, axis=0))
+
+        num_refs = self.reference_matrix.shape[0]
+        max_refs = int(self._counts.max())
+        offsets = np.concatenate([[0], np.cumsum(self._counts)[:-1]])
+
+        slots = np.arange(max_refs)
+        self._pad_mask = slots[np.newaxis, :] < self._counts[:, np.newaxis]
+        self._pad_index = np.where(self._pad_mask, offsets[:, np.newaxis] + slots, num_refs)
+
+    def score(self, embeddings, matching_strategy='average', similarity_threshold=0.75):
+        """
+        탐지 임베딩과 모든 사건의 유사도 계산
+
+        Args:
+            embeddings: (N, D) L2 정규화된 탐지 임베딩
+            matching_strategy: 매칭 전략 ('max', 'average', 'weighted', 'strict')
+            similarity_threshold: 'strict' 전략에서 사용하는 임계값
+
+        Returns:
+            (N, C) 사건별 최종 유사도 (열 순서는 case_ids)
+        """
+        if not self._case_embeddings:
+            raise ValueError("감시 목록에 사건이 없습니다!")
+        if self.reference_matrix is None:
+            self._build()
+
+        # 코사인 유사도 (N, R) + 패딩 열 -> (N, C, Kmax)
+        similarities = np.asarray(embeddings, dtype=np.float32) @ self.reference_matrix.T
+        padding = np.full((similarities.shape[0], 1), -np.inf, dtype=np.float32)
+        per_case = np.concatenate([similarities, padding], axis=1)[:, self._pad_index]
+
+        mask = self._pad_mask[np.newaxis]
+        average = np.where(mask, per_case, 0.0).sum(axis=2) / self._counts
+
+        if matching_strategy == 'max':
+            return per_case.max(axis=2)
+        elif matching_strategy == 'weighted':
+            k = min(3, per_case.shape[2])
+            top_k = -np.sort(-per_case, axis=2)[:, :, :k]
+            top_k_mask = np.arange(k)[np.newaxis, :] < np.minimum(self._counts, 3)[:, np.newaxis]
+            return np.where(top_k_mask[np.newaxis], top_k, 0.0).sum(axis=2) / np.minimum(self._counts, 3)
+        elif matching_strategy == 'strict':
+            min_sim = np.where(mask, per_case, np.inf).min(axis=2)
+            return np.where(min_sim >= (similarity_threshold - 0.1), average, min_sim)
+        else:
+            return average
+
 
 class MissingPersonDetectorONNX:
+    # OSNet 입력 크기 (width, height) 및 ImageNet 정규화 값
+    OSNET_INPUT_SIZE = (128, 256)
+    OSNET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+    OSNET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+    # 파이프라인 단계 종료 표시
+    _STAGE_END = object()
+
     def __init__(
         self,
         yolo_onnx_path='yolov8n.onnx',
@@ -25,7 +139,15 @@ class MissingPersonDetectorONNX:
         matching_strategy='average',
         frame_skip=0,  # 0: 모든 프레임, 1: 1프레임 건너뛰기, 2: 2프레임 건너뛰기
         resize_factor=1.0,  # 1.0: 원본, 0.5: 50% 축소
-        use_gpu=True
+        use_gpu=True,
+        osnet_batch_size=32,
+        pipeline_queue_size=8,
+        num_threads=0,
+        use_tracking=False,
+        track_refresh_interval=30,
+        adaptive_skip=False,
+        max_frame_skip=30,
+        use_io_binding=False
     ):
         """
         ONNX 기반 실종자 탐지 시스템 초기화
@@ -38,29 +160,84 @@ class MissingPersonDetectorONNX:
             frame_skip: 프레임 스킵 간격 (0=모든 프레임 처리)
             resize_factor: 해상도 축소 비율 (0.5 = 50% 크기)
             use_gpu: GPU 사용 여부
+            osnet_batch_size: OSNet 한 번의 추론에 넣을 최대 크롭 수
+            pipeline_queue_size: process_video 단계 사이 큐의 최대 프레임 수
+            num_threads: ONNX Runtime intra-op 스레드 수 (0=자동)
+            use_tracking: 프레임 간 인물 추적으로 같은 사람의 재임베딩 생략
+            track_refresh_interval: 추적 중인 사람을 다시 임베딩하는 주기 (처리 프레임 수)
+            adaptive_skip: 움직임/사람 유무에 따라 프레임 스킵 간격을 조정
+                (frame_skip은 최소 간격, max_frame_skip은 정적인 장면의 최대 간격)
+            max_frame_skip: 적응형 스킵의 최대 스킵 간격
+            use_io_binding: YOLO 입력 버퍼를 ONNX Runtime IOBinding으로 고정 바인딩
         """
         print("🚀 ONNX 기반 최적화 모델 로딩 중...")
 
+        # 프로세스 분할 처리 시 워커에서 동일한 탐지기를 다시 만들기 위한 설정
+        self._init_kwargs = {
+            'yolo_onnx_path': yolo_onnx_path,
+            'osnet_onnx_path': osnet_onnx_path,
+            'similarity_threshold': similarity_threshold,
+            'matching_strategy': matching_strategy,
+            'frame_skip': frame_skip,
+            'resize_factor': resize_factor,
+            'use_gpu': use_gpu,
+            'osnet_batch_size': osnet_batch_size,
+            'pipeline_queue_size': pipeline_queue_size,
+            'num_threads': num_threads,
+            'use_tracking': use_tracking,
+            'track_refresh_interval': track_refresh_interval,
+            'adaptive_skip': adaptive_skip,
+            'max_frame_skip': max_frame_skip,
+            'use_io_binding': use_io_binding
+        }
+
         # ONNX Runtime 설정
         self.providers = self._get_providers(use_gpu)
         print(f"   사용 Provider: {self.providers[0]}")
 
+        session_options = ort.SessionOptions()
+        session_options.intra_op_num_threads = num_threads
+
         # YOLOv8 ONNX 세션 생성
         print(f"   YOLOv8 ONNX 로딩: {yolo_onnx_path}")
         self.yolo_session = ort.InferenceSession(
             yolo_onnx_path,
+            sess_options=session_options,
             providers=self.providers
         )
         self.yolo_input_name = self.yolo_session.get_inputs()[0].name
         self.yolo_input_shape = self.yolo_session.get_inputs()[0].shape
         print(f"   ✓ YOLOv8 입력 크기: {self.yolo_input_shape}")
 
+        # letterbox 입력 버퍼 (매 프레임 재사용, 동적 크기 export면 640 사용)
+        input_size = self.yolo_input_shape[2]
+        self.yolo_input_size = input_size if isinstance(input_size, int) else 640
+        self._yolo_input = np.zeros((1, 3, self.yolo_input_size, self.yolo_input_size), dtype=np.float32)
+        self._letterbox_canvas = np.full((self.yolo_input_size, self.yolo_input_size, 3), 114, dtype=np.uint8)
+        self._letterbox_layout = None
+        self._yolo_lock = threading.Lock()
+
+        # 동적 배치 export 여부 (detect_persons_batch용)
+        self.yolo_dynamic_batch = not isinstance(self.yolo_input_shape[0], int)
+        self._yolo_batch_input = np.zeros((0, 3, self.yolo_input_size, self.yolo_input_size), dtype=np.float32)
+
+        # IOBinding: 입력 버퍼를 한 번만 바인딩하여 프레임마다 복사/할당 생략
+        self._yolo_binding = None
+        if use_io_binding:
+            self._yolo_binding = self.yolo_session.io_binding()
+            self._yolo_binding.bind_cpu_input(self.yolo_input_name, self._yolo_input)
+            for output in self.yolo_session.get_outputs():
+                self._yolo_binding.bind_output(output.name)
+            print("   ✓ YOLOv8 IOBinding 사용")
+
         # OSNet ONNX 세션 생성
         print(f"   OSNet ONNX 로딩: {osnet_onnx_path}")
         self.osnet_session = ort.InferenceSession(
             osnet_onnx_path,
+            sess_options=session_options,
             providers=self.providers
         )
+        self.osnet_input_name = self.osnet_session.get_inputs()[0].name
         print(f"   ✓ OSNet 로딩 완료")
 
         # 설정
@@ -68,11 +245,23 @@ class MissingPersonDetectorONNX:
         self.matching_strategy = matching_strategy
         self.frame_skip = frame_skip
         self.resize_factor = resize_factor
+        self.osnet_batch_size = max(1, osnet_batch_size)
+        self.pipeline_queue_size = max(1, pipeline_queue_size)
+
+        # 인물 추적기 (트랙별 임베딩/유사도 캐시)
+        self.tracker = PersonTracker(refresh_interval=track_refresh_interval) if use_tracking else None
 
-        # 실종자 임베딩
+        # 움직임 기반 적응형 프레임 스킵
+        self.frame_scheduler = MotionGatedScheduler(
+            min_stride=frame_skip + 1,
+            max_stride=max_frame_skip + 1
+        ) if adaptive_skip else None
+
+        # 실종자 임베딩 (reference_matrix: (M, D) 행렬)
         self.missing_person_embeddings = []
+        self.reference_matrix = None
 
-        # 스레드 풀 (병렬 처리용)
+        # 스레드 풀 (process_video의 디코딩/추론 단계용)
         self.executor = ThreadPoolExecutor(max_workers=2)
 
         print("✅ 모델 로딩 완료!\n")
@@ -84,81 +273,147 @@ class MissingPersonDetectorONNX:
         else:
             return ['CPUExecutionProvider']
 
-    def preprocess_yolo(self, image):
-        """YOLO 입력 전처리"""
+    def _letterbox_params(self, orig_w, orig_h):
+        """letterbox 배치 계산: (비율, 리사이즈 크기, 좌/상 패딩)"""
+        input_size = self.yolo_input_size
+        ratio = min(input_size / orig_w, input_size / orig_h)
+        new_w = int(round(orig_w * ratio))
+        new_h = int(round(orig_h * ratio))
+        left = (input_size - new_w) // 2
+        top = (input_size - new_h) // 2
+        return ratio, new_w, new_h, left, top
+
+    def _letterbox_into(self, image, out):
+        """
+        letterbox 전처리 결과를 (3, S, S) float32 버퍼에 직접 기록
+
+        Returns:
+            letterbox 정보 (비율, 좌 패딩, 상 패딩, 원본 폭, 원본 높이)
+        """
         # 원본 크기 저장
         orig_h, orig_w = image.shape[:2]
 
-        # 해상도 축소 (옵션)
-        if self.resize_factor != 1.0:
-            new_w = int(orig_w * self.resize_factor)
-            new_h = int(orig_h * self.resize_factor)
-            image = cv2.resize(image, (new_w, new_h))
+        ratio, new_w, new_h, left, top = layout = self._letterbox_params(orig_w, orig_h)
 
-        # YOLO 입력 크기로 리사이즈
-        input_size = self.yolo_input_shape[2]  # 640
-        img_resized = cv2.resize(image, (input_size, input_size))
+        # 배치가 바뀌었을 때만 패딩 영역 초기화
+        if layout != self._letterbox_layout:
+            self._letterbox_canvas.fill(114)
+            self._letterbox_layout = layout
 
-        # BGR to RGB
-        img_rgb = cv2.cvtColor(img_resized, cv2.COLOR_BGR2RGB)
+        self._letterbox_canvas[top:top + new_h, left:left + new_w] = cv2.resize(
+            image, (new_w, new_h), interpolation=cv2.INTER_LINEAR
+        )
 
-        # 정규화 및 차원 변경
-        img_normalized = img_rgb.astype(np.float32) / 255.0
-        img_transposed = np.transpose(img_normalized, (2, 0, 1))  # HWC -> CHW
-        img_batched = np.expand_dims(img_transposed, axis=0)  # 배치 차원 추가
+        # BGR -> RGB, HWC -> CHW, 정규화를 입력 버퍼에 직접 기록
+        for channel in range(3):
+            np.multiply(
+                self._letterbox_canvas[:, :, 2 - channel], 1.0 / 255.0,
+                out=out[channel], casting='unsafe'
+            )
 
-        return img_batched, (orig_w, orig_h)
+        return ratio, left, top, orig_w, orig_h
 
-    def postprocess_yolo(self, outputs, orig_size, conf_threshold=0.5):
-        """YOLO 출력 후처리"""
-        predictions = outputs[0]  # (1, 84, 8400)
-        predictions = predictions[0]  # (84, 8400)
+    def preprocess_yolo(self, image):
+        """
+        YOLO 입력 전처리 (letterbox)
 
-        # 전치 (8400, 84)
-        predictions = predictions.T
+        종횡비를 유지한 채 리사이즈하고 회색(114)으로 패딩합니다.
+        결과는 미리 할당한 NCHW float32 버퍼(self._yolo_input)에 직접 기록되므로
+        다음 호출 전에 사용해야 합니다.
 
-        # 박스 좌표와 클래스 점수 분리
-        boxes = predictions[:, :4]  # (8400, 4)
-        scores = predictions[:, 4:]  # (8400, 80)
+        Returns:
+            (입력 버퍼, letterbox 정보) - letterbox 정보는 postprocess_yolo에 전달
+        """
+        letterbox = self._letterbox_into(image, self._yolo_input[0])
+        return self._yolo_input, letterbox
 
-        # 클래스 0 (person)만 필터링
-        person_scores = scores[:, 0]
-        mask = person_scores > conf_threshold
+    def postprocess_yolo(self, outputs, letterbox, conf_threshold=0.5):
+        """YOLO 출력 후처리 (letterbox 패딩 제거 후 원본 좌표로 변환)"""
+        return self._postprocess_yolo_batch(outputs[0][:1], [letterbox], conf_threshold)[0]
 
-        if not np.any(mask):
-            return []
+    def _postprocess_yolo_batch(self, predictions, letterboxes, conf_threshold=0.5):
+        """
+        배치 YOLO 출력 후처리
+
+        신뢰도 필터링, 좌표 변환, 패딩 제거를 배치 전체에 대해 한 번에 수행하고
+        프레임별 박스를 겹치지 않게 이동시켜 NMS도 한 번만 실행합니다.
+
+        Args:
+            predictions: (B, 84, 8400) YOLO 출력
+            letterboxes: 프레임별 letterbox 정보 리스트
+
+        Returns:
+            프레임별 탐지 결과 리스트
+        """
+        # 클래스 0 (person) 점수로 필터링 (B, 8400)
+        person_scores = predictions[:, 4, :]
+        frame_idx, anchor_idx = np.nonzero(person_scores > conf_threshold)
+
+        results = [[] for _ in range(len(letterboxes))]
+        if len(frame_idx) == 0:
+            return results
 
         # 필터링된 박스와 점수
-        boxes = boxes[mask]
-        person_scores = person_scores[mask]
+        boxes = predictions[frame_idx, :4, anchor_idx]  # (K, 4) xywh
+        scores = person_scores[frame_idx, anchor_idx]
 
         # xywh -> xyxy 변환
         boxes_xyxy = self._xywh2xyxy(boxes)
 
-        # 원본 이미지 크기로 스케일 조정
-        orig_w, orig_h = orig_size
-        input_size = self.yolo_input_shape[2]
-
-        scale_x = orig_w / input_size
-        scale_y = orig_h / input_size
+        # 패딩 제거 및 원본 이미지 크기로 스케일 조정 (프레임별 값을 행마다 펼쳐서 적용)
+        letterbox_arr = np.asarray(letterboxes, dtype=np.float32)[frame_idx]  # (K, 5)
+        ratio = letterbox_arr[:, 0:1]
+        pad = np.stack([letterbox_arr[:, 1], letterbox_arr[:, 2]] * 2, axis=1)
+        limits = np.stack([letterbox_arr[:, 3], letterbox_arr[:, 4]] * 2, axis=1)
 
-        boxes_xyxy[:, [0, 2]] *= scale_x
-        boxes_xyxy[:, [1, 3]] *= scale_y
+        boxes_xyxy = np.clip((boxes_xyxy - pad) / ratio, 0, limits)
 
-        # NMS (Non-Maximum Suppression)
-        indices = self._nms(boxes_xyxy, person_scores, iou_threshold=0.45)
+        # 프레임별 NMS를 한 번에: 프레임마다 좌표를 충분히 떨어뜨림
+        offsets = frame_idx[:, np.newaxis] * (limits.max() + 1.0)
+        indices = self._nms(boxes_xyxy + offsets, scores, iou_threshold=0.45)
 
-        results = []
         for idx in indices:
             x1, y1, x2, y2 = boxes_xyxy[idx].astype(int)
-            conf = float(person_scores[idx])
-            results.append({
+            results[frame_idx[idx]].append({
                 'bbox': [x1, y1, x2, y2],
-                'confidence': conf
+                'confidence': float(scores[idx])
             })
 
         return results
 
+    def detect_persons_batch(self, frames):
+        """
+        여러 프레임(여러 카메라 가능)에서 한 번의 YOLO 추론으로 사람 탐지
+
+        동적 배치로 export한 YOLO 모델(convert_yolov8_to_onnx(dynamic_batch=True))이
+        필요하며, 배치 크기가 고정된 모델이면 프레임별로 detect_persons를 호출합니다.
+
+        Args:
+            frames: BGR 프레임 리스트 (크기가 서로 달라도 됨)
+
+        Returns:
+            프레임별 탐지 결과 리스트
+        """
+        if len(frames) == 0:
+            return []
+        if not self.yolo_dynamic_batch:
+            return [self.detect_persons(frame) for frame in frames]
+
+        with self._yolo_lock:
+            # 배치 입력 버퍼 (필요할 때만 확장)
+            if self._yolo_batch_input.shape[0] < len(frames):
+                self._yolo_batch_input = np.zeros(
+                    (len(frames), 3, self.yolo_input_size, self.yolo_input_size), dtype=np.float32
+                )
+            batch_input = self._yolo_batch_input[:len(frames)]
+
+            letterboxes = [
+                self._letterbox_into(frame, batch_input[i]) for i, frame in enumerate(frames)
+            ]
+            outputs = self.yolo_session.run(None, {self.yolo_input_name: batch_input})
+
+        return self._postprocess_yolo_batch(outputs[0], letterboxes)
+
     def _xywh2xyxy(self, boxes):
         """중심점 형식(xywh)을 좌상단-우하단 형식(xyxy)으로 변환"""
         boxes_xyxy = np.copy(boxes)
@@ -199,93 +454,323 @@ class MissingPersonDetectorONNX:
 
         return keep
 
-    def extract_embedding(self, image):
-        """OSNet ONNX로 임베딩 추출"""
-        if isinstance(image, np.ndarray):
-            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            image = Image.fromarray(image)
+    def _preprocess_osnet(self, images):
+        """
+        OSNet 배치 전처리
+
+        크롭마다 리사이즈만 개별로 수행하고, 정규화와 HWC -> NCHW 변환은
+        배치 전체에 대해 한 번에 벡터 연산으로 처리합니다.
+
+        Args:
+            images: BGR numpy 배열 또는 RGB PIL 이미지 리스트
+
+        Returns:
+            (N, 3, 256, 128) float32 배열
+        """
+        input_w, input_h = self.OSNET_INPUT_SIZE
+        batch = np.empty((len(images), input_h, input_w, 3), dtype=np.uint8)
+
+        for i, image in enumerate(images):
+            if isinstance(image, np.ndarray):
+                image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            else:
+                image = np.asarray(image.convert('RGB'))
+            # PIL BILINEAR(축소 시 안티에일리어싱)과 결과가 약간 달라 임베딩 값도 조금 달라짐
+            batch[i] = cv2.resize(image, (input_w, input_h), interpolation=cv2.INTER_LINEAR)
 
-        # 전처리
-        img_resized = image.resize((128, 256))  # OSNet 입력 크기
-        img_array = np.array(img_resized).astype(np.float32) / 255.0
+        # 정규화 (배치 단위)
+        batch = batch.astype(np.float32)
+        batch *= 1.0 / 255.0
+        batch -= self.OSNET_MEAN
+        batch /= self.OSNET_STD
 
-        # 정규화
-        mean = np.array([0.485, 0.456, 0.406]).reshape(1, 1, 3)
-        std = np.array([0.229, 0.224, 0.225]).reshape(1, 1, 3)
-        img_normalized = (img_array - mean) / std
+        # 차원 변경 (NHWC -> NCHW)
+        return np.ascontiguousarray(batch.transpose(0, 3, 1, 2))
 
-        # 차원 변경 (HWC -> CHW)
-        img_transposed = np.transpose(img_normalized, (2, 0, 1))
-        img_batched = np.expand_dims(img_transposed, axis=0).astype(np.float32)
+    def extract_embeddings(self, images):
+        """
+        OSNet ONNX로 여러 이미지의 임베딩을 한 번에 추출
+
+        한 프레임의 모든 크롭(또는 여러 프레임의 크롭)을 모아 동적 배치 축으로
+        추론합니다. osnet_batch_size 단위로 나누어 실행합니다.
+
+        Args:
+            images: BGR numpy 배열 또는 RGB PIL 이미지 리스트
+
+        Returns:
+            (N, 512) L2 정규화된 임베딩 배열
+        """
+        if len(images) == 0:
+            return np.empty((0, self.osnet_session.get_outputs()[0].shape[1]), dtype=np.float32)
+
+        features = []
+        for start in range(0, len(images), self.osnet_batch_size):
+            chunk = images[start:start + self.osnet_batch_size]
+            input_data = self._preprocess_osnet(chunk)
+            outputs = self.osnet_session.run(None, {self.osnet_input_name: input_data})
+            features.append(outputs[0])
 
-        # 추론
-        outputs = self.osnet_session.run(None, {'input': img_batched})
-        features = outputs[0]  # (1, 512)
+        features = np.concatenate(features, axis=0).astype(np.float32, copy=False)
 
         # L2 정규화
-        features = features / np.linalg.norm(features, axis=1, keepdims=True)
+        features /= np.linalg.norm(features, axis=1, keepdims=True)
 
         return features
 
+    def extract_embedding(self, image):
+        """OSNet ONNX로 임베딩 추출"""
+        return self.extract_embeddings([image])  # (1, 512)
+
     def set_missing_person(self, image):
         """단일 이미지 설정"""
-        self.missing_person_embeddings = [self.extract_embedding(image)]
+        self._set_reference_embeddings(self.extract_embedding(image))
 
     def set_missing_persons(self, images):
         """여러 이미지 설정"""
-        self.missing_person_embeddings = []
-        for image in images:
-            embedding = self.extract_embedding(image)
-            self.missing_person_embeddings.append(embedding)
+        self._set_reference_embeddings(self.extract_embeddings(list(images)))
 
-    def compute_similarity(self, embedding):
-        """실종자와의 유사도 계산"""
+    def _set_reference_embeddings(self, embeddings):
+        """참조 임베딩을 (M, D) 연속 float32 행렬로 저장"""
+        self.reference_matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+        self.missing_person_embeddings = [embedding[np.newaxis] for embedding in self.reference_matrix]
+
+    def compute_similarities(self, embeddings):
+        """
+        여러 탐지 임베딩과 모든 참조 임베딩의 유사도를 한 번에 계산
+
+        (N, D) x (D, M) 행렬곱 한 번으로 N x M 코사인 유사도를 구한 뒤
+        매칭 전략에 따라 참조 축(M)을 NumPy로 축약합니다.
+
+        Args:
+            embeddings: (N, D) L2 정규화된 임베딩
+
+        Returns:
+            (N,) 최종 유사도 배열
+        """
         if not self.missing_person_embeddings:
             raise ValueError("실종자 이미지를 먼저 설정해주세요!")
 
-        similarities = []
-        for ref_embedding in self.missing_person_embeddings:
-            # 코사인 유사도
-            similarity = np.dot(embedding, ref_embedding.T)[0][0]
-            similarities.append(similarity)
+        # 코사인 유사도 (N, M)
+        similarities = np.asarray(embeddings, dtype=np.float32) @ self.reference_matrix.T
+        num_refs = similarities.shape[1]
 
         # 매칭 전략에 따라 최종 유사도 계산
         if self.matching_strategy == 'max':
-            return max(similarities)
-        elif self.matching_strategy == 'average':
-            return sum(similarities) / len(similarities)
+            return similarities.max(axis=1)
         elif self.matching_strategy == 'weighted':
-            sorted_sims = sorted(similarities, reverse=True)
-            k = min(3, len(sorted_sims))
-            top_k = sorted_sims[:k]
-            return sum(top_k) / len(top_k)
+            k = min(3, num_refs)
+            top_k = np.partition(similarities, num_refs - k, axis=1)[:, num_refs - k:]
+            return top_k.mean(axis=1)
         elif self.matching_strategy == 'strict':
-            min_sim = min(similarities)
-            avg_sim = sum(similarities) / len(similarities)
-            if min_sim >= (self.similarity_threshold - 0.1):
-                return avg_sim
-            else:
-                return min_sim
+            min_sim = similarities.min(axis=1)
+            avg_sim = similarities.mean(axis=1)
+            return np.where(min_sim >= (self.similarity_threshold - 0.1), avg_sim, min_sim)
         else:
-            return sum(similarities) / len(similarities)
+            # 'average' 및 알 수 없는 전략
+            return similarities.mean(axis=1)
+
+    def compute_similarity(self, embedding):
+        """실종자와의 유사도 계산"""
+        return float(self.compute_similarities(embedding)[0])
+
+    def create_watchlist(self, case_images):
+        """
+        여러 사건의 참조 이미지로 감시 목록 생성
+
+        모든 사건의 이미지를 한 번에 배치 임베딩합니다.
+
+        Args:
+            case_images: {case_id: [이미지, ...]} 딕셔너리
+
+        Returns:
+            MissingPersonWatchlist
+        """
+        case_ids = []
+        images = []
+        for case_id, case_imgs in case_images.items():
+            for image in case_imgs:
+                case_ids.append(case_id)
+                images.append(image)
+
+        embeddings = self.extract_embeddings(images)
+
+        watchlist = MissingPersonWatchlist()
+        for case_id in dict.fromkeys(case_ids):
+            rows = [i for i, cid in enumerate(case_ids) if cid == case_id]
+            watchlist.add_case(case_id, embeddings[rows])
+
+        return watchlist
+
+    def _should_skip(self, frame, frame_count):
+        """고정 간격 또는 움직임 기반 스케줄러로 프레임 스킵 여부 결정"""
+        if self.frame_scheduler is not None:
+            return not self.frame_scheduler.should_process(frame)
+        return self.frame_skip > 0 and (frame_count - 1) % (self.frame_skip + 1) != 0
+
+    def _report_persons(self, detections):
+        """적응형 스킵: 처리한 프레임의 사람 수로 다음 처리 간격 조정 (영상 루프 전용)"""
+        if self.frame_scheduler is not None:
+            self.frame_scheduler.report(len(detections))
 
     def detect_persons(self, frame):
         """프레임에서 사람 탐지"""
-        # YOLO 전처리
-        input_data, orig_size = self.preprocess_yolo(frame)
-
-        # YOLO 추론
-        outputs = self.yolo_session.run(None, {self.yolo_input_name: input_data})
+        # 입력 버퍼를 공유하므로 전처리~추론 구간은 한 스레드씩
+        with self._yolo_lock:
+            # YOLO 전처리
+            input_data, letterbox = self.preprocess_yolo(frame)
+
+            # YOLO 추론
+            if self._yolo_binding is not None:
+                self.yolo_session.run_with_iobinding(self._yolo_binding)
+                outputs = self._yolo_binding.copy_outputs_to_cpu()
+            else:
+                outputs = self.yolo_session.run(None, {self.yolo_input_name: input_data})
 
         # YOLO 후처리
-        detections = self.postprocess_yolo(outputs, orig_size)
+        detections = self.postprocess_yolo(outputs, letterbox)
 
         return detections
 
-    def process_video(self, video_path, output_path, progress_callback=None):
-        """영상 처리"""
-        if not self.missing_person_embeddings:
+    def _score_detections(self, frame, detections, score_fn):
+        """
+        탐지된 사람 영역을 크롭하여 한 번에 임베딩하고 점수 계산 (빈/면적 0 크롭은 제외)
+
+        유효하지 않은 크롭은 배치 전에 걸러내므로, 임베딩 중 발생한 예외는
+        실제 오류로 보고 그대로 전달합니다.
+
+        추적기가 켜져 있으면 새 트랙/갱신 주기/외형 변화가 있는 사람만 임베딩하고
+        나머지는 트랙에 캐시된 (평활화된) 점수를 재사용합니다.
+
+        Args:
+            score_fn: (N, D) 임베딩 -> N개 점수 함수
+
+        Returns:
+            [(bbox, score), ...] 리스트
+        """
+        bboxes = []
+        crops = []
+        for det in detections:
+            x1, y1, x2, y2 = det['bbox']
+
+            # 면적이 없는 박스는 배치에 넣지 않음
+            if x2 <= x1 or y2 <= y1:
+                continue
+
+            # 사람 영역 크롭
+            person_img = frame[max(y1, 0):y2, max(x1, 0):x2]
+            if person_img.size == 0:
+                continue
+
+            bboxes.append((x1, y1, x2, y2))
+            crops.append(person_img)
+
+        if self.tracker is None:
+            if not crops:
+                return []
+            scores = score_fn(self.extract_embeddings(crops))
+            return list(zip(bboxes, scores))
+
+        tracks = self.tracker.update(bboxes)
+        if not crops:
+            return []
+
+        histograms = [appearance_histogram(crop) for crop in crops]
+        stale = [
+            i for i, (track, histogram) in enumerate(zip(tracks, histograms))
+            if self.tracker.needs_embedding(track, histogram)
+        ]
+
+        if stale:
+            embeddings = self.extract_embeddings([crops[i] for i in stale])
+            scores = score_fn(embeddings)
+
+            self.tracker.stats['embeddings'] += len(stale)
+            for i, embedding, score in zip(stale, embeddings, scores):
+                tracks[i].update_appearance(
+                    embedding, score, histograms[i], self.tracker.score_smoothing
+                )
+
+        return [(bbox, track.score) for bbox, track in zip(bboxes, tracks)]
+
+    def match_persons(self, frame, detections):
+        """
+        탐지된 사람들을 한 번의 배치 추론으로 실종자와 비교
+
+        Args:
+            frame: 탐지에 사용한 프레임 (BGR)
+            detections: detect_persons 결과
+
+        Returns:
+            [(bbox, similarity), ...] 리스트 (빈 크롭은 제외)
+        """
+        matches = self._score_detections(frame, detections, self.compute_similarities)
+
+        return [(bbox, float(similarity)) for bbox, similarity in matches]
+
+    def match_watchlist(self, frame, detections, watchlist):
+        """
+        탐지된 사람들을 감시 목록의 모든 사건과 비교
+
+        Returns:
+            [(bbox, case_scores), ...] 리스트 (case_scores: watchlist.case_ids 순서의 (C,) 배열)
+        """
+        return self._score_detections(
+            frame, detections,
+            lambda embeddings: watchlist.score(embeddings, self.matching_strategy, self.similarity_threshold)
+        )
+
+    def draw_match(self, frame, bbox, similarity, case_id=None):
+        """
+        매칭 결과를 프레임에 표시
+
+        Args:
+            case_id: 감시 목록 모드에서 가장 유사한 사건 ID (라벨에 표시)
+
+        Returns:
+            실종자로 판정되었는지 여부
+        """
+        x1, y1, x2, y2 = bbox
+
+        if similarity >= self.similarity_threshold:
+            # 빨간색 박스
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 3)
+
+            if case_id is None:
+                label = f"MISSING PERSON! ({similarity:.2f})"
+            else:
+                label = f"CASE {case_id} ({similarity:.2f})"
+            label_size, _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.7, 2)
+
+            cv2.rectangle(frame,
+                        (x1, y1 - label_size[1] - 10),
+                        (x1 + label_size[0], y1),
+                        (0, 0, 255), -1)
+
+            cv2.putText(frame, label, (x1, y1 - 5),
+                      cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+            return True
+
+        # 회색 박스
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (128, 128, 128), 2)
+        cv2.putText(frame, f"{similarity:.2f}", (x1, y1 - 5),
+                  cv2.FONT_HERSHEY_SIMPLEX, 0.5, (128, 128, 128), 1)
+        return False
+
+    def process_video(self, video_path, output_path, progress_callback=None, watchlist=None):
+        """
+        영상 처리
+
+        Args:
+            video_path: 입력 영상 경로
+            output_path: 결과 영상 경로
+            progress_callback: 진행 상황 콜백
+            watchlist: MissingPersonWatchlist (지정 시 모든 사건을 한 번에 탐색하고
+                결과에 사건별 'case_hits'를 포함)
+        """
+        if watchlist is None and not self.missing_person_embeddings:
             raise ValueError("실종자 이미지를 먼저 설정해주세요!")
+        if watchlist is not None and len(watchlist) == 0:
+            raise ValueError("감시 목록에 사건이 없습니다!")
 
         cap = cv2.VideoCapture(video_path)
         if not cap.isOpened():
@@ -309,119 +794,282 @@ class MissingPersonDetectorONNX:
         frame_count = 0
         processed_count = 0
         detection_count = 0
+        case_hits = {}
         start_time = time.time()
 
         print(f"\n영상 처리 시작...")
         print(f"  해상도: {width}x{height}")
         print(f"  총 프레임: {total_frames}")
-        print(f"  프레임 스킵: {self.frame_skip} (처리할 프레임: {total_frames // (self.frame_skip + 1)})")
-        print(f"  해상도 축소: {self.resize_factor * 100:.0f}%\n")
+        if self.frame_scheduler is not None:
+            print(f"  프레임 스킵: 적응형 ({self.frame_scheduler.min_stride - 1}~{self.frame_scheduler.max_stride - 1})")
+        else:
+            print(f"  프레임 스킵: {self.frame_skip} (처리할 프레임: {total_frames // (self.frame_skip + 1)})")
+        print(f"  해상도 축소: {self.resize_factor * 100:.0f}%")
+        print(f"  파이프라인 큐 크기: {self.pipeline_queue_size}\n")
+
+        # 디코딩 -> 추론 -> 표시/인코딩 단계를 bounded 큐로 연결 (back-pressure)
+        # 디코딩/추론은 스레드 풀에서, 표시/인코딩은 호출 스레드에서 실행합니다.
+        decode_queue = queue.Queue(maxsize=self.pipeline_queue_size)
+        infer_queue = queue.Queue(maxsize=self.pipeline_queue_size)
+        stop_event = threading.Event()
+        busy_time = {'decode': 0.0, 'inference': 0.0, 'encode': 0.0}
+
+        if self.tracker is not None:
+            self.tracker.reset()
+        if self.frame_scheduler is not None:
+            self.frame_scheduler.reset()
+
+        decode_future = self.executor.submit(
+            self._decode_stage, cap, decode_queue, stop_event, busy_time
+        )
+        infer_future = self.executor.submit(
+            self._inference_stage, decode_queue, infer_queue, stop_event, busy_time,
+            (width, height), watchlist
+        )
 
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                break
+        try:
+            while True:
+                item = self._queue_get(infer_queue, stop_event)
+                if item is self._STAGE_END:
+                    break
 
-            frame_count += 1
+                stage_start = time.time()
+                frame_count, frame, matches = item
 
-            # 프레임 스킵
-            if self.frame_skip > 0 and (frame_count - 1) % (self.frame_skip + 1) != 0:
-                # 프레임 정보만 표시하고 스킵
-                info_text = f"Frame: {frame_count}/{total_frames} [SKIP] | Detections: {detection_count}"
-                cv2.putText(frame, info_text, (10, 30),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.8, (128, 128, 128), 2)
+                detection_count = self._annotate_frame(
+                    frame, frame_count, total_frames, matches, detection_count,
+                    fps, watchlist, case_hits
+                )
                 writer.write(frame)
-                continue
+                busy_time['encode'] += time.time() - stage_start
 
-            processed_count += 1
+                if matches is None:
+                    continue
 
-            # 해상도 조정
-            if self.resize_factor != 1.0:
-                frame = cv2.resize(frame, (width, height))
+                processed_count += 1
 
-            # 사람 탐지
-            detections = self.detect_persons(frame)
+                # 진행 상황 콜백
+                if progress_callback:
+                    progress = frame_count / total_frames
+                    elapsed = time.time() - start_time
+                    fps_current = processed_count / elapsed if elapsed > 0 else 0
+                    progress_callback(progress, frame_count, total_frames, fps_current, detection_count)
+
+                # 진행 상황 출력
+                if frame_count % 30 == 0:
+                    elapsed = time.time() - start_time
+                    fps_current = processed_count / elapsed if elapsed > 0 else 0
+                    print(f"처리 중... {frame_count}/{total_frames} 프레임 ({fps_current:.1f} fps)")
+        finally:
+            # 정상 종료/예외 모두 작업 스레드를 정리
+            stop_event.set()
+            try:
+                decode_future.result()
+                infer_future.result()
+            finally:
+                cap.release()
+                writer.release()
 
-            # 탐지된 사람들 처리
-            for det in detections:
-                x1, y1, x2, y2 = det['bbox']
-                conf = det['confidence']
+        elapsed_time = time.time() - start_time
+        actual_fps = processed_count / elapsed_time if elapsed_time > 0 else 0
+        stage_utilization = {
+            stage: (busy / elapsed_time if elapsed_time > 0 else 0.0)
+            for stage, busy in busy_time.items()
+        }
 
-                # 사람 영역 크롭
-                person_img = frame[y1:y2, x1:x2]
-                if person_img.size == 0:
-                    continue
+        print(f"\n처리 완료!")
+        print(f"  총 프레임: {frame_count}")
+        print(f"  처리된 프레임: {processed_count}")
+        print(f"  총 시간: {elapsed_time:.2f}초")
+        print(f"  실제 처리 FPS: {actual_fps:.2f}")
+        print(f"  탐지 횟수: {detection_count}")
+        print("  단계별 사용률: " + ", ".join(
+            f"{stage} {util * 100:.0f}%" for stage, util in stage_utilization.items()
+        ))
 
-                try:
-                    # 임베딩 추출 및 유사도 계산
-                    person_embedding = self.extract_embedding(person_img)
-                    similarity = self.compute_similarity(person_embedding)
+        results = {
+            'total_frames': frame_count,
+            'processed_frames': processed_count,
+            'detection_count': detection_count,
+            'elapsed_time': elapsed_time,
+            'avg_fps': actual_fps,
+            'stage_utilization': stage_utilization
+        }
 
-                    if similarity >= self.similarity_threshold:
-                        detection_count += 1
+        if self.tracker is not None:
+            results['tracking'] = dict(self.tracker.stats)
+            print(f"  OSNet 임베딩: {self.tracker.stats['embeddings']}/{self.tracker.stats['detections']}명")
 
-                        # 빨간색 박스
-                        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 3)
+        if watchlist is not None:
+            print(f"  발견된 사건: {len(case_hits)}/{len(watchlist)}")
+            results['case_hits'] = case_hits
 
-                        label = f"MISSING PERSON! ({similarity:.2f})"
-                        label_size, _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.7, 2)
+        return results
 
-                        cv2.rectangle(frame,
-                                    (x1, y1 - label_size[1] - 10),
-                                    (x1 + label_size[0], y1),
-                                    (0, 0, 255), -1)
+    def _infer_frame(self, frame, frame_count, frame_size, watchlist=None):
+        """
+        프레임 한 장 추론 (스킵 판정 + 해상도 조정 + 탐지 + 매칭)
 
-                        cv2.putText(frame, label, (x1, y1 - 5),
-                                  cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-                    else:
-                        # 회색 박스
-                        cv2.rectangle(frame, (x1, y1), (x2, y2), (128, 128, 128), 2)
-                        cv2.putText(frame, f"{similarity:.2f}", (x1, y1 - 5),
-                                  cv2.FONT_HERSHEY_SIMPLEX, 0.5, (128, 128, 128), 1)
+        Args:
+            frame: 원본 프레임 (BGR)
+            frame_count: 1부터 시작하는 프레임 번호 (스킵 판정용)
+            frame_size: 처리 해상도 (width, height)
+            watchlist: MissingPersonWatchlist 또는 None
 
-                except Exception as e:
-                    continue
+        Returns:
+            (frame, matches) - 스킵 프레임이면 matches는 None
+        """
+        # 프레임 스킵
+        if self._should_skip(frame, frame_count):
+            return frame, None
+
+        # 해상도 조정
+        if self.resize_factor != 1.0:
+            frame = cv2.resize(frame, frame_size)
+
+        # 사람 탐지
+        detections = self.detect_persons(frame)
+        self._report_persons(detections)
+
+        # 탐지된 사람들 처리 (프레임 단위 배치 임베딩)
+        if watchlist is None:
+            return frame, self.match_persons(frame, detections)
+        return frame, self.match_watchlist(frame, detections, watchlist)
+
+    def _annotate_frame(self, frame, frame_count, total_frames, matches, detection_count,
+                        fps, watchlist=None, case_hits=None, show_count=True):
+        """
+        추론 결과를 프레임에 표시하고 누적 탐지 횟수를 반환
 
-            # 프레임 정보 표시
-            info_text = f"Frame: {frame_count}/{total_frames} | Detections: {detection_count}"
+        watchlist 모드에서는 임계값을 넘는 모든 사건을 case_hits에 기록합니다.
+        show_count=False이면 화면에 누적 탐지 수를 표시하지 않습니다 (분할 처리용).
+        """
+        count_text = f" | Detections: {detection_count}" if show_count else ""
+        if matches is None:
+            # 프레임 정보만 표시하고 스킵
+            info_text = f"Frame: {frame_count}/{total_frames} [SKIP]{count_text}"
             cv2.putText(frame, info_text, (10, 30),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.8, (128, 128, 128), 2)
+            return detection_count
+
+        if watchlist is None:
+            for bbox, similarity in matches:
+                if self.draw_match(frame, bbox, similarity):
+                    detection_count += 1
+        else:
+            for bbox, case_scores in matches:
+                # 임계값을 넘는 모든 사건에 기록
+                for case_idx in np.flatnonzero(case_scores >= self.similarity_threshold):
+                    case_hits.setdefault(watchlist.case_ids[case_idx], []).append({
+                        'frame_idx': frame_count - 1,
+                        'timestamp': (frame_count - 1) / fps if fps > 0 else 0.0,
+                        'bbox': bbox,
+                        'similarity': float(case_scores[case_idx])
+                    })
+
+                best = int(np.argmax(case_scores))
+                if self.draw_match(frame, bbox, float(case_scores[best]), watchlist.case_ids[best]):
+                    detection_count += 1
+
+        # 프레임 정보 표시
+        count_text = f" | Detections: {detection_count}" if show_count else ""
+        info_text = f"Frame: {frame_count}/{total_frames}{count_text}"
+        cv2.putText(frame, info_text, (10, 30),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+
+        return detection_count
+
+    def process_video_sharded(self, video_path, output_path, num_workers=None,
+                              progress_callback=None, watchlist=None):
+        """
+        영상을 키프레임 단위 구간으로 나누어 여러 프로세스에서 처리
 
-            writer.write(frame)
+        각 워커는 자체 ONNX 세션을 가진 탐지기를 생성하고, 구간을 한 번만 디코딩하여
+        추론/표시/인코딩한 뒤 하나의 영상으로 합칩니다. 결과 딕셔너리는 process_video와
+        같은 형식입니다 (tracking / stage_utilization은 구간 합계). 구간을 병렬로 처리하므로
+        화면에는 누적 탐지 수를 표시하지 않고, 추적/적응형 스킵은 구간 앞 일부 프레임으로
+        예열한 상태에서 시작합니다 (video_sharding 참고).
 
-            # 진행 상황 콜백
-            if progress_callback:
-                progress = frame_count / total_frames
-                elapsed = time.time() - start_time
-                fps_current = processed_count / elapsed if elapsed > 0 else 0
-                progress_callback(progress, frame_count, total_frames, fps_current, detection_count)
+        Args:
+            video_path: 입력 영상 경로
+            output_path: 결과 영상 경로
+            num_workers: 워커 프로세스 수 (None=CPU 코어 수)
+            progress_callback: 진행 상황 콜백 (구간 완료 시 호출)
+            watchlist: MissingPersonWatchlist (process_video와 동일)
+        """
+        from video_sharding import process_video_sharded
 
-            # 진행 상황 출력
-            if frame_count % 30 == 0:
-                elapsed = time.time() - start_time
-                fps_current = processed_count / elapsed if elapsed > 0 else 0
-                print(f"처리 중... {frame_count}/{total_frames} 프레임 ({fps_current:.1f} fps)")
+        if watchlist is None and not self.missing_person_embeddings:
+            raise ValueError("실종자 이미지를 먼저 설정해주세요!")
+        if watchlist is not None and len(watchlist) == 0:
+            raise ValueError("감시 목록에 사건이 없습니다!")
+
+        return process_video_sharded(
+            self, video_path, output_path,
+            num_workers=num_workers,
+            progress_callback=progress_callback,
+            watchlist=watchlist
+        )
 
-        cap.release()
-        writer.release()
+    def _queue_put(self, q, item, stop_event):
+        """중단 요청을 확인하면서 bounded 큐에 삽입 (삽입 성공 여부 반환)"""
+        while not stop_event.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _queue_get(self, q, stop_event):
+        """중단 요청을 확인하면서 큐에서 꺼냄 (중단 시 _STAGE_END 반환)"""
+        while True:
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                if stop_event.is_set():
+                    return self._STAGE_END
+
+    def _decode_stage(self, cap, out_queue, stop_event, busy_time):
+        """디코딩 단계: 프레임을 읽어 (번호, 프레임) 순서대로 전달"""
+        frame_count = 0
+        try:
+            while not stop_event.is_set():
+                stage_start = time.time()
+                ret, frame = cap.read()
+                busy_time['decode'] += time.time() - stage_start
+                if not ret:
+                    break
 
-        elapsed_time = time.time() - start_time
-        actual_fps = processed_count / elapsed_time if elapsed_time > 0 else 0
+                frame_count += 1
+                if not self._queue_put(out_queue, (frame_count, frame), stop_event):
+                    break
+        except Exception:
+            stop_event.set()
+            raise
+        finally:
+            self._queue_put(out_queue, self._STAGE_END, stop_event)
 
-        print(f"\n처리 완료!")
-        print(f"  총 프레임: {frame_count}")
-        print(f"  처리된 프레임: {processed_count}")
-        print(f"  총 시간: {elapsed_time:.2f}초")
-        print(f"  실제 처리 FPS: {actual_fps:.2f}")
-        print(f"  탐지 횟수: {detection_count}")
+    def _inference_stage(self, in_queue, out_queue, stop_event, busy_time, frame_size, watchlist):
+        """추론 단계: 탐지 + 배치 임베딩 + 유사도 계산 (스킵 프레임은 그대로 전달)"""
+        try:
+            while True:
+                item = self._queue_get(in_queue, stop_event)
+                if item is self._STAGE_END:
+                    break
 
-        return {
-            'total_frames': frame_count,
-            'processed_frames': processed_count,
-            'detection_count': detection_count,
-            'elapsed_time': elapsed_time,
-            'avg_fps': actual_fps
-        }
+                stage_start = time.time()
+                frame_count, frame = item
+                frame, matches = self._infer_frame(frame, frame_count, frame_size, watchlist)
+                busy_time['inference'] += time.time() - stage_start
+
+                if not self._queue_put(out_queue, (frame_count, frame, matches), stop_event):
+                    break
+        except Exception:
+            stop_event.set()
+            raise
+        finally:
+            self._queue_put(out_queue, self._STAGE_END, stop_event)
 
     def process_webcam(self, camera_index=0, max_duration=60):
         """
@@ -455,10 +1103,18 @@ class MissingPersonDetectorONNX:
         detection_count = 0
         start_time = time.time()
 
+        if self.tracker is not None:
+            self.tracker.reset()
+        if self.frame_scheduler is not None:
+            self.frame_scheduler.reset()
+
         print(f"\n웹캠 실시간 탐지 시작...")
         print(f"  해상도: {width}x{height}")
         print(f"  최대 실행 시간: {max_duration}초")
-        print(f"  프레임 스킵: {self.frame_skip}")
+        if self.frame_scheduler is not None:
+            print(f"  프레임 스킵: 적응형 ({self.frame_scheduler.min_stride - 1}~{self.frame_scheduler.max_stride - 1})")
+        else:
+            print(f"  프레임 스킵: {self.frame_skip}")
         print(f"  종료: 'q' 키\n")
 
         try:
@@ -477,7 +1133,7 @@ class MissingPersonDetectorONNX:
                     break
 
                 # 프레임 스킵
-                if self.frame_skip > 0 and (frame_count - 1) % (self.frame_skip + 1) != 0:
+                if self._should_skip(frame, frame_count):
                     cv2.imshow('Missing Person Detector - Webcam (ONNX)', frame)
                     if cv2.waitKey(1) & 0xFF == ord('q'):
                         break
@@ -491,42 +1147,12 @@ class MissingPersonDetectorONNX:
 
                 # 사람 탐지
                 detections = self.detect_persons(frame)
+                self._report_persons(detections)
 
-                # 탐지된 사람들 처리
-                for det in detections:
-                    x1, y1, x2, y2 = det['bbox']
-                    person_img = frame[y1:y2, x1:x2]
-                    if person_img.size == 0:
-                        continue
-
-                    try:
-                        person_embedding = self.extract_embedding(person_img)
-                        similarity = self.compute_similarity(person_embedding)
-
-                        if similarity >= self.similarity_threshold:
-                            detection_count += 1
-
-                            # 빨간색 박스
-                            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 3)
-
-                            label = f"MISSING PERSON! ({similarity:.2f})"
-                            label_size, _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.7, 2)
-
-                            cv2.rectangle(frame,
-                                        (x1, y1 - label_size[1] - 10),
-                                        (x1 + label_size[0], y1),
-                                        (0, 0, 255), -1)
-
-                            cv2.putText(frame, label, (x1, y1 - 5),
-                                      cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-                        else:
-                            # 회색 박스
-                            cv2.rectangle(frame, (x1, y1), (x2, y2), (128, 128, 128), 2)
-                            cv2.putText(frame, f"{similarity:.2f}", (x1, y1 - 5),
-                                      cv2.FONT_HERSHEY_SIMPLEX, 0.5, (128, 128, 128), 1)
-
-                    except Exception:
-                        continue
+                # 탐지된 사람들 처리 (프레임 단위 배치 임베딩)
+                for bbox, similarity in self.match_persons(frame, detections):
+                    if self.draw_match(frame, bbox, similarity):
+                        detection_count += 1
 
                 # 실시간 정보 표시
                 fps_current = processed_count / elapsed if elapsed > 0 else 0
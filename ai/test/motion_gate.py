@@ -0,0 +1,98 @@
+"""
+움직임 기반 적응형 프레임 스킵
+- 축소한 흑백 프레임과 배경 모델(이동 평균)의 차이로 움직임 감지
+- 사람이 보이거나 움직임이 있으면 최소 간격으로 처리
+- 정적인 장면에서는 처리 간격을 최대 간격까지 점점 늘림
+"""
+
+import cv2
+import numpy as np
+
+
+class MotionGatedScheduler:
+    """
+    YOLO 실행 여부를 프레임마다 결정하는 적응형 스케줄러
+
+    should_process()로 처리 여부를 묻고, 처리한 프레임의 사람 수를
+    report()로 알려주면 다음 처리 간격이 조정됩니다.
+    """
+
+    def __init__(
+        self,
+        min_stride=1,
+        max_stride=30,
+        motion_threshold=0.002,
+        pixel_threshold=25,
+        background_rate=0.05,
+        downscale_width=160
+    ):
+        """
+        Args:
+            min_stride: 사람/움직임이 있을 때 처리 간격 (프레임)
+            max_stride: 정적인 장면에서의 최대 처리 간격 (프레임)
+            motion_threshold: 움직임으로 판단할 변화 픽셀 비율
+            pixel_threshold: 변화 픽셀로 판단할 밝기 차이 (0-255)
+            background_rate: 배경 모델 갱신 비율
+            downscale_width: 움직임 계산용 축소 폭 (픽셀)
+        """
+        self.min_stride = max(1, min_stride)
+        self.max_stride = max(self.min_stride, max_stride)
+        self.motion_threshold = motion_threshold
+        self.pixel_threshold = pixel_threshold
+        self.background_rate = background_rate
+        self.downscale_width = downscale_width
+        self.reset()
+
+    def reset(self):
+        """상태 초기화 (새 영상/구간 시작 시)"""
+        self._background = None
+        self._stride = self.min_stride
+        # 첫 프레임은 항상 처리 (기존 frame_skip 동작과 동일)
+        self._since_processed = self.min_stride - 1
+        self._persons_present = False
+        self.last_motion = 0.0
+        self.stats = {'frames': 0, 'processed': 0}
+
+    def _motion(self, frame):
+        """배경 모델 대비 변화 픽셀 비율"""
+        h, w = frame.shape[:2]
+        scale = self.downscale_width / float(w)
+        small = cv2.resize(frame, (self.downscale_width, max(1, int(h * scale))),
+                           interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        gray = cv2.GaussianBlur(gray, (5, 5), 0).astype(np.float32)
+
+        if self._background is None:
+            self._background = gray
+            return 1.0
+
+        diff = cv2.absdiff(gray, self._background)
+        cv2.accumulateWeighted(gray, self._background, self.background_rate)
+
+        return float(np.count_nonzero(diff > self.pixel_threshold)) / diff.size
+
+    def should_process(self, frame):
+        """이 프레임에서 YOLO를 실행할지 결정"""
+        self.stats['frames'] += 1
+        self._since_processed += 1
+        self.last_motion = self._motion(frame)
+
+        if self._persons_present or self.last_motion >= self.motion_threshold:
+            stride = self.min_stride
+        else:
+            stride = self._stride
+
+        if self._since_processed < stride:
+            return False
+
+        self._since_processed = 0
+        self.stats['processed'] += 1
+        return True
+
+    def report(self, num_persons):
+        """처리한 프레임의 사람 수로 다음 간격 조정"""
+        self._persons_present = num_persons > 0
+        if self._persons_present:
+            self._stride = self.min_stride
+        else:
+            self._stride = min(self.max_stride, self._stride * 2)
@@ -0,0 +1,195 @@
+"""
+경량 인물 추적기 (SORT 방식)
+- 칼만 필터 (등속 모델) + IoU 매칭
+- 트랙별 OSNet 임베딩/유사도 캐시: 새 트랙, 주기적 갱신, 외형 변화 시에만 재임베딩
+- 트랙별 유사도 시간 평활화 (EMA)
+"""
+
+import cv2
+import numpy as np
+
+
+def _bbox_to_z(bbox):
+    """(x1, y1, x2, y2) -> (cx, cy, 넓이, 종횡비)"""
+    x1, y1, x2, y2 = bbox
+    w = x2 - x1
+    h = y2 - y1
+    return np.array([x1 + w / 2.0, y1 + h / 2.0, w * h, w / float(h)], dtype=np.float64)
+
+
+def _x_to_bbox(x):
+    """칼만 상태 -> (x1, y1, x2, y2)"""
+    s = max(x[2], 1e-6)
+    r = max(x[3], 1e-6)
+    w = np.sqrt(s * r)
+    h = s / w
+    return np.array([x[0] - w / 2.0, x[1] - h / 2.0, x[0] + w / 2.0, x[1] + h / 2.0])
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """(N, 4) x (M, 4) IoU 행렬"""
+    a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float64).reshape(-1, 4)
+
+    xx1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    yy1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    xx2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    yy2 = np.minimum(a[:, None, 3], b[None, :, 3])
+
+    inter = np.maximum(0.0, xx2 - xx1) * np.maximum(0.0, yy2 - yy1)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def appearance_histogram(crop):
+    """외형 변화 감지용 HSV 색상 히스토그램 (작은 크기로 축소 후 계산)"""
+    small = cv2.resize(crop, (16, 32), interpolation=cv2.INTER_AREA)
+    hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+    hist = cv2.calcHist([hsv], [0, 1], None, [8, 4], [0, 180, 0, 256])
+    return cv2.normalize(hist, hist).flatten()
+
+
+class Track:
+    """칼만 필터 상태와 캐시된 임베딩/유사도를 가진 단일 트랙"""
+
+    # SORT 등속 모델: 상태 [cx, cy, s, r, vcx, vcy, vs], 관측 [cx, cy, s, r]
+    F = np.eye(7)
+    F[0, 4] = F[1, 5] = F[2, 6] = 1.0
+    H = np.eye(4, 7)
+
+    def __init__(self, track_id, bbox):
+        self.track_id = track_id
+
+        self.x = np.zeros(7)
+        self.x[:4] = _bbox_to_z(bbox)
+
+        self.P = np.diag([10.0, 10.0, 10.0, 10.0, 1e4, 1e4, 1e4])
+        self.Q = np.diag([1.0, 1.0, 1.0, 1.0, 0.01, 0.01, 1e-4])
+        self.R = np.diag([1.0, 1.0, 10.0, 10.0])
+
+        self.time_since_update = 0
+        self.hits = 1
+
+        # 임베딩 캐시
+        self.embedding = None
+        self.score = None
+        self.histogram = None
+        self.frames_since_embed = 0
+
+    def predict(self):
+        """다음 프레임 위치 예측"""
+        if self.x[2] + self.x[6] <= 0:
+            self.x[6] = 0.0
+        self.x = self.F @ self.x
+        self.P = self.F @ self.P @ self.F.T + self.Q
+        self.time_since_update += 1
+        self.frames_since_embed += 1
+        return _x_to_bbox(self.x)
+
+    def correct(self, bbox):
+        """관측으로 상태 보정"""
+        y = _bbox_to_z(bbox) - self.H @ self.x
+        S = self.H @ self.P @ self.H.T + self.R
+        K = self.P @ self.H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ y
+        self.P = (np.eye(7) - K @ self.H) @ self.P
+        self.time_since_update = 0
+        self.hits += 1
+
+    def update_appearance(self, embedding, score, histogram, smoothing):
+        """재임베딩 결과 반영 (유사도는 EMA로 평활화)"""
+        self.embedding = embedding
+        if self.score is None:
+            self.score = score
+        else:
+            self.score = smoothing * self.score + (1.0 - smoothing) * score
+        self.histogram = histogram
+        self.frames_since_embed = 0
+
+
+class PersonTracker:
+    """
+    SORT 방식 다중 인물 추적기
+
+    update()로 프레임의 박스를 트랙에 연결하고, needs_embedding()으로
+    재임베딩이 필요한 트랙만 골라 OSNet 호출을 줄입니다.
+    """
+
+    def __init__(
+        self,
+        iou_threshold=0.3,
+        max_age=30,
+        refresh_interval=30,
+        appearance_threshold=0.4,
+        score_smoothing=0.5
+    ):
+        """
+        Args:
+            iou_threshold: 박스-트랙 연결 최소 IoU
+            max_age: 관측 없이 유지할 최대 프레임 수
+            refresh_interval: 이 프레임 수마다 재임베딩
+            appearance_threshold: 색상 히스토그램 Bhattacharyya 거리 임계값 (초과 시 재임베딩)
+            score_smoothing: 유사도 EMA 계수 (0=평활화 없음)
+        """
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.refresh_interval = refresh_interval
+        self.appearance_threshold = appearance_threshold
+        self.score_smoothing = score_smoothing
+        self.reset()
+
+    def reset(self):
+        """모든 트랙과 통계 초기화 (새 영상/구간 시작 시)"""
+        self.tracks = []
+        self._next_id = 0
+        self.stats = {'detections': 0, 'embeddings': 0}
+
+    def update(self, bboxes):
+        """
+        박스를 기존 트랙에 연결 (연결되지 않은 박스는 새 트랙 생성)
+
+        Args:
+            bboxes: [(x1, y1, x2, y2), ...]
+
+        Returns:
+            bboxes와 같은 순서의 Track 리스트
+        """
+        predicted = np.array([track.predict() for track in self.tracks]).reshape(-1, 4)
+        assigned = [None] * len(bboxes)
+
+        if len(bboxes) and len(self.tracks):
+            ious = iou_matrix(bboxes, predicted)
+
+            # IoU가 큰 쌍부터 탐욕적으로 연결
+            used_tracks = set()
+            for flat_idx in np.argsort(-ious, axis=None):
+                det_idx, track_idx = np.unravel_index(flat_idx, ious.shape)
+                if ious[det_idx, track_idx] < self.iou_threshold:
+                    break
+                if assigned[det_idx] is not None or track_idx in used_tracks:
+                    continue
+                assigned[det_idx] = self.tracks[track_idx]
+                used_tracks.add(track_idx)
+
+        for det_idx, bbox in enumerate(bboxes):
+            if assigned[det_idx] is None:
+                track = Track(self._next_id, bbox)
+                self._next_id += 1
+                self.tracks.append(track)
+                assigned[det_idx] = track
+            else:
+                assigned[det_idx].correct(bbox)
+
+        self.tracks = [t for t in self.tracks if t.time_since_update <= self.max_age]
+        self.stats['detections'] += len(bboxes)
+
+        return assigned
+
+    def needs_embedding(self, track, histogram):
+        """새 트랙, 갱신 주기 도달, 큰 외형 변화 시 재임베딩 필요"""
+        if track.embedding is None or track.frames_since_embed >= self.refresh_interval:
+            return True
+        distance = cv2.compareHist(track.histogram, histogram, cv2.HISTCMP_BHATTACHARYYA)
+        return distance > self.appearance_threshold
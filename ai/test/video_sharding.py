@@ -0,0 +1,372 @@
+"""
+멀티 프로세스 영상 분할 처리
+- 키프레임 기준 구간 분할 (PyAV로 패킷만 읽어 키프레임 위치 확인)
+- 구간별 프로세스 처리 (워커마다 자체 ONNX 세션, 구간당 디코딩 1회로 추론+표시+인코딩)
+- 구간 결과 병합 (탐지 통계 + 영상 재다중화)
+
+process_video와의 차이:
+- 구간을 병렬로 처리하므로 화면 좌상단에 "Detections" 누적 값을 표시하지 않습니다
+  (결과 딕셔너리의 detection_count / case_hits / tracking은 전체 합계로 동일)
+- stage_utilization은 구간별 단계 처리 시간 합계를 (총 시간 x 워커 수)로 나눈 값입니다
+- 추적기/적응형 스킵 상태는 구간 시작 전 SHARD_WARMUP_FRAMES 프레임을 미리 추론해
+  이어 받지만, 직렬 처리와 프레임 단위로 완전히 같지는 않을 수 있습니다
+"""
+
+import cv2
+import numpy as np
+import os
+import shutil
+import tempfile
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+
+# 워커 프로세스마다 한 번 생성되는 탐지기
+_worker_detector = None
+_worker_watchlist = None
+
+# 추적/적응형 스킵 사용 시 구간 앞에서 미리 추론할 프레임 수 (결과는 버림)
+SHARD_WARMUP_FRAMES = 30
+
+
+def find_keyframes(video_path):
+    """
+    영상의 키프레임 프레임 번호(0부터) 목록
+
+    디코딩 없이 패킷 헤더만 읽습니다. PyAV가 없으면 빈 리스트를 반환합니다.
+    """
+    try:
+        import av
+    except ImportError:
+        print("⚠️  PyAV가 없어 키프레임 정렬 없이 구간을 나눕니다 (pip install av)")
+        return []
+
+    keyframes = []
+    with av.open(video_path) as container:
+        stream = container.streams.video[0]
+        fps = float(stream.average_rate or stream.guessed_rate or 30)
+        start_time = stream.start_time or 0
+
+        for packet in container.demux(stream):
+            if packet.is_keyframe and packet.pts is not None:
+                seconds = float((packet.pts - start_time) * stream.time_base)
+                keyframes.append(int(round(seconds * fps)))
+
+    return sorted(set(keyframes))
+
+
+def split_segments(total_frames, keyframes, num_segments):
+    """
+    영상을 num_segments개의 [start, end) 구간으로 분할
+
+    경계는 균등 분할 지점에서 가장 가까운 키프레임으로 맞춥니다.
+    마지막 구간의 end는 None (영상 끝까지)입니다.
+    """
+    targets = [total_frames * i // num_segments for i in range(1, num_segments)]
+
+    if keyframes:
+        keyframes = np.asarray(keyframes)
+        boundaries = [int(keyframes[np.argmin(np.abs(keyframes - t))]) for t in targets]
+    else:
+        boundaries = targets
+
+    boundaries = sorted(set(b for b in boundaries if 0 < b < total_frames))
+    starts = [0] + boundaries
+    ends = boundaries + [None]
+
+    return list(zip(starts, ends))
+
+
+def _init_worker(init_kwargs, reference_matrix, watchlist):
+    """워커 프로세스 초기화: 자체 ONNX 세션으로 탐지기 생성"""
+    global _worker_detector, _worker_watchlist
+    from missing_person_detector_onnx import MissingPersonDetectorONNX
+
+    _worker_detector = MissingPersonDetectorONNX(**init_kwargs)
+    if reference_matrix is not None:
+        _worker_detector._set_reference_embeddings(reference_matrix)
+    _worker_watchlist = watchlist
+
+
+def _open_segment(video_path, start):
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"영상을 열 수 없습니다: {video_path}")
+    if start > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    return cap
+
+
+def _process_segment(args):
+    """
+    구간 추론 + 표시 + 인코딩 (디코딩 1회)
+
+    Returns:
+        (프레임 수, 처리 프레임 수, 구간 탐지 횟수, 사건별 탐지,
+         단계별 처리 시간, 추적 통계 또는 None)
+    """
+    video_path, start, end, total_frames, fps, frame_size, segment_path = args
+    detector = _worker_detector
+
+    # 구간마다 추적/스킵 상태를 새로 시작하고, 상태가 있으면 앞 프레임으로 예열
+    warmup_start = start
+    if detector.tracker is not None:
+        detector.tracker.reset()
+        warmup_start = max(0, start - SHARD_WARMUP_FRAMES)
+    if detector.frame_scheduler is not None:
+        detector.frame_scheduler.reset()
+        warmup_start = max(0, start - SHARD_WARMUP_FRAMES)
+
+    cap = _open_segment(video_path, warmup_start)
+    frame_idx = warmup_start
+    while frame_idx < start:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        detector._infer_frame(frame, frame_idx + 1, frame_size, _worker_watchlist)
+        frame_idx += 1
+
+    # 예열 구간은 통계에서 제외
+    warmup_stats = dict(detector.tracker.stats) if detector.tracker is not None else None
+
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+    writer = cv2.VideoWriter(segment_path, fourcc, fps, frame_size)
+
+    frame_count = 0
+    processed_count = 0
+    detection_count = 0
+    case_hits = {}
+    busy_time = {'decode': 0.0, 'inference': 0.0, 'encode': 0.0}
+
+    while end is None or frame_idx < end:
+        stage_start = time.time()
+        ret, frame = cap.read()
+        busy_time['decode'] += time.time() - stage_start
+        if not ret:
+            break
+
+        stage_start = time.time()
+        frame, matches = detector._infer_frame(frame, frame_idx + 1, frame_size, _worker_watchlist)
+        busy_time['inference'] += time.time() - stage_start
+
+        stage_start = time.time()
+        detection_count = detector._annotate_frame(
+            frame, frame_idx + 1, total_frames, matches, detection_count,
+            fps, _worker_watchlist, case_hits, show_count=False
+        )
+        writer.write(frame)
+        busy_time['encode'] += time.time() - stage_start
+
+        frame_count += 1
+        processed_count += matches is not None
+        frame_idx += 1
+
+    cap.release()
+    writer.release()
+
+    tracking = None
+    if warmup_stats is not None:
+        tracking = {key: value - warmup_stats[key] for key, value in detector.tracker.stats.items()}
+
+    return frame_count, processed_count, detection_count, case_hits, busy_time, tracking
+
+
+def concat_segments(segment_paths, output_path):
+    """
+    구간 영상을 재인코딩 없이 하나로 합침 (PyAV 재다중화)
+
+    PyAV가 없으면 OpenCV로 다시 읽어 인코딩합니다.
+    """
+    try:
+        import av
+    except ImportError:
+        av = None
+
+    if av is None:
+        writer = None
+        for path in segment_paths:
+            cap = cv2.VideoCapture(path)
+            if writer is None:
+                fps = cap.get(cv2.CAP_PROP_FPS)
+                size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+                writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                writer.write(frame)
+            cap.release()
+        if writer is not None:
+            writer.release()
+        return
+
+    with av.open(output_path, 'w') as output:
+        out_stream = None
+        next_ts = 0
+
+        for path in segment_paths:
+            with av.open(path) as segment:
+                in_stream = segment.streams.video[0]
+                if out_stream is None:
+                    if hasattr(output, 'add_stream_from_template'):
+                        out_stream = output.add_stream_from_template(in_stream)
+                    else:
+                        out_stream = output.add_stream(template=in_stream)
+
+                base = None
+                segment_end = next_ts
+                for packet in segment.demux(in_stream):
+                    if packet.dts is None:
+                        continue
+                    if base is None:
+                        base = packet.dts
+
+                    # 구간마다 타임스탬프를 이어 붙임
+                    shift = next_ts - base
+                    packet.dts += shift
+                    if packet.pts is not None:
+                        packet.pts += shift
+                    segment_end = max(segment_end, (packet.pts or packet.dts) + (packet.duration or 0))
+
+                    packet.stream = out_stream
+                    output.mux(packet)
+
+                next_ts = segment_end
+
+
+def process_video_sharded(detector, video_path, output_path, num_workers=None,
+                          progress_callback=None, watchlist=None):
+    """
+    MissingPersonDetectorONNX.process_video_sharded 구현
+
+    Returns:
+        process_video와 같은 형식의 결과 딕셔너리 (+ 'segments')
+        (화면 누적 표시, 단계별 사용률, 추적/스킵 상태 차이는 모듈 설명 참고)
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"영상을 열 수 없습니다: {video_path}")
+
+    # 영상 정보
+    fps = int(cap.get(cv2.CAP_PROP_FPS))
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+
+    # 해상도 조정
+    if detector.resize_factor != 1.0:
+        width = int(width * detector.resize_factor)
+        height = int(height * detector.resize_factor)
+    frame_size = (width, height)
+
+    num_workers = num_workers or os.cpu_count() or 1
+    segments = split_segments(total_frames, find_keyframes(video_path), num_workers)
+
+    # 워커 간 CPU 코어 분배 (ONNX Runtime 과다 스레드 방지)
+    init_kwargs = dict(detector._init_kwargs)
+    if not init_kwargs.get('num_threads'):
+        init_kwargs['num_threads'] = max(1, (os.cpu_count() or 1) // num_workers)
+
+    num_processes = min(num_workers, len(segments))
+    start_time = time.time()
+
+    print("\n분할 영상 처리 시작...")
+    print(f"  해상도: {width}x{height}")
+    print(f"  총 프레임: {total_frames}")
+    print(f"  구간 수: {len(segments)} (워커 {num_workers}개)\n")
+
+    temp_dir = tempfile.mkdtemp(prefix='mpd_segments_')
+    try:
+        with ProcessPoolExecutor(
+            max_workers=num_processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(init_kwargs, detector.reference_matrix, watchlist)
+        ) as pool:
+            # 구간별 추론 + 표시/인코딩
+            segment_paths = [os.path.join(temp_dir, f"segment_{i:04d}.mp4") for i in range(len(segments))]
+            futures = [
+                pool.submit(_process_segment, (
+                    video_path, start, end, total_frames, fps, frame_size, path
+                ))
+                for (start, end), path in zip(segments, segment_paths)
+            ]
+            segment_results = []
+            done_frames = 0
+            done_processed = 0
+            done_detections = 0
+            for i, future in enumerate(futures):
+                segment_results.append(future.result())
+                done_frames += segment_results[-1][0]
+                done_processed += segment_results[-1][1]
+                done_detections += segment_results[-1][2]
+
+                print(f"구간 처리 완료 {i + 1}/{len(segments)}")
+                if progress_callback:
+                    elapsed = time.time() - start_time
+                    fps_current = done_processed / elapsed if elapsed > 0 else 0
+                    progress_callback(
+                        done_frames / total_frames if total_frames else 1.0,
+                        done_frames, total_frames, fps_current, done_detections
+                    )
+
+        # 영상 및 통계 병합
+        concat_segments(segment_paths, output_path)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    frame_count = sum(result[0] for result in segment_results)
+    processed_count = sum(result[1] for result in segment_results)
+    detection_count = sum(result[2] for result in segment_results)
+
+    case_hits = {}
+    busy_time = {'decode': 0.0, 'inference': 0.0, 'encode': 0.0}
+    tracking = None
+    for _, _, _, segment_hits, segment_busy, segment_tracking in segment_results:
+        for case_id, hits in segment_hits.items():
+            case_hits.setdefault(case_id, []).extend(hits)
+        for stage, busy in segment_busy.items():
+            busy_time[stage] += busy
+        if segment_tracking is not None:
+            tracking = tracking or dict.fromkeys(segment_tracking, 0)
+            for key, value in segment_tracking.items():
+                tracking[key] += value
+
+    elapsed_time = time.time() - start_time
+    actual_fps = processed_count / elapsed_time if elapsed_time > 0 else 0
+    stage_utilization = {
+        stage: (busy / (elapsed_time * num_processes) if elapsed_time > 0 else 0.0)
+        for stage, busy in busy_time.items()
+    }
+
+    print("\n처리 완료!")
+    print(f"  총 프레임: {frame_count}")
+    print(f"  처리된 프레임: {processed_count}")
+    print(f"  총 시간: {elapsed_time:.2f}초")
+    print(f"  실제 처리 FPS: {actual_fps:.2f}")
+    print(f"  탐지 횟수: {detection_count}")
+    print("  단계별 사용률: " + ", ".join(
+        f"{stage} {util * 100:.0f}%" for stage, util in stage_utilization.items()
+    ))
+
+    results = {
+        'total_frames': frame_count,
+        'processed_frames': processed_count,
+        'detection_count': detection_count,
+        'elapsed_time': elapsed_time,
+        'avg_fps': actual_fps,
+        'stage_utilization': stage_utilization,
+        'segments': len(segments)
+    }
+
+    if tracking is not None:
+        results['tracking'] = tracking
+        print(f"  OSNet 임베딩: {tracking['embeddings']}/{tracking['detections']}명")
+
+    if watchlist is not None:
+        print(f"  발견된 사건: {len(case_hits)}/{len(watchlist)}")
+        results['case_hits'] = case_hits
+
+    return results